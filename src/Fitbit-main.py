@@ -1,82 +1,134 @@
 import os
+import argparse
 
 from csv_data_wrangling import load_and_preview_data, clean_and_transform_data, summarize_data
 from visualization import plot_distance_distribution, plot_grouped_data, plot_statistical_summary, plot_weekend_vs_weekday, plot_workout, plot_LRM, calories_burned_per_day, plot_activity_by_time_blocks
-from analysis import activity_vs_sleep_insights, aggregate_data, analyze_weight_log, check_activity_days, classify_user, distance_days_correlation, linear_regression, get_unique_users, merge_and_analyze_data, unique_users_totaldistance, analyze_sleep_vs_activity, analyze_sleep_vs_sedentary, calculate_time_block_averages, get_activity_by_time_blocks, get_heart_rate_and_intensity
-from database import connect_db, compute_sleep_duration, verify_total_steps, discover_weather_impact
+from analysis import activity_vs_sleep_insights, aggregate_data, analyze_weight_log, check_activity_days, classify_user, distance_days_correlation, linear_regression, get_unique_users, unique_users_totaldistance, analyze_sleep_vs_activity, analyze_sleep_vs_sedentary, calculate_time_block_averages, get_activity_by_time_blocks, time_block_breakdown, get_heart_rate_and_intensity
+from snapshot import load_or_build_merged_data
+from figure_export import headless_export, EXPORT_DIR, EXPORT_FORMATS
+from pipeline import stage, ref, run_pipeline
+from profiling import enable_profiling, profiling_enabled, enable_memory_profiling, memory_profiling_enabled, profile_report, memory_report, write_profile
+from database import connect_db, migrate_db, compute_sleep_duration, verify_total_steps, discover_weather_impact
 
 FOLDER_DATA = os.path.dirname(os.path.dirname(__file__))
 DATA_FILE = os.path.join(FOLDER_DATA, "data", "daily_activity.csv")
 DB_NAME = os.path.join(FOLDER_DATA, "data", "fitbit_database.db")
 CHICAGO_WEATHER = os.path.join(FOLDER_DATA, "data", "Chicago_Weather.csv")
 
-def main():
-    
-    original_data = load_and_preview_data(DATA_FILE) 
-    cleaned_data = clean_and_transform_data(original_data)
-    summarize_data(cleaned_data)
+def first_user_id(df):
+    return df['Id'].iloc[0]
 
-    unique_users = get_unique_users(cleaned_data)
-    unique_user_distance = unique_users_totaldistance(cleaned_data)
-    
-    # Visualization
-    plot_distance_distribution(unique_user_distance)
-    plot_workout(cleaned_data)
-    
-    # Creative Analysis
-    user_activity_days, top_5_users = check_activity_days(cleaned_data)
-    merge_df_distance_days = distance_days_correlation(unique_user_distance, user_activity_days)
+def report(value):
+    print(value)
 
-    # Linear regression model
-    model = linear_regression(cleaned_data)
+def report_model(model):
     print(model.summary())
 
-    # Calories burned per day (example user)
-    user_id_test = cleaned_data['Id'].iloc[0]  
-    calories_burned_per_day(cleaned_data, user_id=user_id_test, start_date="2016-03-01", end_date="2016-03-30")
-
-    # Regression plot for a user
-    plot_LRM(cleaned_data, user_id=user_id_test)
-
-    # Classify users based on activity
-    user_classes = classify_user(cleaned_data)
-    print(user_classes)
-
-    # Database verification
-    connection = connect_db(DB_NAME)
-    
-    if connection:
+# The analysis as a stage graph (see pipeline.py): the CSV branch and the database branch share
+# no inputs and run side by side, and every stage is reloaded from data/pipeline_cache/ while its
+# function and inputs are unchanged.
+PIPELINE = {
+    # CSV branch
+    "original_data": stage(load_and_preview_data, ref("data_file")),
+    "cleaned_data": stage(clean_and_transform_data, ref("original_data")),
+    "summary": stage(summarize_data, ref("cleaned_data")),
+    "unique_users": stage(get_unique_users, ref("cleaned_data")),
+    "unique_user_distance": stage(unique_users_totaldistance, ref("cleaned_data")),
 
-        verify_total_steps(cleaned_data, connection)
-        df_sleep_duration = compute_sleep_duration(connection)
-        print(df_sleep_duration)
-
-        analyze_sleep_vs_activity(connection)
-        analyze_sleep_vs_sedentary(connection)
-
-        hourly_steps, hourly_calories, minute_sleep = get_activity_by_time_blocks(connection)
-        avg_steps, avg_calories, avg_sleep, labels = calculate_time_block_averages(hourly_steps, hourly_calories, minute_sleep)
-        plot_activity_by_time_blocks(avg_steps, avg_calories, avg_sleep, labels)
+    # Visualization
+    "distance_distribution": stage(plot_distance_distribution, ref("unique_user_distance"), plots=True),
+    "workout": stage(plot_workout, ref("cleaned_data"), plots=True),
 
-        get_heart_rate_and_intensity(connection, user_id='1503960366')
-        discover_weather_impact(connection, CHICAGO_WEATHER)
-        
-        # Aggregate data
-        merged_df, user_summaries = merge_and_analyze_data(connection)
-        
-        df_aggregated = aggregate_data(merged_df)
+    # Creative Analysis
+    "activity_days": stage(check_activity_days, ref("cleaned_data"), plots=True),
+    "distance_days": stage(distance_days_correlation, ref("unique_user_distance"), ref("activity_days", 0), plots=True),
 
-        activity_vs_sleep_insights(df_aggregated)
+    # Linear regression model
+    "model": stage(linear_regression, ref("cleaned_data")),
+    "model_summary": stage(report_model, ref("model")),
 
-        print("Analyzing weight log...")
-        analyze_weight_log(connection)
+    # Calories burned per day and regression plot (example user)
+    "example_user": stage(first_user_id, ref("cleaned_data")),
+    "calories_per_day": stage(calories_burned_per_day, ref("cleaned_data"), user_id=ref("example_user"),
+                              start_date="2016-03-01", end_date="2016-03-30", plots=True),
+    "user_regression": stage(plot_LRM, ref("cleaned_data"), user_id=ref("example_user"), plots=True),
 
-        # Visualizations
-        plot_grouped_data(df_aggregated)
-        plot_statistical_summary(user_summaries)
-        plot_weekend_vs_weekday(df_aggregated)
+    # Classify users based on activity
+    "user_classes": stage(classify_user, ref("cleaned_data")),
+    "user_classes_report": stage(report, ref("user_classes")),
+
+    # Database branch
+    "total_steps_check": stage(verify_total_steps, ref("cleaned_data"), connection=True),
+    "sleep_duration": stage(compute_sleep_duration, connection=True),
+    "sleep_duration_report": stage(report, ref("sleep_duration")),
+
+    "sleep_vs_activity": stage(analyze_sleep_vs_activity, connection=True, plots=True),
+    "sleep_vs_sedentary": stage(analyze_sleep_vs_sedentary, connection=True, plots=True),
+
+    "time_blocks": stage(get_activity_by_time_blocks, connection=True),
+    "time_block_averages": stage(calculate_time_block_averages, ref("time_blocks", 0), ref("time_blocks", 1), ref("time_blocks", 2)),
+    "time_block_plot": stage(plot_activity_by_time_blocks, ref("time_block_averages", 0), ref("time_block_averages", 1),
+                             ref("time_block_averages", 2), ref("time_block_averages", 3), plots=True),
+    "time_blocks_by_weekday": stage(time_block_breakdown, by=('Weekday',), connection=True),
+    "time_blocks_by_weekday_report": stage(report, ref("time_blocks_by_weekday")),
+
+    "heart_rate_and_intensity": stage(get_heart_rate_and_intensity, user_id='1503960366', connection=True),
+    "weather_impact": stage(discover_weather_impact, CHICAGO_WEATHER=ref("weather_file"), connection=True, plots=True),
+
+    # Aggregate data (read back from the on-disk snapshot while the database is unchanged)
+    "merged": stage(load_or_build_merged_data, ref("db"), connection=True),
+    "aggregated": stage(aggregate_data, ref("merged", 0)),
+    "activity_vs_sleep": stage(activity_vs_sleep_insights, ref("aggregated")),
+
+    "weight_log": stage(analyze_weight_log, connection=True, plots=True),
+
+    # Visualizations
+    "grouped_plot": stage(plot_grouped_data, ref("aggregated"), plots=True),
+    "statistical_summary_plot": stage(plot_statistical_summary, ref("merged", 1), plots=True),
+    "weekend_vs_weekday_plot": stage(plot_weekend_vs_weekday, ref("aggregated"), plots=True),
+}
+
+def main(workers=4, use_cache=True):
+    # Database verification (migrations write to the database, so they run before the graph)
+    migrate_db(DB_NAME)
+    connection = connect_db(DB_NAME)
+    if not connection:
+        return
+    connection.close()
 
-        connection.close()
+    sources = {"data_file": DATA_FILE, "db": DB_NAME, "weather_file": CHICAGO_WEATHER}
+    run_pipeline(PIPELINE, sources, workers=workers, use_cache=use_cache)
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Fitbit data analysis pipeline")
+    parser.add_argument("--headless", action="store_true", help="save every figure to files instead of opening windows")
+    parser.add_argument("--output-dir", default=EXPORT_DIR, help="directory for the exported figures and manifest.json")
+    parser.add_argument("--formats", nargs="+", default=list(EXPORT_FORMATS), choices=["png", "svg", "pdf"], help="file formats to export")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: one per CPU)")
+    parser.add_argument("--stage-workers", type=int, default=4, help="pipeline stages run concurrently")
+    parser.add_argument("--no-cache", action="store_true", help="rerun every stage instead of reusing data/pipeline_cache/")
+    parser.add_argument("--profile", action="store_true", help="time every stage and SQL query; writes data/profiles/")
+    parser.add_argument("--profile-memory", action="store_true", help="also trace memory (tracemalloc, RSS) per stage; runs one stage at a time")
+    args = parser.parse_args()
+
+    if args.profile:
+        enable_profiling()
+    if args.profile_memory:
+        enable_memory_profiling()
+    if memory_profiling_enabled():
+        # tracemalloc and RSS are process-wide: concurrent stages would be charged for each other
+        args.stage_workers = 1
+
+    if args.headless:
+        with headless_export(args.output_dir, args.formats, args.workers):
+            main(args.stage_workers, not args.no_cache)
+    else:
+        main(args.stage_workers, not args.no_cache)
+
+    if profiling_enabled():
+        print(profile_report())
+        if memory_profiling_enabled():
+            print()
+            print(memory_report())
+        report_path, stacks_path = write_profile()
+        print(f"Profile written to {report_path} and {stacks_path} (flamegraph.pl {os.path.basename(stacks_path)} > profile.svg)")
@@ -1,18 +1,23 @@
+import json
 import traceback
 import numpy as np
-from visualization import plot_sleep_vs_activity, plot_sleep_vs_sedentary, plot_residuals
+from visualization import plot_sleep_vs_activity, plot_sleep_vs_sedentary, plot_residuals, drop_unused_categories
 import statsmodels.formula.api as smf
 from scipy.stats import shapiro
 import seaborn as sns
 import pandas as pd
 import matplotlib.cm as cm
 import matplotlib.pyplot as plt
+from schema import apply_schema, register_ids_from_db
+from profiling import profiled
 
+@profiled
 def get_unique_users(df):
     unique_users = df.groupby('Id')['TotalDistance'].sum().reset_index()
     print(f"\nTotal number of unique users in dataset: {unique_users.shape[0]}")
     return unique_users
 
+@profiled
 def unique_users_totaldistance(df):
     unique_users_total_distance = df.groupby('Id')['TotalDistance'].sum().reset_index()
 
@@ -23,16 +28,19 @@ def unique_users_totaldistance(df):
     print(unique_users_total_distance)
     return unique_users_total_distance
 
+@profiled
 def classify_user(df):
-    user_counts = df.groupby('Id')['VeryActiveMinutes'].mean()
+    user_counts = df.groupby('Id', observed=True)['VeryActiveMinutes'].mean()
     categories = pd.cut(user_counts, bins=[0, 10, 15, float('inf')], labels=['Light', 'Moderate', 'Heavy'])
     return pd.DataFrame({'Class': categories})
 
+@profiled
 def linear_regression(df):
     df['Id'] = df['Id'].astype(str)
     model = smf.ols('Calories ~ TotalSteps + C(Id)', data=df).fit()
     return model
 
+@profiled
 def check_activity_days(df):
     user_activity_days = df.groupby('Id')['ActivityDate'].nunique().reset_index()
     user_activity_days.insert(0, 'Index', range(1, len(user_activity_days) + 1))
@@ -44,7 +52,7 @@ def check_activity_days(df):
     
     bars = plt.bar(user_activity_days['User Index'], user_activity_days['Activity Days'], color='skyblue', edgecolor='black')
 
-    cmap = cm.get_cmap("YlOrRd")  
+    cmap = plt.get_cmap("YlOrRd")  
     max_days = max(user_activity_days['Activity Days'])
     for bar, days in zip(bars, user_activity_days['Activity Days']):
         bar.set_facecolor(cmap(days / max_days))  # Normalize activity days for colormap
@@ -62,6 +70,7 @@ def check_activity_days(df):
 
     return user_activity_days, top_5_users
 
+@profiled
 def distance_days_correlation(unique_user_distance, user_activity_days):
     merged_df = pd.merge(unique_user_distance, user_activity_days, on='User ID')
 
@@ -87,18 +96,70 @@ def distance_days_correlation(unique_user_distance, user_activity_days):
 
     return merged_df
 
-def SQL_acquisition(connection, query):
+def _bind(params):
+    # sqlite3 cannot bind numpy scalars (e.g. an Id taken from a DataFrame), so unwrap them first
+    return tuple(p.item() if isinstance(p, np.generic) else p for p in params)
+
+@profiled
+def SQL_acquisition(connection, query, params=()):
+    # Values are passed as bound "?" parameters instead of being formatted into the SQL text.
+    # The query text then stays constant, so sqlite3 reuses the compiled statement from the
+    # per-connection statement cache instead of parsing and planning it again on every call.
     try:
          with connection:
             cursor = connection.cursor()
-            cursor.execute(query)
+            cursor.execute(query, _bind(params))
             rows = cursor.fetchall()
             df = pd.DataFrame(rows, columns=[x[0] for x in cursor.description])
-            return df
+            # compact dtypes from the schema registry (categorical Id, int16/int32 counters)
+            return apply_schema(df)
     except Exception as e:
         print(f"An error occurred while executing the SQL query: {e}")
         return pd.DataFrame()
+
+@profiled
+def SQL_acquisition_bulk(connection, query, user_ids, params=()):
+    # Bulk form for a list of users: the query filters with "Id IN (SELECT value FROM json_each(?))"
+    # and that first "?" receives all Ids as one JSON array, so one cached statement serves any list.
+    ids_json = json.dumps([int(user_id) for user_id in user_ids])
+    return SQL_acquisition(connection, query, (ids_json, *params))
+
+@profiled
+def SQL_acquisition_chunks(connection, query, params=(), chunk_size=100_000):
+    # Streaming variant of SQL_acquisition for large tables (heart_rate, minute_sleep): rows are
+    # pulled with fetchmany and yielded as DataFrames of at most chunk_size rows, so only one chunk
+    # of Python tuples is alive at a time
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query, _bind(params))
+        columns = [x[0] for x in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield apply_schema(pd.DataFrame.from_records(rows, columns=columns))
+        cursor.close()
+    except Exception as e:
+        print(f"An error occurred while streaming the SQL query: {e}")
+
+def _chunk_columns(chunks, columns):
+    # concatenates the given columns of every chunk into one numpy array each; the chunks
+    # themselves are dropped as soon as their columns are copied out
+    parts = {column: [] for column in columns}
+    for chunk in chunks:
+        for column in columns:
+            parts[column].append(chunk[column].to_numpy(dtype='int64' if column in ('Id', 'EpochSeconds') else None))
+    return {column: np.concatenate(arrays) if arrays else np.empty(0, dtype='int64') for column, arrays in parts.items()}
+
+# Timestamps are read from the integer EpochSeconds/DayNumber columns added by the database migration,
+# so turning them into datetimes is an integer conversion instead of string parsing
+def epoch_to_datetime(epoch_seconds):
+    return pd.to_datetime(epoch_seconds, unit="s")
+
+def day_to_datetime(day_number):
+    return pd.to_datetime(day_number, unit="D")
     
+@profiled
 def analyze_sleep_vs_activity(connection):
     try:
         query_sleep = """
@@ -121,9 +182,6 @@ def analyze_sleep_vs_activity(connection):
         """
         df_activity = SQL_acquisition(connection, query_activity)
 
-        df_sleep["Id"] = df_sleep["Id"].astype(str)
-        df_activity["Id"] = df_activity["Id"].astype(str)
-
         df_merged = df_activity.merge(df_sleep, on=["Id"], how="inner")
 
         if df_merged.empty:
@@ -140,6 +198,7 @@ def analyze_sleep_vs_activity(connection):
     return df_merged, model
 
 # TASK 4: SLEEP VS. SEDENTARY MINUTES
+@profiled
 def analyze_sleep_vs_sedentary(connection):
     try:
         query_sleep = """
@@ -160,9 +219,6 @@ def analyze_sleep_vs_sedentary(connection):
         """
         df_sedentary = SQL_acquisition(connection, query_sedentary)
 
-        df_sleep["Id"] = df_sleep["Id"].astype(str)
-        df_sedentary["Id"] = df_sedentary["Id"].astype(str)
-
         df_merged = df_sedentary.merge(df_sleep, on=["Id"], how="inner")
 
         if df_merged.empty:
@@ -190,73 +246,198 @@ def analyze_sleep_vs_sedentary(connection):
         print(f"⚠️ An error occurred: {e}")
         return None
 
-def calculate_time_block_averages(hourly_steps_df, hourly_calories_df, minute_sleep_df):
-    time_blocks = [(0, 4), (4, 8), (8, 12), (12, 16), (16, 20), (20, 24)]
-
-    def calculate_avg(df, column):
-        return [df[(df['hour'] >= start) & (df['hour'] < end)][column].mean() for start, end in time_blocks]
-
-    avg_steps = calculate_avg(hourly_steps_df, 'StepTotal')
-    avg_calories = calculate_avg(hourly_calories_df, 'Calories')
-    avg_sleep = [minute_sleep_df[(minute_sleep_df['hour'] >= start) & (minute_sleep_df['hour'] < end)]['value'].sum() / 60
-                 for start, end in time_blocks]
-
-    labels = [f"{start}-{end}" for start, end in time_blocks]
-    return avg_steps, avg_calories, avg_sleep, labels
-
-def get_activity_by_time_blocks(connection):
-    hourly_steps_query = "SELECT * FROM hourly_steps;"
-    hourly_calories_query = "SELECT * FROM hourly_calories;"
-    minute_sleep_query = "SELECT * FROM minute_sleep;"
-
-    hourly_steps_df = SQL_acquisition(connection, hourly_steps_query)
-    hourly_calories_df = SQL_acquisition(connection, hourly_calories_query)
-    minute_sleep_df = SQL_acquisition(connection, minute_sleep_query)
-
-    hourly_steps_df['ActivityHour'] = pd.to_datetime(hourly_steps_df['ActivityHour'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-    hourly_calories_df['ActivityHour'] = pd.to_datetime(hourly_calories_df['ActivityHour'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-    minute_sleep_df['date'] = pd.to_datetime(minute_sleep_df['date'], errors='coerce')
-    
-    hourly_steps_df['hour'] = hourly_steps_df['ActivityHour'].dt.hour
-    hourly_calories_df['hour'] = hourly_calories_df['ActivityHour'].dt.hour
-    minute_sleep_df['hour'] = minute_sleep_df['date'].dt.hour
-
-    return hourly_steps_df, hourly_calories_df, minute_sleep_df
+# Time blocks: every row is bucketed by (EpochSeconds % 86400) / block length inside SQLite, so each
+# table is reduced to one row per block (per user / weekday when broken down) by a single GROUP BY.
+TIME_BLOCK_SOURCES = {
+    'steps': ('hourly_steps', 'StepTotal'),
+    'calories': ('hourly_calories', 'Calories'),
+    'sleep': ('minute_sleep', 'value'),
+}
+
+# breakdown name -> SQL expression; Weekday follows strftime('%w'), 0 = Sunday (day 0 was a Thursday)
+TIME_BLOCK_BREAKDOWNS = {
+    'Id': 'Id',
+    'Weekday': '(DayNumber + 4) % 7',
+}
+
+WEEKDAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+def time_block_labels(block_hours=4):
+    return [f"{start}-{min(start + block_hours, 24)}" for start in range(0, 24, block_hours)]
+
+@profiled
+def get_activity_by_time_blocks(connection, block_hours=4, by=()):
+    # returns one frame per source with columns [*by, block, total, count]
+    if not 1 <= block_hours <= 24:
+        raise ValueError(f"block_hours must be between 1 and 24, got {block_hours}")
+    keys = [f"{TIME_BLOCK_BREAKDOWNS[name]} AS {name}" for name in by] + ["(EpochSeconds % 86400) / ? AS block"]
+    group_by = ", ".join([*by, "block"])
+
+    frames = []
+    for table, column in TIME_BLOCK_SOURCES.values():
+        query = f"""
+            SELECT {", ".join(keys)}, SUM({column}) AS total, COUNT({column}) AS count
+            FROM {table}
+            WHERE EpochSeconds IS NOT NULL
+            GROUP BY {group_by}
+        """
+        frames.append(SQL_acquisition(connection, query, (block_hours * 3600,)))
+    return tuple(frames)
+
+def _block_means(df, by, blocks):
+    # mean per block = summed totals / summed counts; blocks without rows stay in the index as NaN
+    totals = df.groupby([*by, 'block'], observed=True)[['total', 'count']].sum()
+    if by:
+        return totals
+    return totals.reindex(blocks)
+
+@profiled
+def calculate_time_block_averages(hourly_steps_df, hourly_calories_df, minute_sleep_df, block_hours=4):
+    # the inputs are the per-block sums and counts from get_activity_by_time_blocks (without breakdown)
+    blocks = range(len(time_block_labels(block_hours)))
+    steps = _block_means(hourly_steps_df, [], blocks)
+    calories = _block_means(hourly_calories_df, [], blocks)
+    sleep = _block_means(minute_sleep_df, [], blocks)
+
+    avg_steps = (steps['total'] / steps['count']).tolist()
+    avg_calories = (calories['total'] / calories['count']).tolist()
+    avg_sleep = (sleep['total'].fillna(0) / 60).tolist()
+
+    return avg_steps, avg_calories, avg_sleep, time_block_labels(block_hours)
+
+@profiled
+def time_block_breakdown(connection, block_hours=4, by=('Id',)):
+    # the same averages as calculate_time_block_averages, as one tidy frame per user and/or weekday
+    by = list(by)
+    hourly_steps_df, hourly_calories_df, minute_sleep_df = get_activity_by_time_blocks(connection, block_hours, by)
+    blocks = range(len(time_block_labels(block_hours)))
+
+    steps = _block_means(hourly_steps_df, by, blocks)
+    calories = _block_means(hourly_calories_df, by, blocks)
+    sleep = _block_means(minute_sleep_df, by, blocks)
+
+    breakdown = pd.DataFrame({
+        'AvgSteps': steps['total'] / steps['count'],
+        'AvgCalories': calories['total'] / calories['count'],
+    }).join((sleep['total'] / 60).rename('SleepHours'), how='outer').reset_index()
+    breakdown['SleepHours'] = breakdown['SleepHours'].fillna(0)
+    breakdown.insert(len(by) + 1, 'TimeBlock', np.array(time_block_labels(block_hours))[breakdown['block'].astype(int)])
+
+    if 'Weekday' in by:
+        breakdown['Weekday'] = pd.Categorical.from_codes(breakdown['Weekday'].astype(int), WEEKDAY_NAMES)
+    return breakdown
 
 # TASK 6: HEART RATE & INTENSITY
+# Batch form: one query per table for any number of users. Rows come back ordered by (Id, EpochSeconds)
+# straight from the (Id, EpochSeconds, ...) indexes, so every user's samples form one contiguous run of
+# the column arrays; 'offsets' maps each Id to its (start, stop) run. Timestamps are stored once in the
+# shared 'time_index' (heart_rate repeats the same timestamps for every user) and the per-row 'time'
+# arrays hold positions into it.
+HEART_RATE_INTENSITY_SOURCES = {
+    'heart_rate': ('heart_rate', ['Value']),
+    'intensity': ('hourly_intensity', ['TotalIntensity', 'AverageIntensity']),
+}
+
+def _user_offsets(ids):
+    if len(ids) == 0:
+        return {}
+    starts = np.r_[0, np.flatnonzero(np.diff(ids)) + 1]
+    stops = np.r_[starts[1:], len(ids)]
+    return dict(zip(ids[starts].tolist(), zip(starts.tolist(), stops.tolist())))
+
+@profiled
+def get_heart_rate_and_intensity_batch(connection, user_ids=None, chunk_size=100_000):
+    # user_ids=None loads every user with one scan per table. The rows are streamed in chunks
+    # straight into the column arrays, so the whole table never exists as tuples or a DataFrame
+    columns_by_source = {}
+    for name, (table, columns) in HEART_RATE_INTENSITY_SOURCES.items():
+        select = f"SELECT Id, EpochSeconds, {', '.join(columns)} FROM {table}"
+        if user_ids is None:
+            query = f"{select} WHERE EpochSeconds IS NOT NULL ORDER BY Id, EpochSeconds"
+            params = ()
+        else:
+            query = f"{select} WHERE Id IN (SELECT value FROM json_each(?)) AND EpochSeconds IS NOT NULL ORDER BY Id, EpochSeconds"
+            params = (json.dumps([int(user_id) for user_id in user_ids]),)
+        chunks = SQL_acquisition_chunks(connection, query, params, chunk_size=chunk_size)
+        columns_by_source[name] = _chunk_columns(chunks, ['Id', 'EpochSeconds', *columns])
+
+    epochs = [columns_by_source[name]['EpochSeconds'] for name in HEART_RATE_INTENSITY_SOURCES]
+    time_index, positions = np.unique(np.concatenate(epochs), return_inverse=True)
+    positions = np.split(positions.astype('int32'), np.cumsum([len(e) for e in epochs])[:-1])
+
+    batch = {'time_index': epoch_to_datetime(time_index)}
+    for (name, (_, columns)), time in zip(HEART_RATE_INTENSITY_SOURCES.items(), positions):
+        source = columns_by_source[name]
+        batch[name] = {
+            'offsets': _user_offsets(source['Id']),
+            'time': time,
+            **{column: source[column] for column in columns},
+        }
+    return batch
+
+@profiled
+def heart_rate_and_intensity_from_batch(batch, user_id):
+    # O(rows of the user): slices the user's run out of the contiguous arrays
+    def user_frame(name, time_column):
+        start, stop = batch[name]['offsets'].get(int(user_id), (0, 0))
+        _, columns = HEART_RATE_INTENSITY_SOURCES[name]
+        df = pd.DataFrame({time_column: batch['time_index'][batch[name]['time'][start:stop]]})
+        for column in columns:
+            df[column] = batch[name][column][start:stop]
+        df.insert(0, 'Id', int(user_id))
+        return df
+
+    return user_frame('heart_rate', 'Time'), user_frame('intensity', 'ActivityHour')
+
+@profiled
 def get_heart_rate_and_intensity(connection, user_id):
-    heart_rate_query = f"SELECT * FROM heart_rate WHERE Id = {user_id};"
-    hourly_intensity_query = f"SELECT * FROM hourly_intensity WHERE Id = {user_id};"
-
-    heart_rate_df = SQL_acquisition(connection, heart_rate_query)
-    hourly_intensity_df = SQL_acquisition(connection, hourly_intensity_query)
-
-    heart_rate_df['Time'] = pd.to_datetime(heart_rate_df['Time'])
-    hourly_intensity_df['ActivityHour'] = pd.to_datetime(hourly_intensity_df['ActivityHour'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-
-    return heart_rate_df, hourly_intensity_df
+    batch = get_heart_rate_and_intensity_batch(connection, [user_id])
+    return heart_rate_and_intensity_from_batch(batch, user_id)
+
+# Per-user partitions of a daily frame (merged_df): the frame is sorted once by (Id, date), so each
+# user's rows form one contiguous, date-sorted slice. A lookup is then a dict access plus a binary
+# search on that user's dates instead of boolean masks over every row.
+@profiled
+def build_user_partitions(df, date_column='ActivityDate'):
+    df = df.sort_values(['Id', date_column], kind='stable').reset_index(drop=True)
+    dates = df[date_column].to_numpy()
+    partitions = {
+        user_id: (start, stop, pd.Timestamp(dates[start]), pd.Timestamp(dates[stop - 1]))
+        for user_id, (start, stop) in _user_offsets(df['Id'].to_numpy(dtype='int64')).items()
+    }
+    return {'frame': df, 'dates': dates, 'partitions': partitions}
+
+def user_partition(index, user_id, start_date=None, end_date=None):
+    # rows of one user with start_date <= date <= end_date (both optional, inclusive)
+    start, stop, _, _ = index['partitions'].get(int(user_id), (0, 0, None, None))
+    if start_date is not None:
+        start += np.searchsorted(index['dates'][start:stop], pd.Timestamp(start_date).to_datetime64(), 'left')
+    if end_date is not None:
+        stop = start + np.searchsorted(index['dates'][start:stop], pd.Timestamp(end_date).to_datetime64(), 'right')
+    return index['frame'].iloc[start:stop]
 
 # TASK 7: Weather Impact
+@profiled
 def get_weather_and_daily_activity(connection, df_weather):
     query_active = """
-    SELECT ActivityDate, AVG(LightlyActiveMinutes) AS LightlyActive, 
+    SELECT DayNumber, AVG(LightlyActiveMinutes) AS LightlyActive, 
     AVG(FairlyActiveMinutes) AS FairlyActive, 
     AVG(VeryActiveMinutes) AS VeryActive
-    FROM daily_activity GROUP BY ActivityDate
+    FROM daily_activity GROUP BY DayNumber
     """
     query_distance = """
-    SELECT ActivityDate, AVG(TotalDistance) AS TotalDistance FROM daily_activity GROUP BY ActivityDate
+    SELECT DayNumber, AVG(TotalDistance) AS TotalDistance FROM daily_activity GROUP BY DayNumber
     """
     query_steps = """
-    SELECT ActivityDate, AVG(TotalSteps) AS TotalSteps FROM daily_activity GROUP BY ActivityDate
+    SELECT DayNumber, AVG(TotalSteps) AS TotalSteps FROM daily_activity GROUP BY DayNumber
     """
     df_activity = SQL_acquisition(connection, query_active)
     df_distance = SQL_acquisition(connection, query_distance)
     df_steps = SQL_acquisition(connection, query_steps)
 
-    df_activity['ActivityDate'] = pd.to_datetime(df_activity['ActivityDate'])
-    df_distance['ActivityDate'] = pd.to_datetime(df_distance['ActivityDate'])
-    df_steps['ActivityDate'] = pd.to_datetime(df_steps['ActivityDate'])
+    df_activity['ActivityDate'] = day_to_datetime(df_activity['DayNumber'])
+    df_distance['ActivityDate'] = day_to_datetime(df_distance['DayNumber'])
+    df_steps['ActivityDate'] = day_to_datetime(df_steps['DayNumber'])
 
     df_weather['datetime'] = pd.to_datetime(df_weather['datetime'])
     
@@ -277,6 +458,7 @@ def get_weather_and_daily_activity(connection, df_weather):
     return df_final_activity, df_final_distance, df_final_steps
 
 #Task 8: aggregate data.
+@profiled
 def aggregate_data(df, raw_data=None, group_by='Id'):
     try:
         print("Running aggregate_data function")
@@ -290,7 +472,7 @@ def aggregate_data(df, raw_data=None, group_by='Id'):
         group_columns = [group_by, 'DayOfWeek', 'Hour']
 
         # Aggregation on multiple columns with mean, median, and std
-        aggregated = df.groupby(group_columns).agg({
+        aggregated = df.groupby(group_columns, observed=True).agg({
             'TotalSteps': ['mean', 'median', 'std'],
             'Calories': ['mean', 'median', 'std'],
             'SedentaryMinutes': ['mean', 'median', 'std'],
@@ -324,46 +506,69 @@ def aggregate_data(df, raw_data=None, group_by='Id'):
         traceback.print_exc()
         return None
 
+@profiled
+def merge_daily_sources(daily_activity, daily_sources, keys=['Id', 'ActivityDate']):
+    # Every source is aggregated to one row per (Id, day) before it gets here, so each left join
+    # must be one-to-one; validate= raises instead of silently multiplying rows and skewing means.
+    duplicates = daily_activity.duplicated(subset=keys)
+    if duplicates.any():
+        print(f"Dropping {duplicates.sum()} duplicate (Id, ActivityDate) rows from daily_activity.")
+        daily_activity = daily_activity[~duplicates]
+
+    # the size of the largest intermediate frame, not the process' peak memory (the inputs and
+    # pandas' temporaries are not counted; profiling.py's memory mode measures that)
+    merged_df = daily_activity.copy()
+    largest_bytes = merged_df.memory_usage(deep=True).sum()
+    for df in daily_sources:
+        merged_df = pd.merge(merged_df, df, on=keys, how='left', validate='one_to_one')
+        largest_bytes = max(largest_bytes, merged_df.memory_usage(deep=True).sum())
+
+    print(f"Merged frame: {len(merged_df)} rows x {merged_df.shape[1]} columns, "
+          f"largest intermediate frame {largest_bytes / 1024 ** 2:.2f} MB")
+    return merged_df
+
 # Task 9: Analyzing and merge data
+@profiled
 def merge_and_analyze_data(connection):
     try:
+        # all frames below are merged on Id, so they must share one categorical dtype
+        register_ids_from_db(connection)
+
         # Load all relevant tables
         daily_activity = SQL_acquisition(connection, 
-            "SELECT Id, ActivityDate, TotalSteps, TotalDistance, Calories, "
+            "SELECT Id, DayNumber * 86400 AS ActivityDate, TotalSteps, TotalDistance, Calories, "
             "SedentaryMinutes, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes "
             "FROM daily_activity")
 
+        # heart rate, intensity, steps and sleep come from the per-(Id, day) rollup tables
+        # kept up to date by database.migrate_db(), instead of the raw second/minute/hour rows
         heart_rate = SQL_acquisition(connection, 
-            "SELECT Id, Time AS ActivityDate, Value AS HeartRate FROM heart_rate")
+            "SELECT Id, DayNumber * 86400 AS ActivityDate, AvgHeartRate AS HeartRate FROM daily_heart_rate")
 
         hourly_calories = SQL_acquisition(connection, 
-            "SELECT Id, ActivityHour AS ActivityDate, Calories AS HourlyCalories FROM hourly_calories")
+            "SELECT Id, EpochSeconds / 86400 * 86400 AS ActivityDate, AVG(Calories) AS HourlyCalories "
+            "FROM hourly_calories GROUP BY Id, EpochSeconds / 86400")
 
         hourly_intensity = SQL_acquisition(connection, 
-            "SELECT Id, ActivityHour AS ActivityDate, TotalIntensity, AverageIntensity FROM hourly_intensity")
+            "SELECT Id, DayNumber * 86400 AS ActivityDate, TotalIntensity, AverageIntensity FROM daily_intensity")
 
         hourly_steps = SQL_acquisition(connection, 
-            "SELECT Id, ActivityHour AS ActivityDate, StepTotal FROM hourly_steps")
+            "SELECT Id, DayNumber * 86400 AS ActivityDate, StepTotal FROM daily_hourly_steps")
 
+        # weighting the state minutes by their code (1 asleep, 2 restless, 3 awake) equals the
+        # previous sum over the raw minute_sleep values
         minute_sleep = SQL_acquisition(connection, 
-            "SELECT Id, date AS ActivityDate, value AS SleepMinutes FROM minute_sleep")
+            "SELECT Id, DayNumber * 86400 AS ActivityDate, "
+            "AsleepMinutes + 2 * RestlessMinutes + 3 * AwakeMinutes AS SleepMinutes FROM daily_sleep_states")
 
         weight_log = SQL_acquisition(connection, 
-            "SELECT Id, Date AS ActivityDate, WeightKg, BMI FROM weight_log")
-
-        daily_activity['ActivityDate'] = pd.to_datetime(daily_activity['ActivityDate'], format='%m/%d/%Y', errors='coerce')
-        heart_rate['ActivityDate'] = pd.to_datetime(heart_rate['ActivityDate'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-        hourly_calories['ActivityDate'] = pd.to_datetime(hourly_calories['ActivityDate'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-        hourly_intensity['ActivityDate'] = pd.to_datetime(hourly_intensity['ActivityDate'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-        hourly_steps['ActivityDate'] = pd.to_datetime(hourly_steps['ActivityDate'], format='%m/%d/%Y %I:%M:%S %p', errors='coerce')
-        minute_sleep['ActivityDate'] = pd.to_datetime(minute_sleep['ActivityDate'].str.split().str[0], format='%m/%d/%Y', errors='coerce')
-        weight_log['ActivityDate'] = pd.to_datetime(weight_log['ActivityDate'].str.split().str[0], format='%m/%d/%Y', errors='coerce')
+            "SELECT Id, DayNumber * 86400 AS ActivityDate, AVG(WeightKg) AS WeightKg, AVG(BMI) AS BMI "
+            "FROM weight_log GROUP BY Id, DayNumber")
 
-        minute_sleep = minute_sleep.groupby(['Id', 'ActivityDate']).agg({'SleepMinutes': 'sum'}).reset_index()
-        merged_df = daily_activity.copy()
+        for df in [daily_activity, heart_rate, hourly_calories, hourly_intensity, hourly_steps, minute_sleep, weight_log]:
+            df['ActivityDate'] = epoch_to_datetime(df['ActivityDate'])
 
-        for df in [minute_sleep, weight_log, hourly_calories, hourly_intensity, hourly_steps, heart_rate]:
-            merged_df = pd.merge(merged_df, df, on=['Id', 'ActivityDate'], how='left')
+        merged_df = merge_daily_sources(daily_activity, [minute_sleep, weight_log, hourly_calories, hourly_intensity, hourly_steps, heart_rate])
         
         merged_df['SleepMinutes'] = merged_df['SleepMinutes'].fillna(0)
         merged_df['WeightKg'] = merged_df['WeightKg'].fillna(merged_df['WeightKg'].median(skipna=True))
@@ -385,7 +590,7 @@ def merge_and_analyze_data(connection):
 
         merged_df["Class"] = merged_df["Class"].fillna("Light")
 
-        user_summaries = merged_df.groupby('Id').agg({
+        user_summaries = merged_df.groupby('Id', observed=True).agg({
             'TotalSteps': 'mean',
             'Calories': 'mean',
             'SedentaryMinutes': 'mean',
@@ -410,6 +615,7 @@ def merge_and_analyze_data(connection):
         return None, None
 
 #Task 10: weekdays
+@profiled
 def activity_vs_sleep_insights(df):
     try:
         if 'DayOfWeek' not in df.columns:
@@ -436,14 +642,18 @@ def activity_vs_sleep_insights(df):
         return None
 
 # Task 11: weightlog
+@profiled
 def analyze_weight_log(connection):
     """Analyze weight log table and handle missing values."""
-    query = "SELECT * FROM weight_log"
-    weight_df = SQL_acquisition(connection, query)
+    # only the columns used below, streamed in chunks like the other raw tables
+    query = "SELECT Id, WeightKg, Fat, BMI FROM weight_log"
+    chunks = list(SQL_acquisition_chunks(connection, query))
+    weight_df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=['Id', 'WeightKg', 'Fat', 'BMI'])
 
     for col in ['WeightKg', 'Fat', 'BMI']:
-        weight_df[col] = weight_df.groupby('Id')[col].transform(lambda x: x.fillna(x.mean()))
+        weight_df[col] = weight_df.groupby('Id', observed=True)[col].transform(lambda x: x.fillna(x.mean()))
 
+    weight_df = drop_unused_categories(weight_df, 'Id')
     plt.figure(figsize=(10, 6))
     sns.boxplot(x='Id', y='WeightKg', data=weight_df)
     plt.title('Weight Distribution by User')
@@ -452,87 +662,133 @@ def analyze_weight_log(connection):
     plt.show()
 
     print("\nWeight Log Descriptive Statistics:")
-    print(weight_df.groupby('Id')[['WeightKg', 'Fat', 'BMI']].describe())
+    print(weight_df.groupby('Id', observed=True)[['WeightKg', 'Fat', 'BMI']].describe())
 
     return weight_df
 
 # lala's leaderboard dataframe funtion
-def compute_leader_metrics(connection):
-    daily_query = """
-        SELECT 
-            CAST(Id AS INTEGER) AS Id,
-            SUM(TotalDistance) AS TotalDistance,
-            SUM(TotalSteps) AS TotalSteps,
-            SUM(VeryActiveMinutes) AS VeryActiveMinutes,
-            SUM(Calories) AS TotalCalories
+LEADER_METRICS = {
+    'steps_champion': 'TotalSteps',
+    'distance_champion': 'TotalDistance',
+    'calories_burned_champion': 'TotalCalories',
+}
+
+# One statement for the whole leaderboard: each CTE scans its source once (daily_activity through
+# its (Id, DayNumber, ...) covering index, intensity and sleep through the per-day rollups), and the
+# champions are ranked with RANK() so users with equal totals share a rank.
+LEADER_METRICS_QUERY = """
+    WITH activity AS (
+        SELECT Id,
+               SUM(TotalDistance) AS TotalDistance,
+               SUM(TotalSteps) AS TotalSteps,
+               SUM(VeryActiveMinutes) AS VeryActiveMinutes,
+               SUM(Calories) AS TotalCalories,
+               AVG(VeryActiveMinutes) AS AvgActiveMinutes,
+               COUNT(DayNumber) AS ActivityDays,
+               COUNT(DISTINCT DayNumber) AS UsageDays
         FROM daily_activity
         GROUP BY Id
-    """
-    df_daily = SQL_acquisition(connection, daily_query)
-    
-    activity_query = """
-        SELECT 
-            CAST(Id AS INTEGER) AS Id,
-            AVG(VeryActiveMinutes) AS AvgActiveMinutes,
-            SUM(VeryActiveMinutes) AS TotalActiveMinutes,
-            COUNT(ActivityDate) AS ActivityDays
-        FROM daily_activity
-        GROUP BY Id
-    """
-    df_activity = SQL_acquisition(connection, activity_query)
-    
-    hourly_query = """
-        SELECT 
-            CAST(Id AS INTEGER) AS Id,
-            AVG(TotalIntensity) AS AverageIntensity
-        FROM hourly_intensity
+    ),
+    intensity AS (
+        SELECT Id, SUM(TotalIntensity) * 1.0 / SUM(IntensityHours) AS AverageIntensity
+        FROM daily_intensity
         GROUP BY Id
-    """
-    df_hourly = SQL_acquisition(connection, hourly_query)
-    
-    sleep_query = """
-        SELECT 
-            CAST(Id AS INTEGER) AS Id,
-            COUNT(*) AS TotalRestfulSleep
-        FROM minute_sleep
-        WHERE value = 1
-        GROUP BY Id
-    """
-    df_sleep = SQL_acquisition(connection, sleep_query)
-    
-    date_query = """
-        SELECT 
-            CAST(Id AS INTEGER) AS Id,
-            COUNT(DISTINCT ActivityDate) AS UsageDays
-        FROM daily_activity
+    ),
+    sleep AS (
+        SELECT Id, SUM(AsleepMinutes) AS TotalRestfulSleep
+        FROM daily_sleep_states
         GROUP BY Id
-    """
-    df_dates = SQL_acquisition(connection, date_query)
-
-    merged_df = df_daily.copy()
-
-    merge_order = [df_activity, df_hourly, df_sleep, df_dates]
-    for df in merge_order:
-        if not df.empty and 'Id' in df.columns:
-            merged_df = pd.merge(
-                merged_df, df, on="Id", how="left", validate="one_to_one")
-    
+    )
+    SELECT a.Id, a.TotalDistance, a.TotalSteps, a.VeryActiveMinutes, a.TotalCalories,
+           a.AvgActiveMinutes, a.VeryActiveMinutes AS TotalActiveMinutes, a.ActivityDays,
+           i.AverageIntensity, s.TotalRestfulSleep, a.UsageDays,
+           RANK() OVER (ORDER BY a.TotalSteps DESC) AS TotalStepsRank,
+           RANK() OVER (ORDER BY a.TotalDistance DESC) AS TotalDistanceRank,
+           RANK() OVER (ORDER BY a.TotalCalories DESC) AS TotalCaloriesRank
+    FROM activity a
+    LEFT JOIN intensity i ON i.Id = a.Id
+    LEFT JOIN sleep s ON s.Id = a.Id
+    ORDER BY a.Id
+"""
+
+@profiled
+def compute_leader_metrics(connection, top_k=1):
+    merged_df = SQL_acquisition(connection, LEADER_METRICS_QUERY)
     merged_df = merged_df.fillna(0).replace([np.inf, -np.inf], 0)
+
+    # every champion entry keeps the rank-1 user under 'user_id'/'value'; 'ties' lists the other
+    # users sharing rank 1 and 'top' holds everyone ranked top_k or better (more rows on ties)
     champions = {}
-    
-    if not merged_df.empty:
-        metrics_map = {
-            'steps_champion': 'TotalSteps',
-            'distance_champion': 'TotalDistance',
-            'calories_burned_champion': 'TotalCalories',
+    for champion_name, col_name in LEADER_METRICS.items():
+        rank_col = f"{col_name}Rank"
+        if merged_df.empty or rank_col not in merged_df.columns:
+            continue
+
+        top = merged_df.loc[merged_df[rank_col] <= top_k, ['Id', col_name, rank_col]].sort_values([rank_col, 'Id'])
+        top = [{'rank': int(rank), 'user_id': int(user_id), 'value': value}
+               for user_id, value, rank in top.itertuples(index=False)]
+        champions[champion_name] = {
+            'user_id': top[0]['user_id'],
+            'value': top[0]['value'],
+            'ties': [entry['user_id'] for entry in top[1:] if entry['rank'] == 1],
+            'top': top,
         }
-        
-        for champion_name, col_name in metrics_map.items():
-            if col_name in merged_df.columns:
-                max_idx = merged_df[col_name].idxmax()
-                champions[champion_name] = {
-                    'user_id': merged_df.loc[max_idx, 'Id'],
-                    'value': merged_df.loc[max_idx, col_name]
-                }
-    
-    return merged_df, champions
\ No newline at end of file
+
+    return merged_df, champions
+
+# Community baseline: every per-date community average the champion charts compare against, in one
+# frame. Intensity comes from the daily_intensity rollup; weighting each day's mean by its hour count
+# gives the same value as averaging all hourly rows of that date.
+COMMUNITY_BASELINE_QUERY = """
+    WITH days AS (
+        SELECT DayNumber FROM daily_activity
+        UNION
+        SELECT DayNumber FROM daily_intensity
+    ),
+    activity AS (
+        SELECT DayNumber,
+               AVG(TotalSteps) AS AvgSteps,
+               AVG(TotalDistance) AS AvgDistance,
+               AVG(Calories) AS AvgCalories
+        FROM daily_activity
+        GROUP BY DayNumber
+    ),
+    intensity AS (
+        SELECT DayNumber, SUM(AverageIntensity * IntensityHours) / SUM(IntensityHours) AS AvgIntensity
+        FROM daily_intensity
+        GROUP BY DayNumber
+    )
+    SELECT d.DayNumber, a.AvgSteps, a.AvgDistance, a.AvgCalories, i.AvgIntensity
+    FROM days d
+    LEFT JOIN activity a ON a.DayNumber = d.DayNumber
+    LEFT JOIN intensity i ON i.DayNumber = d.DayNumber
+    WHERE d.DayNumber IS NOT NULL
+    ORDER BY d.DayNumber
+"""
+
+@profiled
+def get_community_baseline(connection):
+    # indexed by DayNumber, so a chart joins a user's days against it without another query
+    return SQL_acquisition(connection, COMMUNITY_BASELINE_QUERY).set_index('DayNumber')
+
+# Time-window leaderboards, read from the leaderboard_ranks table that database.migrate_db() keeps ranked
+@profiled
+def get_leaderboard_windows(connection, window, metric):
+    query = """
+        SELECT DISTINCT WindowStart, WindowEnd
+        FROM leaderboard_ranks
+        WHERE WindowType = ? AND Metric = ?
+        ORDER BY WindowStart
+    """
+    return SQL_acquisition(connection, query, (window, metric))
+
+@profiled
+def get_leaderboard(connection, window, metric, window_start, top_k=10):
+    # RANK() leaves gaps after ties, so "Rank <= top_k" returns more than top_k rows when users tie
+    query = """
+        SELECT Rank, Id, Value
+        FROM leaderboard_ranks
+        WHERE WindowType = ? AND Metric = ? AND WindowStart = ? AND Rank <= ?
+        ORDER BY Rank, Id
+    """
+    return SQL_acquisition(connection, query, (window, metric, window_start, top_k))
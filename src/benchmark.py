@@ -0,0 +1,257 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import statistics
+import tracemalloc
+from contextlib import redirect_stdout
+import numpy as np
+import pandas as pd
+from csv_data_wrangling import clean_and_transform_data
+from analysis import merge_and_analyze_data, aggregate_data, compute_leader_metrics, get_activity_by_time_blocks, calculate_time_block_averages, get_weather_and_daily_activity
+from database import connect_db, db_fingerprint, migrate_db, refresh_rollups, refresh_leaderboards, compute_sleep_duration, ROLLUPS, LEADERBOARD_SOURCES
+from dashboard_data import _load_leader_metrics, _load_community_baseline, _load_champion_daily_data, _load_leaderboard
+from synthetic_data import generate_fitbit_data, SYNTHETIC_DIR, RAW_TABLES
+from profiling import count_rows
+from benchmark_history import record_report, BENCHMARK_DIR, HISTORY_DB
+
+# --------------------------
+# Benchmark suite
+# Times the heavy pipeline functions on synthetic datasets of several sizes (see synthetic_data.py).
+# Every function runs `repeat` times for the wall time (median, min and every run) and once more
+# under tracemalloc for its peak Python/numpy memory, so the tracing overhead never shows up in
+# the timings. Rows in counts the table rows (or frame rows) a function reads, rows out the rows
+# it returns. Datasets are generated once per size and reused by later runs.
+# The database maintenance functions write, so they run on a fresh copy of the dataset for every
+# run: migrate_db on the raw (never migrated) database, the refreshes on the migrated one with
+# every day marked as changed, i.e. a full rebuild of the rollups and leaderboards.
+# --------------------------
+FOLDER_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+CHICAGO_WEATHER = os.path.join(FOLDER_DATA, "Chicago_Weather.csv")
+DEFAULT_SIZES = (33, 1000, 10000)
+
+def _table_rows(context, *tables):
+    return sum(context["table_rows"][table] for table in tables)
+
+def _setup_merge(context):
+    tables = ("daily_activity", "daily_heart_rate", "hourly_calories", "daily_intensity",
+              "daily_hourly_steps", "daily_sleep_states", "weight_log")
+    return (context["connection"],), _table_rows(context, *tables)
+
+def _setup_aggregate(context):
+    return (context["merged_df"].copy(),), len(context["merged_df"])
+
+def _setup_leaders(context):
+    return (context["connection"],), _table_rows(context, "daily_activity", "daily_intensity", "daily_sleep_states")
+
+def _setup_time_blocks(context):
+    frames = context["time_blocks"]
+    return tuple(df.copy() for df in frames), sum(len(df) for df in frames)
+
+def _setup_weather(context):
+    weather = context["weather"]
+    return (context["connection"], weather.copy()), _table_rows(context, "daily_activity") + len(weather)
+
+def _setup_clean(context):
+    return (context["raw_csv"].copy(),), len(context["raw_csv"])
+
+def _working_copy(context, source):
+    # closes the copy of the previous run first; the copy is taken in setup, outside the timing
+    if context.get("work_connection") is not None:
+        context["work_connection"].close()
+        context["work_connection"] = None
+    target = os.path.join(os.path.dirname(source), "bench_work.db")
+    for path in (target, f"{target}-wal", f"{target}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.copyfile(source, target)
+    return target
+
+def _setup_migrate(context):
+    return (_working_copy(context, context["raw_db"]),), _table_rows(context, *RAW_TABLES)
+
+def _setup_refresh(sources):
+    def setup(context):
+        connection = connect_db(_working_copy(context, context["db"]))
+        context["work_connection"] = connection
+        for source in sources:
+            connection.execute(f"""
+                INSERT OR IGNORE INTO changed_days (SourceTable, Id, DayNumber)
+                SELECT DISTINCT '{source}', Id, DayNumber FROM {source} WHERE DayNumber IS NOT NULL
+            """)
+        return (connection,), _table_rows(context, *sources)
+    return setup
+
+def _setup_sleep_duration(context):
+    return (context["connection"],), _table_rows(context, "minute_sleep")
+
+# the dashboard loaders are benchmarked cold: __wrapped__ is the function behind the Streamlit cache
+def _setup_loader(*tables):
+    def setup(context):
+        return (context["db"], db_fingerprint(context["db"])), _table_rows(context, *tables)
+    return setup
+
+def _setup_champion_daily(context):
+    args, rows_in = _setup_loader("daily_activity", "daily_sleep_states")(context)
+    return (*args, context["first_user"]), rows_in
+
+def _setup_leaderboard(context):
+    args, rows_in = _setup_loader("leaderboard_ranks")(context)
+    return (*args, "week", "TotalSteps", context["first_week"], 10), rows_in
+
+# name -> (function, setup); setup builds fresh arguments for every run and counts the rows read
+BENCHMARKS = {
+    "clean_and_transform_data": (clean_and_transform_data, _setup_clean),
+    "merge_and_analyze_data": (merge_and_analyze_data, _setup_merge),
+    "aggregate_data": (aggregate_data, _setup_aggregate),
+    "compute_leader_metrics": (compute_leader_metrics, _setup_leaders),
+    "calculate_time_block_averages": (calculate_time_block_averages, _setup_time_blocks),
+    "get_weather_and_daily_activity": (get_weather_and_daily_activity, _setup_weather),
+    "database.migrate_db": (migrate_db, _setup_migrate),
+    "database.refresh_rollups": (refresh_rollups, _setup_refresh([source for source, _, _ in ROLLUPS.values()])),
+    "database.refresh_leaderboards": (refresh_leaderboards, _setup_refresh(sorted(LEADERBOARD_SOURCES))),
+    "database.compute_sleep_duration": (compute_sleep_duration, _setup_sleep_duration),
+    "dashboard_data._load_leader_metrics": (_load_leader_metrics.__wrapped__, _setup_loader("daily_activity", "daily_intensity", "daily_sleep_states")),
+    "dashboard_data._load_community_baseline": (_load_community_baseline.__wrapped__, _setup_loader("daily_activity", "daily_intensity")),
+    "dashboard_data._load_champion_daily_data": (_load_champion_daily_data.__wrapped__, _setup_champion_daily),
+    "dashboard_data._load_leaderboard": (_load_leaderboard.__wrapped__, _setup_leaderboard),
+}
+
+def machine_info():
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+    }
+
+def prepare_dataset(users, days, heart_rate_interval, seed):
+    # one directory per dataset; dataset.json is written last, so a half-written dataset is rebuilt
+    output_dir = os.path.join(SYNTHETIC_DIR, f"bench_{users}u_{days}d_{heart_rate_interval}s_seed{seed}")
+    info_path = os.path.join(output_dir, "dataset.json")
+    if os.path.exists(info_path):
+        with open(info_path) as f:
+            info = json.load(f)
+        # datasets from before the migrate_db benchmark have no raw copy and are rebuilt
+        if "raw_db" in info:
+            return info
+
+    print(f"Generating {users} users x {days} days in {output_dir} ...")
+    result = generate_fitbit_data(output_dir, users, days, heart_rate_interval, seed)
+    # an unmigrated copy for the migrate_db benchmark
+    result["raw_db"] = os.path.join(output_dir, "raw_database.db")
+    shutil.copyfile(result["db"], result["raw_db"])
+    migrate_db(result["db"])
+    connection = connect_db(result["db"])
+    try:
+        tables = [name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        result["table_rows"] = {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+    finally:
+        connection.close()
+
+    info = {"users": users, "days": days, "heart_rate_interval": heart_rate_interval, "seed": seed, **result}
+    with open(info_path, "w") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+def run_benchmark(func, setup, context, repeat):
+    timings = []
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            args, rows_in = setup(context)
+            start = time.perf_counter()
+            result = func(*args)
+            timings.append(time.perf_counter() - start)
+
+        # a separate traced run, since tracemalloc slows every allocation down
+        args, rows_in = setup(context)
+        tracemalloc.start()
+        try:
+            result = func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "wall_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "runs": timings,
+        "peak_memory_bytes": peak,
+        "rows_in": rows_in,
+        "rows_out": count_rows(result),
+    }
+
+def run_suite(sizes=DEFAULT_SIZES, days=31, heart_rate_interval=300, seed=0, repeat=3, functions=None):
+    functions = list(BENCHMARKS) if not functions else functions
+    results = []
+    for users in sizes:
+        dataset = prepare_dataset(users, days, heart_rate_interval, seed)
+        connection = connect_db(dataset["db"], read_only=True)
+        context = {}
+        try:
+            with redirect_stdout(io.StringIO()):
+                context = {
+                    "db": dataset["db"],
+                    "raw_db": dataset["raw_db"],
+                    "work_connection": None,
+                    "connection": connection,
+                    "first_user": connection.execute("SELECT MIN(Id) FROM daily_activity").fetchone()[0],
+                    "first_week": connection.execute("SELECT MIN(WindowStart) FROM leaderboard_ranks WHERE WindowType = 'week'").fetchone()[0],
+                    "table_rows": dataset["table_rows"],
+                    "raw_csv": pd.read_csv(dataset["csv"]),
+                    "weather": pd.read_csv(CHICAGO_WEATHER),
+                    "merged_df": merge_and_analyze_data(connection)[0],
+                    "time_blocks": get_activity_by_time_blocks(connection),
+                }
+
+            for name in functions:
+                func, setup = BENCHMARKS[name]
+                result = run_benchmark(func, setup, context, repeat)
+                results.append({"function": name, "users": users, "days": days, **result})
+                print(f"{name:44s} {users:>6d} users  {result['wall_seconds']:8.3f}s  "
+                      f"{result['peak_memory_bytes'] / 2**20:8.1f} MiB  {result['rows_in']:>10d} rows in  "
+                      f"{result['rows_out']:>8d} rows out")
+        finally:
+            connection.close()
+            if context.get("work_connection") is not None:
+                context["work_connection"].close()
+            for path in (os.path.join(os.path.dirname(dataset["db"]), f"bench_work.db{suffix}") for suffix in ("", "-wal", "-shm")):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "settings": {"sizes": list(sizes), "days": days, "heart_rate_interval": heart_rate_interval,
+                     "seed": seed, "repeat": repeat},
+        "results": results,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline functions on synthetic data")
+    parser.add_argument("--users", type=int, nargs="+", default=list(DEFAULT_SIZES), help="dataset sizes (number of users)")
+    parser.add_argument("--days", type=int, default=31, help="days per user")
+    parser.add_argument("--heart-rate-interval", type=int, default=300, help="seconds between heart rate readings")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic datasets")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per function (the median is reported)")
+    parser.add_argument("--functions", nargs="+", choices=list(BENCHMARKS), help="benchmark only these functions")
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, "results.json"), help="JSON file for the results")
+    parser.add_argument("--record", action="store_true", help="also append the results to the benchmark history")
+    parser.add_argument("--history", default=HISTORY_DB, help="path to the benchmark history database")
+    args = parser.parse_args()
+
+    report = run_suite(args.users, args.days, args.heart_rate_interval, args.seed, args.repeat, args.functions)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}", file=sys.stderr)
+    if args.record:
+        record_report(report, args.history)
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import statistics
+import subprocess
+import sqlite3 as sql
+
+# --------------------------
+# Benchmark history
+# An append-only SQLite file (data/benchmarks/history.db) with one row per benchmark run (git
+# revision, machine, settings) and one row per function and dataset size of that run. Triggers
+# reject UPDATE and DELETE, so old baselines cannot be rewritten.
+# compare_revisions() matches a candidate revision against a baseline revision on the same machine
+# and flags every function whose median time or peak memory grew by more than the threshold.
+# --------------------------
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "benchmarks")
+HISTORY_DB = os.path.join(BENCHMARK_DIR, "history.db")
+
+HISTORY_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        RunId INTEGER PRIMARY KEY,
+        Created TEXT NOT NULL,
+        GitRevision TEXT NOT NULL,
+        GitDirty INTEGER NOT NULL,
+        Machine TEXT NOT NULL,
+        MachineInfo TEXT NOT NULL,
+        Settings TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS results (
+        RunId INTEGER NOT NULL REFERENCES runs (RunId),
+        Function TEXT NOT NULL,
+        Users INTEGER NOT NULL,
+        Days INTEGER NOT NULL,
+        WallSeconds REAL NOT NULL,
+        MinSeconds REAL NOT NULL,
+        PeakMemoryBytes INTEGER NOT NULL,
+        RowsIn INTEGER NOT NULL,
+        RowsOut INTEGER NOT NULL,
+        Runs TEXT NOT NULL,
+        PRIMARY KEY (RunId, Function, Users, Days)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_runs_revision ON runs (Machine, GitRevision)",
+]
+for _table in ("runs", "results"):
+    HISTORY_SCHEMA += [
+        f"""CREATE TRIGGER IF NOT EXISTS {_table}_no_update BEFORE UPDATE ON {_table}
+            BEGIN SELECT RAISE(ABORT, 'benchmark history is append-only'); END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {_table}_no_delete BEFORE DELETE ON {_table}
+            BEGIN SELECT RAISE(ABORT, 'benchmark history is append-only'); END""",
+    ]
+
+def connect_history(history_db=HISTORY_DB):
+    os.makedirs(os.path.dirname(os.path.abspath(history_db)), exist_ok=True)
+    connection = sql.connect(history_db)
+    with connection:
+        for statement in HISTORY_SCHEMA:
+            connection.execute(statement)
+    return connection
+
+def git_revision():
+    # (revision, dirty); a run with uncommitted changes is recorded as "<revision>+dirty", so it can
+    # be compared against the clean revision it started from. "unknown" outside a git checkout
+    folder = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=folder, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=folder, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    dirty = bool(status.strip())
+    return (f"{revision}+dirty" if dirty else revision), dirty
+
+def record_report(report, history_db=HISTORY_DB):
+    revision, dirty = git_revision()
+    connection = connect_history(history_db)
+    try:
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (Created, GitRevision, GitDirty, Machine, MachineInfo, Settings) VALUES (?, ?, ?, ?, ?, ?)",
+                (report["created"], revision, int(dirty), report["machine"]["host"],
+                 json.dumps(report["machine"], sort_keys=True), json.dumps(report["settings"], sort_keys=True)))
+            run_id = cursor.lastrowid
+            connection.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, result["function"], result["users"], result["days"], result["wall_seconds"],
+                  result["min_seconds"], result["peak_memory_bytes"], result["rows_in"], result["rows_out"],
+                  json.dumps(result["runs"])) for result in report["results"]])
+    finally:
+        connection.close()
+    print(f"Recorded benchmark run {run_id} ({revision}, {report['machine']['host']}).")
+    return run_id
+
+def _revision_results(connection, machine, revision):
+    # every recorded result of one revision, grouped per function and size
+    rows = connection.execute("""
+        SELECT r.Function, r.Users, r.Days, r.WallSeconds, r.PeakMemoryBytes
+        FROM results r JOIN runs USING (RunId)
+        WHERE runs.Machine = ? AND runs.GitRevision = ?
+    """, (machine, revision)).fetchall()
+    grouped = {}
+    for function, users, days, wall_seconds, peak_memory in rows:
+        grouped.setdefault((function, users, days), []).append((wall_seconds, peak_memory))
+    return grouped
+
+def _recorded_revisions(connection, machine):
+    # oldest first, each revision once at the position of its latest run
+    rows = connection.execute("""
+        SELECT GitRevision FROM runs WHERE Machine = ? GROUP BY GitRevision ORDER BY MAX(RunId)
+    """, (machine,)).fetchall()
+    return [revision for (revision,) in rows]
+
+def _split_dirty(revision):
+    dirty = revision.endswith("+dirty")
+    return (revision[:-len("+dirty")] if dirty else revision), dirty
+
+def _match_revision(revisions, revision):
+    # a recorded revision given in full or as a prefix; a clean revision never matches the
+    # "+dirty" runs made on top of it (and the other way round)
+    if revision in revisions:
+        return revision
+    prefix, dirty = _split_dirty(revision)
+    matches = [recorded for recorded in revisions
+               if _split_dirty(recorded)[1] == dirty and _split_dirty(recorded)[0].startswith(prefix)]
+    if len(matches) != 1:
+        print(f"Revision {revision} matches {len(matches)} benchmarked revisions; give more of it.")
+        return None
+    return matches[0]
+
+def _short(revision):
+    sha, dirty = _split_dirty(revision)
+    return sha[:12] + ("+dirty" if dirty else "")
+
+def compare_revisions(history_db=HISTORY_DB, baseline=None, candidate=None, machine=None, threshold=0.10):
+    # defaults: the two most recently benchmarked revisions of this machine
+    machine = machine or platform.node()
+    connection = connect_history(history_db)
+    try:
+        revisions = _recorded_revisions(connection, machine)
+        if candidate is not None:
+            candidate = _match_revision(revisions, candidate)
+        elif revisions:
+            candidate = revisions[-1]
+        if baseline is not None:
+            baseline = _match_revision(revisions, baseline)
+        elif candidate is not None:
+            # a "+dirty" candidate is compared against the clean revision it started from, if recorded
+            earlier = [revision for revision in revisions if revision != candidate]
+            baseline = earlier[-1] if earlier else None
+        if baseline is None or candidate is None:
+            print(f"Need benchmark runs of two revisions on {machine} to compare.")
+            return []
+        baseline_results = _revision_results(connection, machine, baseline)
+        candidate_results = _revision_results(connection, machine, candidate)
+    finally:
+        connection.close()
+
+    print(f"Comparing {_short(candidate)} against {_short(baseline)} on {machine} (threshold {threshold:.0%})")
+    regressions = []
+    for key in sorted(candidate_results.keys() & baseline_results.keys()):
+        function, users, days = key
+        before_time = statistics.median(wall for wall, _ in baseline_results[key])
+        after_time = statistics.median(wall for wall, _ in candidate_results[key])
+        before_memory = statistics.median(memory for _, memory in baseline_results[key])
+        after_memory = statistics.median(memory for _, memory in candidate_results[key])
+        time_change = after_time / before_time - 1 if before_time else 0.0
+        memory_change = after_memory / before_memory - 1 if before_memory else 0.0
+
+        flags = [label for label, change in (("time", time_change), ("memory", memory_change)) if change > threshold]
+        print(f"{'REGRESSED' if flags else 'ok':9s} {function:44s} {users:>6d} users  "
+              f"{before_time:8.3f}s -> {after_time:8.3f}s ({time_change:+.1%})  "
+              f"{before_memory / 2**20:8.1f} -> {after_memory / 2**20:8.1f} MiB ({memory_change:+.1%})")
+        if flags:
+            regressions.append({"function": function, "users": users, "days": days, "regressed": flags,
+                                "time_change": time_change, "memory_change": memory_change})
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark history: record runs and compare revisions")
+    parser.add_argument("--history", default=HISTORY_DB, help="path to the history database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="append a results.json written by benchmark.py")
+    record_parser.add_argument("results", nargs="?", default=os.path.join(BENCHMARK_DIR, "results.json"))
+    compare_parser = subparsers.add_parser("compare", help="flag functions that got slower or use more memory")
+    compare_parser.add_argument("--baseline", help="baseline git revision (default: the previously benchmarked one)")
+    compare_parser.add_argument("--candidate", help="candidate git revision (default: the latest benchmarked one)")
+    compare_parser.add_argument("--machine", help="machine name (default: this machine)")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative increase, e.g. 0.10 for 10%%")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        with open(args.results) as f:
+            record_report(json.load(f), args.history)
+    elif args.command == "compare":
+        regressions = compare_revisions(args.history, args.baseline, args.candidate, args.machine, args.threshold)
+        # a non-zero exit code lets a CI job fail on regressions
+        sys.exit(1 if regressions else 0)
@@ -1,5 +1,7 @@
 import pandas as pd
+from profiling import profiled
 
+@profiled
 def load_and_preview_data(df):
     df = pd.read_csv(df)  
     print("\nFirst 5 rows of the dataset:")
@@ -9,6 +11,7 @@ def load_and_preview_data(df):
     print("\nOriginal Data Preview Done.")
     return df
 
+@profiled
 def clean_and_transform_data(df):
     print(f"\nColumns in dataset: {df.columns}")
     
@@ -41,6 +44,7 @@ def clean_and_transform_data(df):
     
     return df_cleaned
 
+@profiled
 def summarize_data(df):
     print("\nSummary Statistics of Cleaned Data:")
     print(df.describe(include="all"))
@@ -1,14 +1,18 @@
 import os
+import time
 import streamlit as st
 import pandas as pd
-from database import connect_db
+from database import pooled_connection
+from analysis import user_partition
 from dashboard_visualization import (plot_active_vs_sedentary, plot_activity_intensity, plot_calories_trends, plot_heart_rate_trends, plot_sleep_efficiency, plot_sleep_trends, plot_sleep_vs_activity, plot_step_distance_relationship, plot_calories_vs_activity, plot_sleep_distribution, plot_sleep_correlations, plot_step_distribution_for_all_user, plot_steps_trends, plot_steps_vs_calories, plot_steps_vs_sleep, show_calories_plot, show_sleep_plot, show_steps_plot, plot_individual_metrics, plot_steps_champion_chart, plot_distance_champion_chart, plot_calories_champion_chart)
-from analysis import merge_and_analyze_data, compute_leader_metrics
+from dashboard_metrics import timed, record_timing, write_prometheus_metrics, admin_enabled, show_metrics_panel
+from dashboard_data import load_merged_data, load_leader_metrics, load_champion_daily_data, load_leaderboard_windows, load_leaderboard, load_community_baseline, load_user_partitions
 
 
 # --------------------------
 # Page setup (must be FIRST Streamlit command)
 st.set_page_config(page_title="Fitbit Health & Activity Dashboard", layout="wide", page_icon=":material/sprint:")
+rerun_started = time.perf_counter()
 
 # --------------------------
 # Configuration
@@ -17,12 +21,9 @@ DB_PATH = os.path.join(current_dir, "..", "data", "fitbit_database.db")
 
 # --------------------------
 try:
-    conn = connect_db(DB_PATH)
-    merged_df, user_summaries = merge_and_analyze_data(conn)
+    merged_df, user_summaries = load_merged_data(DB_PATH)
     
-    metrics_df, champions = compute_leader_metrics(conn)
-
-    conn.close()
+    metrics_df, champions = load_leader_metrics(DB_PATH)
 except Exception as e:
     st.error(f"Failed to load data: {str(e)}")
     st.stop()
@@ -53,6 +54,7 @@ def display_activity_metrics(merged_df):
 
     st.markdown("---")
     
+@timed("page")
 def show_home(merged_df):
     """Homepage with navigation buttons"""
     st.markdown("<h1 style='text-align: center;'> Fitbit Health & Activity Dashboard</h1>", unsafe_allow_html=True)
@@ -177,6 +179,7 @@ def add_footer():
 # --------------------------
 # Users Summary
 # --------------------------
+@timed("page")
 def show_Users_Summary(merged_df):
     st.header(":material/groups: Community Summary") 
 
@@ -331,6 +334,7 @@ def show_Users_Summary(merged_df):
 
 # --------------------------
 # Leaderboard
+@timed("page")
 def leaderboard_page(metrics_df, champions):
     st.header(":material/trophy: Leaderboard")
     # --------------------------
@@ -355,6 +359,40 @@ def leaderboard_page(metrics_df, champions):
         # Get selected champion data
         champ_key = champ_mapping[selected_champ]
         champion = champions.get(champ_key, {})
+
+        # Ranking window: all-time totals, or one period of the precomputed window leaderboards
+        window_mapping = {
+            "All time": None,
+            "Calendar week": "week",
+            "Calendar month": "month",
+            "Rolling 7 days": "rolling7",
+            "Rolling 30 days": "rolling30"
+        }
+        window_metrics = {
+            "steps_champion": "TotalSteps",
+            "distance_champion": "TotalDistance",
+            "calories_burned_champion": "Calories"
+        }
+        selected_window = st.selectbox("Ranking window:", list(window_mapping))
+        window = window_mapping[selected_window]
+        ranking = pd.DataFrame()
+
+        if window:
+            windows = load_leaderboard_windows(DB_PATH, window, window_metrics[champ_key])
+            if windows.empty:
+                champion = {}
+            else:
+                period_labels = {
+                    int(start): f"{pd.Timestamp(int(start), unit='D'):%b %d} - {pd.Timestamp(int(end), unit='D'):%b %d, %Y}"
+                    for start, end in windows.itertuples(index=False)
+                }
+                window_start = st.selectbox("Period:", list(period_labels)[::-1], format_func=period_labels.get)
+                ranking = load_leaderboard(DB_PATH, window, window_metrics[champ_key], window_start)
+                champion = {
+                    'user_id': int(ranking['Id'].iloc[0]),
+                    'value': ranking['Value'].iloc[0],
+                    'ties': [int(user_id) for user_id in ranking.loc[ranking['Rank'] == 1, 'Id'].iloc[1:]],
+                } if not ranking.empty else {}
         
         # Simplified usage stats
         if champion and not metrics_df.empty:
@@ -379,63 +417,7 @@ def leaderboard_page(metrics_df, champions):
     # =================================================================
     # FETCH INDIVIDUAL USER'S DAILY DATA (UPDATED)
     try:
-        conn = connect_db(DB_PATH)
-        
-        # Get daily activity data
-        champ_query = f"""
-            SELECT ActivityDate, TotalSteps, TotalDistance, Calories, 
-                VeryActiveMinutes, SedentaryMinutes
-            FROM daily_activity
-            WHERE Id = {user_id}
-            ORDER BY ActivityDate
-        """
-        champ_daily_df = pd.read_sql(champ_query, conn)
-        
-        # Ensure date column is in datetime format for merging
-        champ_daily_df["ActivityDate"] = pd.to_datetime(champ_daily_df["ActivityDate"]).dt.date
-
-        # Get sleep data
-        champ_sleep_query = f"""
-            SELECT date AS raw_datetime, value
-            FROM minute_sleep
-            WHERE Id = {user_id}
-        """
-        champ_sleep_raw = pd.read_sql(champ_sleep_query, conn)
-
-        # Convert to datetime and floor to minute
-        champ_sleep_raw["datetime"] = pd.to_datetime(
-            champ_sleep_raw["raw_datetime"], 
-            errors="coerce",  # Handle possible format issues
-            format="mixed"
-        ).dt.floor("min")
-
-        # Extract date only for aggregation
-        champ_sleep_raw["ActivityDate"] = champ_sleep_raw["datetime"].dt.date
-
-        # Aggregate sleep states by date
-        champ_sleep_df = champ_sleep_raw.groupby("ActivityDate")["value"].value_counts().unstack(fill_value=0)
-
-        # Rename columns to match sleep states
-        champ_sleep_df = champ_sleep_df.rename(columns={
-            1: "AsleepMinutes",
-            2: "RestlessMinutes",
-            3: "AwakeMinutes"
-        }).reset_index()
-
-        # Ensure all sleep state columns exist, even if missing
-        for col in ["AsleepMinutes", "RestlessMinutes", "AwakeMinutes"]:
-            if col not in champ_sleep_df.columns:
-                champ_sleep_df[col] = 0
-
-        # Merge with daily activity data
-        champ_daily_df = champ_daily_df.merge(champ_sleep_df, on="ActivityDate", how="left")
-
-        # Sort data by date
-        champ_daily_df = champ_daily_df.sort_values(by="ActivityDate")
-
-        # Fill missing values and convert to integers
-        sleep_cols = ["AsleepMinutes", "RestlessMinutes", "AwakeMinutes"]
-        champ_daily_df[sleep_cols] = champ_daily_df[sleep_cols].fillna(0).astype(int)
+        champ_daily_df = load_champion_daily_data(DB_PATH, user_id)
 
     except Exception as e:
         st.error(f"Failed to load user data: {str(e)}")
@@ -448,7 +430,13 @@ def leaderboard_page(metrics_df, champions):
         "calories_burned_champion": ":material/local_fire_department: Calorie Burner"
     }
     st.subheader(f"{display_titles[champ_key]}: User {user_id}")
-    
+    if champion.get('ties'):
+        st.caption(f"Shares the top spot with: {', '.join(f'User {tied_id}' for tied_id in champion['ties'])}")
+
+    if not ranking.empty:
+        st.caption(f"Top {len(ranking)} for {selected_window.lower()}: {period_labels[window_start]}")
+        st.dataframe(ranking.rename(columns={'Id': 'User', 'Value': selected_champ}), hide_index=True, use_container_width=True)
+
     # Metrics columns
     if not metrics_df.empty and 'Id' in metrics_df.columns:
         champ_metrics = metrics_df[metrics_df['Id'] == user_id].iloc[0]
@@ -474,32 +462,34 @@ def leaderboard_page(metrics_df, champions):
     
     # Display appropriate chart based on selected champion type
     try:
-        if champ_key == "steps_champion":
-            fig = plot_steps_champion_chart(conn, user_id)
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("""
-            **Step Master Analysis:**
-            - Compare the champion's daily step count (bars) against the community average (dashed line)
-            - Identify consistent patterns and peak performance days
-            """)
+        baseline = load_community_baseline(DB_PATH)
+        with pooled_connection(DB_PATH) as conn:
+            if champ_key == "steps_champion":
+                fig = plot_steps_champion_chart(conn, user_id, baseline)
+                st.plotly_chart(fig, use_container_width=True)
+                st.markdown("""
+                **Step Master Analysis:**
+                - Compare the champion's daily step count (bars) against the community average (dashed line)
+                - Identify consistent patterns and peak performance days
+                """)
             
-        elif champ_key == "distance_champion":
-            fig = plot_distance_champion_chart(conn, user_id)
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("""
-            **Distance Champion Analysis:**
-            - Compare the champion's daily distance covered (bars) against the community average (dashed line)
-            - Identify longer journeys and consistent training patterns
-            """)
+            elif champ_key == "distance_champion":
+                fig = plot_distance_champion_chart(conn, user_id, baseline)
+                st.plotly_chart(fig, use_container_width=True)
+                st.markdown("""
+                **Distance Champion Analysis:**
+                - Compare the champion's daily distance covered (bars) against the community average (dashed line)
+                - Identify longer journeys and consistent training patterns
+                """)
             
-        elif champ_key == "calories_burned_champion":
-            fig = plot_calories_champion_chart(conn, user_id)
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown("""
-            **Calorie Burner Analysis:**
-            - Compare the champion's daily calorie burn (bars) against the community average (dashed line)
-            - Identify high-energy expenditure days and patterns
-            """)
+            elif champ_key == "calories_burned_champion":
+                fig = plot_calories_champion_chart(conn, user_id, baseline)
+                st.plotly_chart(fig, use_container_width=True)
+                st.markdown("""
+                **Calorie Burner Analysis:**
+                - Compare the champion's daily calorie burn (bars) against the community average (dashed line)
+                - Identify high-energy expenditure days and patterns
+                """)
 
     except Exception as e:
         st.error(f"Error generating champion comparison chart: {str(e)}")
@@ -569,6 +559,7 @@ def leaderboard_page(metrics_df, champions):
 
 # --------------------------
 # Individual User Statistics
+@timed("page")
 def individual_users():
     st.header(":material/account_circle: Personal Stats")
     
@@ -578,18 +569,13 @@ def individual_users():
         setup_sidebar()
         st.title(":material/filter_alt: Choose Your User ID")
 
-        user_ids = merged_df['Id'].unique().tolist()
-        clean_user_ids = [int(user_id) for user_id in user_ids]
-        selected_user_clean = st.sidebar.selectbox("Select User ID:", sorted(clean_user_ids))
-        selected_user = float(selected_user_clean)
+        # the partition index maps every user to a date-sorted slice of merged_df with its date bounds
+        user_index = load_user_partitions(DB_PATH)
+        selected_user = st.sidebar.selectbox("Select User ID:", sorted(user_index['partitions']))
     
-    user_specific_df = merged_df[merged_df['Id'] == selected_user]
-    if not user_specific_df.empty:
-        user_min_date = pd.to_datetime(user_specific_df['ActivityDate']).min().date()
-        user_max_date = pd.to_datetime(user_specific_df['ActivityDate']).max().date()
-    else:
-        user_min_date = pd.to_datetime(merged_df['ActivityDate']).min().date()
-        user_max_date = pd.to_datetime(merged_df['ActivityDate']).max().date()
+    _, _, user_min_date, user_max_date = user_index['partitions'][selected_user]
+    user_min_date = user_min_date.date()
+    user_max_date = user_max_date.date()
     
     date_range = st.sidebar.date_input(
         "Select Date Range:",
@@ -605,13 +591,9 @@ def individual_users():
     st.sidebar.info(f"This user has valid date range is from {user_min_date.strftime('%b %d, %Y')} to {user_max_date.strftime('%b %d, %Y')}")
     
     if len(date_range) == 2:
-        user_df = merged_df[
-            (merged_df['Id'] == selected_user) & 
-            (merged_df['ActivityDate'] >= pd.to_datetime(date_range[0])) & 
-            (merged_df['ActivityDate'] <= pd.to_datetime(date_range[1]))
-        ]
+        user_df = user_partition(user_index, selected_user, date_range[0], date_range[1])
     else:
-        user_df = merged_df[merged_df['Id'] == selected_user]
+        user_df = user_partition(user_index, selected_user)
  
     total_steps = user_df['TotalSteps'].sum()
     total_calories = user_df['Calories'].sum()
@@ -625,7 +607,7 @@ def individual_users():
     average_distance = user_df['TotalDistance'].mean()
     average_intensive_minute = user_df['VeryActiveMinutes'].mean()
 
-    st.subheader(f":material/bar_chart: Highlights: User {selected_user_clean}")
+    st.subheader(f":material/bar_chart: Highlights: User {selected_user}")
 
     total_cols = st.columns(5) 
 
@@ -723,7 +705,7 @@ def individual_users():
     display_df.index = range(1, len(display_df) + 1)
     display_df.index.name = "Days"  
 
-    st.subheader(f":material/search: Detailed Stats: User {selected_user_clean}")
+    st.subheader(f":material/search: Detailed Stats: User {selected_user}")
     with st.expander(f"Click to Check"):
      st.dataframe(display_df)
     add_footer()
@@ -742,3 +724,10 @@ elif st.session_state.page == "Leaderboard":
     leaderboard_page(metrics_df, champions)
 elif st.session_state.page == "User Insights":
     individual_users()
+
+# --------------------------
+# Runtime metrics: the whole rerun (data loading included) per page, exported for scrapers
+record_timing("rerun", st.session_state.page, time.perf_counter() - rerun_started)
+write_prometheus_metrics()
+if admin_enabled():
+    show_metrics_panel()
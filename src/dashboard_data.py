@@ -0,0 +1,134 @@
+import pandas as pd
+import streamlit as st
+from database import pooled_connection, db_fingerprint, get_schema_version, SCHEMA_VERSION
+from snapshot import load_or_build_merged_data
+from dashboard_metrics import timed, record_cache_miss, record_frame_size
+from analysis import SQL_acquisition, day_to_datetime, compute_leader_metrics, get_leaderboard_windows, get_leaderboard, get_community_baseline, build_user_partitions
+
+# --------------------------
+# Cached data layer for the dashboard.
+# Every loader is keyed by the database fingerprint (path, mtime, size), so the
+# results are shared by all sessions of the process and rebuilt automatically
+# when fitbit_database.db is rewritten. max_entries=1 drops the stale version.
+# The dashboard only reads the database: migrating it is an explicit step
+# (Fitbit-main.py or `python database.py migrate`).
+# --------------------------
+
+@st.cache_data(max_entries=1, show_spinner=False)
+def _load_schema_version(db_path, fingerprint):
+    with pooled_connection(db_path) as conn:
+        return get_schema_version(conn)
+
+
+@st.cache_resource(max_entries=1, show_spinner="Loading Fitbit data...")
+def _load_merged_data(db_path, fingerprint):
+    # cache_resource like _load_user_partitions: cache_data would unpickle a fresh copy of the
+    # merged frames on every rerun of every session. The frames are shared, so pages only read them
+    record_cache_miss("load_merged_data")
+    with pooled_connection(db_path) as conn:
+        merged_df, user_summaries = load_or_build_merged_data(db_path, conn)
+
+    # merge_and_analyze_data reports failures by returning None; raise so the failure is not cached
+    if merged_df is None:
+        raise RuntimeError("merge_and_analyze_data returned no data")
+    record_frame_size("merged_df", merged_df)
+    return merged_df, user_summaries
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _load_user_partitions(db_path, fingerprint):
+    # cache_resource hands out the same object instead of a copy; the index is only read
+    record_cache_miss("load_user_partitions")
+    merged_df, _ = _load_merged_data(db_path, fingerprint)
+    return build_user_partitions(merged_df)
+
+
+@st.cache_data(max_entries=1, show_spinner=False)
+def _load_leader_metrics(db_path, fingerprint):
+    record_cache_miss("load_leader_metrics")
+    with pooled_connection(db_path) as conn:
+        return compute_leader_metrics(conn)
+
+
+@st.cache_data(max_entries=1, show_spinner=False)
+def _load_community_baseline(db_path, fingerprint):
+    # one frame of per-day community averages shared by every champion chart and session
+    record_cache_miss("load_community_baseline")
+    with pooled_connection(db_path) as conn:
+        return get_community_baseline(conn)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _load_champion_daily_data(db_path, fingerprint, user_id):
+    # the sleep states per day come from the daily_sleep_states rollup, so both sides of the
+    # join are primary-key/index range lookups on (Id, DayNumber) whatever the sleep history size
+    record_cache_miss("load_champion_daily_data")
+    champ_query = """
+        SELECT a.DayNumber, a.TotalSteps, a.TotalDistance, a.Calories,
+            a.VeryActiveMinutes, a.SedentaryMinutes,
+            COALESCE(s.AsleepMinutes, 0) AS AsleepMinutes,
+            COALESCE(s.RestlessMinutes, 0) AS RestlessMinutes,
+            COALESCE(s.AwakeMinutes, 0) AS AwakeMinutes
+        FROM daily_activity a
+        LEFT JOIN daily_sleep_states s ON s.Id = a.Id AND s.DayNumber = a.DayNumber
+        WHERE a.Id = ?
+        ORDER BY a.DayNumber
+    """
+    with pooled_connection(db_path) as conn:
+        champ_daily_df = SQL_acquisition(conn, champ_query, (user_id,))
+
+    champ_daily_df.insert(0, "ActivityDate", day_to_datetime(champ_daily_df.pop("DayNumber")).dt.date)
+    return champ_daily_df
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _load_leaderboard_windows(db_path, fingerprint, window, metric):
+    record_cache_miss("load_leaderboard_windows")
+    with pooled_connection(db_path) as conn:
+        return get_leaderboard_windows(conn, window, metric)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _load_leaderboard(db_path, fingerprint, window, metric, window_start, top_k):
+    record_cache_miss("load_leaderboard")
+    with pooled_connection(db_path) as conn:
+        return get_leaderboard(conn, window, metric, window_start, top_k)
+
+
+def _current_fingerprint(db_path):
+    # the loaders read the derived columns, rollups and leaderboards of the latest schema
+    fingerprint = db_fingerprint(db_path)
+    version = _load_schema_version(db_path, fingerprint)
+    if version < SCHEMA_VERSION:
+        st.error(f"The database is at schema version {version}, the dashboard needs version {SCHEMA_VERSION}. "
+                 "Migrate it first with `python database.py migrate` (or run `python Fitbit-main.py`).")
+        st.stop()
+    return fingerprint
+
+@timed("loader")
+def load_merged_data(db_path):
+    return _load_merged_data(db_path, _current_fingerprint(db_path))
+
+@timed("loader")
+def load_user_partitions(db_path):
+    return _load_user_partitions(db_path, _current_fingerprint(db_path))
+
+@timed("loader")
+def load_leader_metrics(db_path):
+    return _load_leader_metrics(db_path, _current_fingerprint(db_path))
+
+@timed("loader")
+def load_community_baseline(db_path):
+    return _load_community_baseline(db_path, _current_fingerprint(db_path))
+
+@timed("loader")
+def load_champion_daily_data(db_path, user_id):
+    return _load_champion_daily_data(db_path, _current_fingerprint(db_path), user_id)
+
+@timed("loader")
+def load_leaderboard_windows(db_path, window, metric):
+    return _load_leaderboard_windows(db_path, _current_fingerprint(db_path), window, metric)
+
+@timed("loader")
+def load_leaderboard(db_path, window, metric, window_start, top_k=10):
+    return _load_leaderboard(db_path, _current_fingerprint(db_path), window, metric, window_start, top_k)
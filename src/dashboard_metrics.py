@@ -0,0 +1,144 @@
+import os
+import time
+import bisect
+import functools
+import threading
+import pandas as pd
+import streamlit as st
+
+# --------------------------
+# Dashboard runtime metrics
+# @timed("page" | "chart" | "loader") times the page functions of dashboard.py, the chart functions
+# of dashboard_visualization.py and the loaders of dashboard_data.py; record_cache_miss() runs
+# inside the cached loader bodies, so every loader call that did not reach it was a cache hit.
+# The numbers live in this module for the whole server process (all sessions and reruns). After
+# every rerun write_prometheus_metrics() rewrites data/metrics/dashboard.prom in the Prometheus
+# text format (a node_exporter textfile collector or any local scraper can read it), and
+# ?admin=1 in the URL (or FITBIT_DASHBOARD_ADMIN=1) shows them in a sidebar panel.
+# --------------------------
+METRICS_FILE = os.environ.get("FITBIT_METRICS_FILE", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "metrics", "dashboard.prom"))
+
+# histogram buckets in seconds, from a cached chart to a cold merge of the whole database
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_timings = {}      # (kind, name) -> {"count", "sum", "last", "max", "buckets"}
+_cache_calls = {}  # loader -> {"calls", "misses"}
+_frame_bytes = {}  # frame name -> bytes in memory (deep)
+
+def record_timing(kind, name, seconds):
+    with _lock:
+        stats = _timings.setdefault((kind, name), {"count": 0, "sum": 0.0, "last": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)})
+        stats["count"] += 1
+        stats["sum"] += seconds
+        stats["last"] = seconds
+        stats["max"] = max(stats["max"], seconds)
+        # per-bucket counts; the exporter accumulates them into Prometheus' cumulative "le" buckets
+        position = bisect.bisect_left(BUCKETS, seconds)
+        if position < len(BUCKETS):
+            stats["buckets"][position] += 1
+
+def timed(kind):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_timing(kind, func.__name__, time.perf_counter() - start)
+                if kind == "loader":
+                    with _lock:
+                        _cache_calls.setdefault(func.__name__, {"calls": 0, "misses": 0})["calls"] += 1
+        return wrapper
+    return decorator
+
+def record_cache_miss(loader):
+    with _lock:
+        _cache_calls.setdefault(loader, {"calls": 0, "misses": 0})["misses"] += 1
+
+def record_frame_size(name, df):
+    # called where the frame is built (a cache miss), not on every rerun: deep=True walks every string
+    size = int(df.memory_usage(deep=True).sum())
+    with _lock:
+        _frame_bytes[name] = size
+
+def cache_hit_ratio(loader=None):
+    with _lock:
+        stats = [_cache_calls[loader]] if loader else list(_cache_calls.values())
+        calls = sum(entry["calls"] for entry in stats)
+        misses = sum(min(entry["misses"], entry["calls"]) for entry in stats)
+    return (calls - misses) / calls if calls else None
+
+def metrics_table():
+    with _lock:
+        rows = [{"kind": kind, "function": name, "calls": stats["count"],
+                 "mean ms": 1000 * stats["sum"] / stats["count"], "last ms": 1000 * stats["last"],
+                 "max ms": 1000 * stats["max"]} for (kind, name), stats in _timings.items()]
+    return pd.DataFrame(rows, columns=["kind", "function", "calls", "mean ms", "last ms", "max ms"]).sort_values(
+        ["kind", "mean ms"], ascending=[True, False], ignore_index=True)
+
+def _labels(**labels):
+    escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"') for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+def prometheus_text():
+    with _lock:
+        timings = {key: {**stats, "buckets": list(stats["buckets"])} for key, stats in _timings.items()}
+        cache_calls = {key: dict(stats) for key, stats in _cache_calls.items()}
+        frame_bytes = dict(_frame_bytes)
+
+    lines = ["# HELP fitbit_dashboard_seconds Time spent in dashboard page, chart and loader functions.",
+             "# TYPE fitbit_dashboard_seconds histogram"]
+    for (kind, name), stats in sorted(timings.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, stats["buckets"]):
+            cumulative += count
+            lines.append(f"fitbit_dashboard_seconds_bucket{_labels(kind=kind, function=name, le=bound)} {cumulative}")
+        lines.append(f"fitbit_dashboard_seconds_bucket{_labels(kind=kind, function=name, le='+Inf')} {stats['count']}")
+        lines.append(f"fitbit_dashboard_seconds_sum{_labels(kind=kind, function=name)} {stats['sum']:.6f}")
+        lines.append(f"fitbit_dashboard_seconds_count{_labels(kind=kind, function=name)} {stats['count']}")
+
+    lines += ["# HELP fitbit_dashboard_cache_requests_total Loader calls answered from the Streamlit cache (hit) or computed (miss).",
+              "# TYPE fitbit_dashboard_cache_requests_total counter"]
+    for loader, stats in sorted(cache_calls.items()):
+        misses = min(stats["misses"], stats["calls"])
+        lines.append(f"fitbit_dashboard_cache_requests_total{_labels(loader=loader, result='hit')} {stats['calls'] - misses}")
+        lines.append(f"fitbit_dashboard_cache_requests_total{_labels(loader=loader, result='miss')} {misses}")
+
+    lines += ["# HELP fitbit_dashboard_frame_bytes Memory used by the cached frames (pandas memory_usage(deep=True)).",
+              "# TYPE fitbit_dashboard_frame_bytes gauge"]
+    lines += [f"fitbit_dashboard_frame_bytes{_labels(frame=name)} {size}" for name, size in sorted(frame_bytes.items())]
+    return "\n".join(lines) + "\n"
+
+def write_prometheus_metrics(path=METRICS_FILE):
+    # written to a temporary file and renamed, so a scraper never reads half a file. Streamlit runs
+    # sessions as threads of one process, so the temporary name carries the thread id as well; a
+    # failed write is only reported, it must never break the page that triggered it
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(tmp_path, "w") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write the dashboard metrics to {path}: {e}")
+
+def admin_enabled():
+    return os.environ.get("FITBIT_DASHBOARD_ADMIN") == "1" or st.query_params.get("admin") == "1"
+
+def show_metrics_panel():
+    with st.sidebar.expander(":material/monitoring: Runtime metrics", expanded=False):
+        ratio = cache_hit_ratio()
+        col1, col2 = st.columns(2)
+        col1.metric("Cache hit ratio", "n/a" if ratio is None else f"{ratio:.0%}")
+        with _lock:
+            merged_bytes = _frame_bytes.get("merged_df")
+        if merged_bytes is None:
+            col2.metric("merged_df", "n/a")
+        else:
+            col2.metric("merged_df", f"{merged_bytes / 2**20:.1f} MB" if merged_bytes >= 2**20 else f"{merged_bytes / 2**10:.0f} KB")
+        st.dataframe(metrics_table(), hide_index=True, column_config={
+            column: st.column_config.NumberColumn(format="%.1f") for column in ("mean ms", "last ms", "max ms")})
+        st.caption(f"Prometheus metrics: {METRICS_FILE}")
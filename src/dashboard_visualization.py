@@ -3,7 +3,10 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
+from analysis import SQL_acquisition, day_to_datetime, get_community_baseline
+from dashboard_metrics import timed
 
+@timed("chart")
 def show_steps_plot(merged_df):
     daily_avg = merged_df.groupby("ActivityDate")["TotalSteps"].mean().reset_index()
     fig = px.line(daily_avg, x="ActivityDate", y="TotalSteps",
@@ -12,6 +15,7 @@ def show_steps_plot(merged_df):
                   template="plotly_dark")
     return fig
 
+@timed("chart")
 def show_calories_plot(merged_df):
     daily_calories = merged_df.groupby("ActivityDate")["Calories"].mean().reset_index()
     fig = px.line(daily_calories, x="ActivityDate", y="Calories",
@@ -20,10 +24,12 @@ def show_calories_plot(merged_df):
                   template="plotly_dark")
     return fig
 
+@timed("chart")
 def show_sleep_plot(merged_df):
-    merged_df["ActivityDate"] = pd.to_datetime(merged_df["ActivityDate"])
-    merged_df["SleepMinutes"] = merged_df["SleepMinutes"].fillna(0)
-    daily_sleep = merged_df.groupby("ActivityDate")["SleepMinutes"].mean().reset_index()
+    # merged_df is the shared cached frame, so the converted columns go into a new frame
+    sleep_df = merged_df.assign(ActivityDate=pd.to_datetime(merged_df["ActivityDate"]),
+                                SleepMinutes=merged_df["SleepMinutes"].fillna(0))
+    daily_sleep = sleep_df.groupby("ActivityDate")["SleepMinutes"].mean().reset_index()
     missing_dates = pd.date_range(start=daily_sleep["ActivityDate"].min(), end=daily_sleep["ActivityDate"].max())
     missing = set(missing_dates) - set(daily_sleep["ActivityDate"])
     if missing:
@@ -34,6 +40,7 @@ def show_sleep_plot(merged_df):
                   template="plotly_dark")
     return fig
 
+@timed("chart")
 def plot_step_distance_relationship(champ_daily_df):
     if champ_daily_df.empty:
         st.warning("No daily data available for this user.")
@@ -82,6 +89,7 @@ def plot_step_distance_relationship(champ_daily_df):
     )
     st.plotly_chart(fig)
 
+@timed("chart")
 def plot_calories_vs_activity(champ_daily_df):
     if champ_daily_df.empty:
         st.warning("No daily data available for this user.")
@@ -131,6 +139,7 @@ def plot_calories_vs_activity(champ_daily_df):
     )
     st.plotly_chart(fig)
 
+@timed("chart")
 def plot_sleep_distribution(champ_daily_df):
     required_cols = ['AsleepMinutes', 'RestlessMinutes', 'AwakeMinutes', 'SedentaryMinutes']
     if champ_daily_df.empty or not all(col in champ_daily_df for col in required_cols):
@@ -198,6 +207,7 @@ def plot_sleep_distribution(champ_daily_df):
     )
     st.plotly_chart(fig)
 
+@timed("chart")
 def plot_sleep_correlations(champ_daily_df):
     corr_df = champ_daily_df[['TotalSteps', 'TotalDistance', 'VeryActiveMinutes', 
                             'SedentaryMinutes', 'Calories', 'AsleepMinutes']]
@@ -225,6 +235,7 @@ def plot_sleep_correlations(champ_daily_df):
     fig.update_yaxes(showgrid=False)
     st.plotly_chart(fig)
 
+@timed("chart")
 def plot_sleep_efficiency(champ_daily_df):
     df = champ_daily_df.copy()
     
@@ -268,6 +279,7 @@ def plot_sleep_efficiency(champ_daily_df):
     
     st.plotly_chart(fig)
 
+@timed("chart")
 def plot_steps_vs_sleep(champ_daily_df):
     fig = go.Figure()
     
@@ -303,39 +315,33 @@ def plot_steps_vs_sleep(champ_daily_df):
     st.plotly_chart(fig)
     
 # Champion visualization functions for the leaderboard page
-def plot_steps_champion_chart(conn, user_id):
+# baseline is the per-day community frame from get_community_baseline (cached by dashboard_data);
+# the charts only query the champion's own days and join them against it.
+def _join_baseline(user_df, baseline, column):
+    user_df = user_df.sort_values('DayNumber')
+    user_df['ActivityDate'] = day_to_datetime(user_df['DayNumber'])
+    merged_df = user_df[['DayNumber', 'ActivityDate']].join(baseline[[column]], on='DayNumber')
+    return user_df, merged_df
+
+@timed("chart")
+def plot_steps_champion_chart(conn, user_id, baseline=None):
     """
     Plot bar chart for the Step Master showing total steps over time with average comparison
     """
     # Query for the selected user's data
-    user_query = f"""
+    user_query = """
         SELECT 
-            ActivityDate, 
+            DayNumber, 
             TotalSteps
         FROM daily_activity
-        WHERE Id = {user_id}
-        ORDER BY ActivityDate
+        WHERE Id = ?
+        ORDER BY DayNumber
     """
-    user_df = pd.read_sql(user_query, conn)
+    user_df = SQL_acquisition(conn, user_query, (user_id,))
     
-    # Query for all users' average data
-    avg_query = """
-        SELECT 
-            ActivityDate, 
-            AVG(TotalSteps) as AvgSteps
-        FROM daily_activity
-        GROUP BY ActivityDate
-        ORDER BY ActivityDate
-    """
-    avg_df = pd.read_sql(avg_query, conn)
-    
-    user_df['ActivityDate'] = pd.to_datetime(user_df['ActivityDate'])
-    avg_df['ActivityDate'] = pd.to_datetime(avg_df['ActivityDate'])
-    
-    user_df = user_df.sort_values('ActivityDate')
-    avg_df = avg_df.sort_values('ActivityDate')
-    
-    merged_df = pd.merge(user_df[['ActivityDate']], avg_df, on='ActivityDate', how='left')
+    if baseline is None:
+        baseline = get_community_baseline(conn)
+    user_df, merged_df = _join_baseline(user_df, baseline, 'AvgSteps')
     
     fig = go.Figure()
     
@@ -380,42 +386,26 @@ def plot_steps_champion_chart(conn, user_id):
     
     return fig
 
-def plot_distance_champion_chart(conn, user_id):
+@timed("chart")
+def plot_distance_champion_chart(conn, user_id, baseline=None):
     """
     Plot bar chart for the Distance Champion showing total distance over time with average comparison
     """
     # Query for the selected user's data
-    user_query = f"""
+    user_query = """
         SELECT 
-            ActivityDate, 
+            DayNumber, 
             TotalDistance
         FROM daily_activity
-        WHERE Id = {user_id}
-        ORDER BY ActivityDate
+        WHERE Id = ?
+        ORDER BY DayNumber
     """
-    user_df = pd.read_sql(user_query, conn)
+    user_df = SQL_acquisition(conn, user_query, (user_id,))
     
-    # Query for all users' average data
-    avg_query = """
-        SELECT 
-            ActivityDate, 
-            AVG(TotalDistance) as AvgDistance
-        FROM daily_activity
-        GROUP BY ActivityDate
-        ORDER BY ActivityDate
-    """
-    avg_df = pd.read_sql(avg_query, conn)
-    
-    # Convert dates to datetime
-    user_df['ActivityDate'] = pd.to_datetime(user_df['ActivityDate'])
-    avg_df['ActivityDate'] = pd.to_datetime(avg_df['ActivityDate'])
-    
-    # Sort both dataframes by date to ensure proper order
-    user_df = user_df.sort_values('ActivityDate')
-    avg_df = avg_df.sort_values('ActivityDate')
-    
-    # Align the average dataframe with user dataframe dates
-    merged_df = pd.merge(user_df[['ActivityDate']], avg_df, on='ActivityDate', how='left')
+    # Align the community average with the user's dates
+    if baseline is None:
+        baseline = get_community_baseline(conn)
+    user_df, merged_df = _join_baseline(user_df, baseline, 'AvgDistance')
     
     # Create plot
     fig = go.Figure()
@@ -464,35 +454,21 @@ def plot_distance_champion_chart(conn, user_id):
     
     return fig
 
-def plot_intensity_champion_chart(conn, user_id): 
+@timed("chart")
+def plot_intensity_champion_chart(conn, user_id, baseline=None):
     """Plot bar chart for the Activity King/Queen showing average intensity over time with average comparison"""
     
-    # Query for all hourly intensity data without filters
-    query = f"""
-    SELECT Id, ActivityHour, AverageIntensity 
-    FROM hourly_intensity 
-    ORDER BY ActivityHour
+    # The user's daily mean intensity from the daily_intensity rollup
+    query = """
+    SELECT DayNumber, AverageIntensity 
+    FROM daily_intensity 
+    WHERE Id = ?
     """
+    user_daily_df = SQL_acquisition(conn, query, (user_id,))
     
-    all_data = pd.read_sql(query, conn)
-    
-    all_data['ActivityHour'] = pd.to_datetime(all_data['ActivityHour'])
-    all_data['ActivityDate'] = all_data['ActivityHour'].dt.date
-    
-    user_data = all_data[all_data['Id'] == user_id].copy()
-    
-    user_daily_df = user_data.groupby('ActivityDate')['AverageIntensity'].mean().reset_index()
-    
-    avg_df = all_data.groupby('ActivityDate')['AverageIntensity'].mean().reset_index()
-    avg_df.rename(columns={'AverageIntensity': 'AvgIntensity'}, inplace=True)
-    
-    user_daily_df['ActivityDate'] = pd.to_datetime(user_daily_df['ActivityDate'])
-    avg_df['ActivityDate'] = pd.to_datetime(avg_df['ActivityDate'])
-    
-    user_daily_df = user_daily_df.sort_values('ActivityDate')
-    avg_df = avg_df.sort_values('ActivityDate')
-    
-    merged_df = pd.merge(user_daily_df[['ActivityDate']], avg_df, on='ActivityDate', how='left')
+    if baseline is None:
+        baseline = get_community_baseline(conn)
+    user_daily_df, merged_df = _join_baseline(user_daily_df, baseline, 'AvgIntensity')
     
     fig = go.Figure()
         
@@ -537,40 +513,26 @@ def plot_intensity_champion_chart(conn, user_id):
     
     return fig
 
-def plot_calories_champion_chart(conn, user_id):
+@timed("chart")
+def plot_calories_champion_chart(conn, user_id, baseline=None):
     """
     Plot bar chart for the Calorie Burner showing total calories over time with average comparison
     """
     
     # Query for the selected user's data
-    user_query = f"""
+    user_query = """
         SELECT 
-            ActivityDate, 
+            DayNumber, 
             Calories
         FROM daily_activity
-        WHERE Id = {user_id}
-        ORDER BY ActivityDate
+        WHERE Id = ?
+        ORDER BY DayNumber
     """
-    user_df = pd.read_sql(user_query, conn)
-    
-    # Query for all users' average data
-    avg_query = """
-        SELECT 
-            ActivityDate, 
-            AVG(Calories) as AvgCalories
-        FROM daily_activity
-        GROUP BY ActivityDate
-        ORDER BY ActivityDate
-    """
-    avg_df = pd.read_sql(avg_query, conn)
-    
-    user_df['ActivityDate'] = pd.to_datetime(user_df['ActivityDate'])
-    avg_df['ActivityDate'] = pd.to_datetime(avg_df['ActivityDate'])
-    
-    user_df = user_df.sort_values('ActivityDate')
-    avg_df = avg_df.sort_values('ActivityDate')
+    user_df = SQL_acquisition(conn, user_query, (user_id,))
     
-    merged_df = pd.merge(user_df[['ActivityDate']], avg_df, on='ActivityDate', how='left')
+    if baseline is None:
+        baseline = get_community_baseline(conn)
+    user_df, merged_df = _join_baseline(user_df, baseline, 'AvgCalories')
     
     
     fig = go.Figure()
@@ -620,6 +582,7 @@ def plot_calories_champion_chart(conn, user_id):
     return fig
 
 #----------------------------------------------------------------   
+@timed("chart")
 def plot_steps_trends(data):
     if data.empty:
         st.warning(" No step data available.")
@@ -662,6 +625,7 @@ def plot_steps_trends(data):
     st.plotly_chart(fig, use_container_width=True)
 
 
+@timed("chart")
 def plot_calories_trends(data):
     fig = px.histogram(
         data, 
@@ -692,6 +656,7 @@ def plot_calories_trends(data):
 
     st.plotly_chart(fig, use_container_width=True)
 
+@timed("chart")
 def plot_sleep_trends(data):
     if data.empty:
         st.warning("No sleep data available.")
@@ -736,6 +701,7 @@ def plot_sleep_trends(data):
     
     st.plotly_chart(fig, use_container_width=True)
 
+@timed("chart")
 def plot_activity_intensity(df):
     intensity_df = df[['VeryActiveMinutes', 'FairlyActiveMinutes', 'LightlyActiveMinutes', 'SedentaryMinutes']].sum().reset_index()
     intensity_df.columns = ['Activity Level', 'Minutes']
@@ -771,6 +737,7 @@ def plot_activity_intensity(df):
 
     st.plotly_chart(fig1, use_container_width=True)
 
+@timed("chart")
 def plot_heart_rate_trends(df):
     if 'ActivityDate' not in df.columns or 'HeartRate' not in df.columns:
         st.warning("No heart rate data available.")
@@ -807,6 +774,7 @@ def plot_heart_rate_trends(df):
     )
     st.plotly_chart(fig, use_container_width=True)
 
+@timed("chart")
 def plot_active_vs_sedentary(df):
     fig = px.scatter(
         df, 
@@ -825,6 +793,7 @@ def plot_active_vs_sedentary(df):
 
     st.plotly_chart(fig, use_container_width=True)
 
+@timed("chart")
 def plot_step_distribution_for_all_user(df):
     fig = px.histogram(
         df, 
@@ -847,6 +816,7 @@ def plot_step_distribution_for_all_user(df):
     )
     st.plotly_chart(fig, use_container_width=True)
 
+@timed("chart")
 def plot_steps_vs_calories(df):
     fig = px.scatter(
         df, 
@@ -865,6 +835,7 @@ def plot_steps_vs_calories(df):
 
     st.plotly_chart(fig, use_container_width=True)
 
+@timed("chart")
 def plot_sleep_vs_activity(df):
     fig = px.scatter(
         df, 
@@ -883,6 +854,7 @@ def plot_sleep_vs_activity(df):
 
     st.plotly_chart(fig, use_container_width=True)
 
+@timed("chart")
 def plot_individual_metrics(user_df):
     # 1. Calories Burned each day
     fig_calories = px.line(
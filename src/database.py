@@ -1,26 +1,505 @@
+import os
+import argparse
+import datetime
+import threading
 import sqlite3 as sql
+from contextlib import contextmanager
+from urllib.request import pathname2url
 import pandas as pd
+from profiling import profiled
 from analysis import SQL_acquisition, analyze_sleep_vs_activity, analyze_sleep_vs_sedentary, get_activity_by_time_blocks, calculate_time_block_averages, get_heart_rate_and_intensity, get_weather_and_daily_activity
 from visualization import plot_sleep_vs_activity, plot_sleep_vs_sedentary, plot_activity_by_time_blocks, plot_heart_rate_and_intensity_by_id, plot_weather_and_daily_activity
 
-def connect_db(db_name): 
-    return sql.connect(db_name)
+# Pragmas for read-heavy analytics: memory-mapped reads, a 64 MB page cache and in-memory temp b-trees
+ANALYTICS_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+def connect_db(db_name, read_only=False): 
+    # a larger statement cache keeps the compiled form of every parameterized query the app uses
+    if read_only:
+        # read-only URI mode for the dashboard; check_same_thread=False lets pooled connections
+        # move between Streamlit script threads (each one is only used by one thread at a time)
+        uri = f"file:{pathname2url(os.path.abspath(db_name))}?mode=ro"
+        connection = sql.connect(uri, uri=True, cached_statements=256, check_same_thread=False)
+    else:
+        connection = sql.connect(db_name, cached_statements=256)
+
+    for pragma, value in ANALYTICS_PRAGMAS.items():
+        connection.execute(f"PRAGMA {pragma}={value}")
+    return connection
+
+# Read-only connection pool shared by all dashboard sessions of the process.
+# A thread checks one connection out (nested checkouts in the same thread reuse it)
+# and hands it back to the idle list when done, so connections outlive single reruns.
+# The pool is keyed by the file's inode: an open connection keeps reading a database file
+# that was deleted or replaced (os.replace, synthetic_data.py), so once the path points to
+# a new file the idle connections to the old one are closed instead of handed out.
+_pool_lock = threading.Lock()
+_idle_connections = {}
+_checked_out = threading.local()
+
+def _pool_key(db_name):
+    stat = os.stat(db_name)
+    return os.path.abspath(db_name), stat.st_dev, stat.st_ino
+
+def _close_stale_connections(key):
+    # called with _pool_lock held; connections still checked out are closed when they come back
+    for stale_key in [other for other in _idle_connections if other[0] == key[0] and other != key]:
+        for connection in _idle_connections.pop(stale_key):
+            connection.close()
+
+@contextmanager
+def pooled_connection(db_name):
+    key = _pool_key(db_name)
+    held = _checked_out.__dict__.setdefault("connections", {})
+
+    if key in held:
+        connection, depth = held[key]
+        held[key] = (connection, depth + 1)
+    else:
+        with _pool_lock:
+            _close_stale_connections(key)
+            idle = _idle_connections.setdefault(key, [])
+            connection = idle.pop() if idle else None
+        if connection is None:
+            connection = connect_db(db_name, read_only=True)
+        held[key] = (connection, 1)
+
+    try:
+        yield connection
+    finally:
+        connection, depth = held[key]
+        if depth > 1:
+            held[key] = (connection, depth - 1)
+        else:
+            del held[key]
+            with _pool_lock:
+                if key in _idle_connections:
+                    _idle_connections[key].append(connection)
+                else:
+                    connection.close()
+
+def db_fingerprint(db_name):
+    # (path, mtime, size) changes whenever the database file is rewritten, so it is used as cache key.
+    # In WAL mode committed writes land in the -wal file first, so its stat is part of the key too
+    # (an empty -wal only means a connection is open and is ignored).
+    stat = os.stat(db_name)
+    wal_path = db_name + "-wal"
+    wal_stat = os.stat(wal_path) if os.path.exists(wal_path) else None
+    wal_key = (wal_stat.st_mtime_ns, wal_stat.st_size) if wal_stat and wal_stat.st_size > 0 else None
+    return os.path.abspath(db_name), stat.st_mtime_ns, stat.st_size, wal_key
     
+# --------------------------
+# Timestamp normalization
+# The raw tables store times as text ('4/12/2016 1:00:00 AM'). Every time-series table gets an
+# integer EpochSeconds column (seconds since 1970-01-01, naive local time) and an integer
+# DayNumber column (days since 1970-01-01), filled once so readers never parse strings again.
+# --------------------------
+TIMESTAMP_COLUMNS = {
+    "daily_activity": ("ActivityDate", "%m/%d/%Y"),
+    "heart_rate": ("Time", "%m/%d/%Y %I:%M:%S %p"),
+    "hourly_calories": ("ActivityHour", "%m/%d/%Y %I:%M:%S %p"),
+    "hourly_intensity": ("ActivityHour", "%m/%d/%Y %I:%M:%S %p"),
+    "hourly_steps": ("ActivityHour", "%m/%d/%Y %I:%M:%S %p"),
+    "minute_sleep": ("date", "%m/%d/%Y %I:%M:%S %p"),
+    "weight_log": ("Date", "%m/%d/%Y %I:%M:%S %p"),
+}
+
+def parse_timestamps_to_epoch(values, fmt):
+    parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+    # a few rows deviate from the table's format; only those fall back to the slow mixed parser
+    unparsed = parsed.isna() & values.notna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(values[unparsed], format="mixed", errors="coerce")
+    return (parsed - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+def add_epoch_columns(connection):
+    for table in TIMESTAMP_COLUMNS:
+        # sqlite3 commits ALTER TABLE on its own, so a rerun after a failed migration finds some columns already there
+        existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+        for column in ("EpochSeconds", "DayNumber"):
+            if column not in existing:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+        # stays empty once every row is filled; lets fill_epoch_columns find new rows without a scan
+        connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_epoch_missing ON {table} (Id) WHERE EpochSeconds IS NULL")
+    fill_epoch_columns(connection)
+
+@profiled
+def fill_epoch_columns(connection):
+    for table, (column, fmt) in TIMESTAMP_COLUMNS.items():
+        # parse each distinct timestamp once (heart_rate repeats the same string for every user)
+        raw = pd.read_sql(f"SELECT DISTINCT {column} AS raw FROM {table} WHERE EpochSeconds IS NULL", connection)
+        if raw.empty:
+            continue
+        raw["epoch"] = parse_timestamps_to_epoch(raw["raw"], fmt)
+        raw = raw.dropna(subset=["epoch"])
+
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS epoch_lookup (raw TEXT PRIMARY KEY, epoch INTEGER)")
+        connection.execute("DELETE FROM epoch_lookup")
+        connection.executemany("INSERT INTO epoch_lookup VALUES (?, ?)",
+                               zip(raw["raw"], raw["epoch"].astype("int64").tolist()))
+
+        # remember which (Id, day) pairs received new rows, so derived tables only recompute those days
+        if table in CHANGE_TRACKED_TABLES:
+            connection.execute(CREATE_CHANGED_DAYS)
+            connection.execute(f"""
+                INSERT OR IGNORE INTO changed_days (SourceTable, Id, DayNumber)
+                SELECT DISTINCT '{table}', t.Id, l.epoch / 86400
+                FROM {table} t JOIN epoch_lookup l ON l.raw = t.{column}
+                WHERE t.EpochSeconds IS NULL
+            """)
+
+        connection.execute(f"""
+            UPDATE {table}
+            SET EpochSeconds = (SELECT epoch FROM epoch_lookup WHERE raw = {table}.{column}),
+                DayNumber = (SELECT epoch / 86400 FROM epoch_lookup WHERE raw = {table}.{column})
+            WHERE EpochSeconds IS NULL
+        """)
+        print(f"Normalized timestamps of {table} ({len(raw)} distinct values).")
+
+# --------------------------
+# Daily rollups
+# The dashboard only needs daily granularity, so the large time-series tables are summarized
+# per (Id, DayNumber) inside the database. fill_epoch_columns() records the days that received
+# new raw rows in changed_days, and refresh_rollups() recomputes only those days.
+# --------------------------
+CREATE_CHANGED_DAYS = """
+    CREATE TABLE IF NOT EXISTS changed_days (
+        SourceTable TEXT, Id INTEGER, DayNumber INTEGER,
+        PRIMARY KEY (SourceTable, Id, DayNumber)
+    ) WITHOUT ROWID
+"""
+
+# rollup table -> (source table, column definitions, aggregate expressions in the same order)
+ROLLUPS = {
+    "daily_heart_rate": ("heart_rate",
+        "AvgHeartRate REAL, MinHeartRate INTEGER, MaxHeartRate INTEGER, HeartRateSamples INTEGER",
+        "AVG(s.Value), MIN(s.Value), MAX(s.Value), COUNT(*)"),
+    "daily_intensity": ("hourly_intensity",
+        "TotalIntensity INTEGER, AverageIntensity REAL, IntensityHours INTEGER",
+        "SUM(s.TotalIntensity), AVG(s.AverageIntensity), COUNT(*)"),
+    "daily_sleep_states": ("minute_sleep",
+        "AsleepMinutes INTEGER, RestlessMinutes INTEGER, AwakeMinutes INTEGER",
+        "SUM(s.value = 1), SUM(s.value = 2), SUM(s.value = 3)"),
+    "daily_hourly_steps": ("hourly_steps",
+        "StepTotal INTEGER, StepHours INTEGER",
+        "SUM(s.StepTotal), COUNT(*)"),
+}
+
+def create_rollup_tables(connection):
+    connection.execute(CREATE_CHANGED_DAYS)
+    for rollup, (source, columns, _) in ROLLUPS.items():
+        connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {rollup} (
+                Id INTEGER, DayNumber INTEGER, {columns},
+                PRIMARY KEY (Id, DayNumber)
+            ) WITHOUT ROWID
+        """)
+        # first build: every existing day of the source counts as changed
+        connection.execute(f"""
+            INSERT OR IGNORE INTO changed_days (SourceTable, Id, DayNumber)
+            SELECT DISTINCT '{source}', Id, DayNumber FROM {source} WHERE DayNumber IS NOT NULL
+        """)
+    refresh_rollups(connection)
+
+@profiled
+def refresh_rollups(connection):
+    for rollup, (source, _, aggregates) in ROLLUPS.items():
+        pending = connection.execute("SELECT COUNT(*) FROM changed_days WHERE SourceTable = ?", (source,)).fetchone()[0]
+        if pending == 0:
+            continue
+
+        connection.execute(f"""
+            DELETE FROM {rollup}
+            WHERE (Id, DayNumber) IN (SELECT Id, DayNumber FROM changed_days WHERE SourceTable = ?)
+        """, (source,))
+        # the day is turned into an EpochSeconds range so the (Id, EpochSeconds) index drives the scan
+        connection.execute(f"""
+            INSERT INTO {rollup}
+            SELECT c.Id, c.DayNumber, {aggregates}
+            FROM changed_days c
+            JOIN {source} s
+              ON s.Id = c.Id
+             AND s.EpochSeconds >= c.DayNumber * 86400
+             AND s.EpochSeconds < (c.DayNumber + 1) * 86400
+            WHERE c.SourceTable = ?
+            GROUP BY c.Id, c.DayNumber
+        """, (source,))
+        if rollup in CHANGE_TRACKED_TABLES:
+            # tables derived from this rollup (the leaderboards) pick up the same days under its name
+            connection.execute("""
+                INSERT OR IGNORE INTO changed_days (SourceTable, Id, DayNumber)
+                SELECT ?, Id, DayNumber FROM changed_days WHERE SourceTable = ?
+            """, (rollup, source))
+        connection.execute("DELETE FROM changed_days WHERE SourceTable = ?", (source,))
+        print(f"Refreshed {rollup} for {pending} changed days.")
+
+# --------------------------
+# Time-window leaderboards
+# Per-user totals of every leaderboard metric are ranked for each calendar week, calendar month
+# and rolling N-day window, and stored in leaderboard_ranks. Rolling windows are only ranked
+# when daily_activity covers every one of their days; calendar windows rank the days they have.
+# Only windows containing a day listed in changed_days are recomputed, so the dashboard switches
+# windows with an indexed lookup.
+# --------------------------
+
+# metric -> (daily table, column summed over the window)
+LEADERBOARD_METRICS = {
+    "TotalSteps": ("daily_activity", "TotalSteps"),
+    "TotalDistance": ("daily_activity", "TotalDistance"),
+    "Calories": ("daily_activity", "Calories"),
+    "VeryActiveMinutes": ("daily_activity", "VeryActiveMinutes"),
+    "AsleepMinutes": ("daily_sleep_states", "AsleepMinutes"),
+    "TotalIntensity": ("daily_intensity", "TotalIntensity"),
+}
+
+# window -> number of days for rolling windows, None for calendar windows
+LEADERBOARD_WINDOWS = {
+    "week": None,
+    "month": None,
+    "rolling7": 7,
+    "rolling30": 30,
+}
+
+LEADERBOARD_SOURCES = {table for table, _ in LEADERBOARD_METRICS.values()}
+
+CHANGE_TRACKED_TABLES = {source for source, _, _ in ROLLUPS.values()} | LEADERBOARD_SOURCES
+
+def windows_containing(window, day_number):
+    # (WindowStart, WindowEnd) DayNumbers of every window of this type that contains the day
+    days = LEADERBOARD_WINDOWS[window]
+    if days is not None:
+        return [(start, start + days - 1) for start in range(day_number - days + 1, day_number + 1)]
+    if window == "week":
+        start = day_number - (day_number + 3) % 7  # day 0 (1970-01-01) was a Thursday
+        return [(start, start + 6)]
+
+    epoch = datetime.date(1970, 1, 1)
+    date = epoch + datetime.timedelta(days=day_number)
+    first = date.replace(day=1)
+    next_first = (first + datetime.timedelta(days=32)).replace(day=1)
+    return [((first - epoch).days, (next_first - epoch).days - 1)]
+
+def create_leaderboard_tables(connection):
+    connection.execute(CREATE_CHANGED_DAYS)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS leaderboard_ranks (
+            WindowType TEXT, Metric TEXT, WindowStart INTEGER, WindowEnd INTEGER,
+            Rank INTEGER, Id INTEGER, Value REAL,
+            PRIMARY KEY (WindowType, Metric, WindowStart, Rank, Id)
+        ) WITHOUT ROWID
+    """)
+    # first build: every existing day of the metric tables counts as changed
+    for table in LEADERBOARD_SOURCES:
+        connection.execute(f"""
+            INSERT OR IGNORE INTO changed_days (SourceTable, Id, DayNumber)
+            SELECT DISTINCT '{table}', Id, DayNumber FROM {table} WHERE DayNumber IS NOT NULL
+        """)
+    refresh_leaderboards(connection)
+
+@profiled
+def refresh_leaderboards(connection):
+    # a rolling window is only ranked when the data covers all of its days, from its first to its last
+    first_day, last_day = connection.execute("SELECT MIN(DayNumber), MAX(DayNumber) FROM daily_activity").fetchone()
+    rolling = [window for window, days in LEADERBOARD_WINDOWS.items() if days is not None]
+    if first_day is not None:
+        # drops partly covered windows ranked before this check existed
+        connection.execute(f"""
+            DELETE FROM leaderboard_ranks
+            WHERE WindowType IN ({", ".join("?" * len(rolling))}) AND (WindowStart < ? OR WindowEnd > ?)
+        """, (*rolling, first_day, last_day))
+
+    placeholders = ", ".join("?" * len(LEADERBOARD_SOURCES))
+    changed = [row[0] for row in connection.execute(
+        f"SELECT DISTINCT DayNumber FROM changed_days WHERE SourceTable IN ({placeholders})",
+        tuple(LEADERBOARD_SOURCES))]
+    if not changed:
+        return
+
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS affected_windows (WindowStart INTEGER PRIMARY KEY, WindowEnd INTEGER)")
+
+    for window, days in LEADERBOARD_WINDOWS.items():
+        affected = {bounds for day in changed for bounds in windows_containing(window, day)}
+        if days is not None:
+            affected = {(start, end) for start, end in affected if start >= first_day and end <= last_day}
+        connection.execute("DELETE FROM affected_windows")
+        connection.executemany("INSERT INTO affected_windows VALUES (?, ?)", sorted(affected))
+
+        for metric, (table, column) in LEADERBOARD_METRICS.items():
+            connection.execute("""
+                DELETE FROM leaderboard_ranks
+                WHERE WindowType = ? AND Metric = ? AND WindowStart IN (SELECT WindowStart FROM affected_windows)
+            """, (window, metric))
+            connection.execute(f"""
+                INSERT INTO leaderboard_ranks (WindowType, Metric, WindowStart, WindowEnd, Rank, Id, Value)
+                SELECT ?, ?, w.WindowStart, w.WindowEnd,
+                       RANK() OVER (PARTITION BY w.WindowStart ORDER BY SUM(t.{column}) DESC),
+                       t.Id, SUM(t.{column})
+                FROM affected_windows w
+                JOIN {table} t ON t.DayNumber BETWEEN w.WindowStart AND w.WindowEnd
+                GROUP BY w.WindowStart, t.Id
+            """, (window, metric))
+
+    connection.execute(f"DELETE FROM changed_days WHERE SourceTable IN ({placeholders})", tuple(LEADERBOARD_SOURCES))
+    print(f"Refreshed leaderboards for {len(changed)} changed days.")
+
+# --------------------------
+# Schema migrations
+# Each migration is (version, description, steps); a step is SQL text or a function taking the
+# connection. PRAGMA user_version records the last applied version, so migrate_db() is cheap to
+# call on every start and only runs what is missing.
+# --------------------------
+MIGRATIONS = [
+    (1, "covering index on (Id, logId) for the sleep duration per log", [
+        # the per-user time-series indexes are keyed by the integer columns of migration 2 instead
+        "CREATE INDEX IF NOT EXISTS idx_minute_sleep_id_log ON minute_sleep (Id, logId, date, value)",
+    ]),
+    (2, "integer EpochSeconds/DayNumber columns and covering indexes on (Id, time) and (day)", [
+        add_epoch_columns,
+        # per-user daily lookups (champion pages, leader metrics) and the per-date community averages
+        "CREATE INDEX IF NOT EXISTS idx_daily_activity_id_day ON daily_activity "
+        "(Id, DayNumber, TotalSteps, TotalDistance, Calories, VeryActiveMinutes, SedentaryMinutes)",
+        "CREATE INDEX IF NOT EXISTS idx_daily_activity_day ON daily_activity "
+        "(DayNumber, TotalSteps, TotalDistance, Calories, VeryActiveMinutes, FairlyActiveMinutes, LightlyActiveMinutes)",
+        "CREATE INDEX IF NOT EXISTS idx_heart_rate_id_epoch ON heart_rate (Id, EpochSeconds, Value)",
+        "CREATE INDEX IF NOT EXISTS idx_hourly_calories_id_epoch ON hourly_calories (Id, EpochSeconds, Calories)",
+        "CREATE INDEX IF NOT EXISTS idx_hourly_intensity_id_epoch ON hourly_intensity "
+        "(Id, EpochSeconds, TotalIntensity, AverageIntensity)",
+        "CREATE INDEX IF NOT EXISTS idx_hourly_steps_id_epoch ON hourly_steps (Id, EpochSeconds, StepTotal)",
+        "CREATE INDEX IF NOT EXISTS idx_minute_sleep_id_epoch ON minute_sleep (Id, EpochSeconds, value)",
+        "CREATE INDEX IF NOT EXISTS idx_weight_log_id_day ON weight_log (Id, DayNumber, WeightKg, BMI)",
+    ]),
+    (3, "daily rollup tables of heart rate, intensity, sleep states and hourly steps", [
+        create_rollup_tables,
+    ]),
+    (4, "ranked leaderboards per calendar week, month and rolling window", [
+        create_leaderboard_tables,
+    ]),
+]
+
+# schema version of a fully migrated database; readers such as the dashboard check it instead of migrating
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Run after the migrations on every migrate_db() call to keep derived data in sync with new raw rows
+MAINTENANCE_STEPS = [
+    fill_epoch_columns,
+    refresh_rollups,
+    refresh_leaderboards,
+]
+
+# Representative queries of the code base, used to show the query plans before and after migrating
+PLAN_QUERIES = {
+    "daily activity of one user": ("SELECT DayNumber, TotalSteps, TotalDistance, Calories, VeryActiveMinutes, SedentaryMinutes "
+                                   "FROM daily_activity WHERE Id = ? ORDER BY DayNumber", (1503960366,)),
+    "community average per date": ("SELECT DayNumber, AVG(TotalSteps) FROM daily_activity GROUP BY DayNumber", ()),
+    "heart rate of one user": ("SELECT EpochSeconds, Value FROM heart_rate WHERE Id = ?", (1503960366,)),
+    "hourly intensity of one user": ("SELECT EpochSeconds, TotalIntensity FROM hourly_intensity WHERE Id = ?", (1503960366,)),
+    "average intensity per user": ("SELECT Id, AVG(TotalIntensity) FROM hourly_intensity GROUP BY Id", ()),
+    "sleep of one user": ("SELECT EpochSeconds, value FROM minute_sleep WHERE Id = ?", (1503960366,)),
+    "daily sleep states of one user": ("SELECT a.DayNumber, s.AsleepMinutes FROM daily_activity a LEFT JOIN daily_sleep_states s "
+                                       "ON s.Id = a.Id AND s.DayNumber = a.DayNumber WHERE a.Id = ?", (1503960366,)),
+    "sleep duration per log": ("SELECT Id, logId, COUNT(*) FROM minute_sleep GROUP BY Id, logId", ()),
+    "leaderboard of one window": ("SELECT Rank, Id, Value FROM leaderboard_ranks WHERE WindowType = ? AND Metric = ? "
+                                  "AND WindowStart = ? AND Rank <= ? ORDER BY Rank, Id", ("week", "TotalSteps", 16874, 10)),
+}
+
+# The same lookups as the code ran them before the migrations: text dates and times, raw tables
+# instead of the rollups and the leaderboard table. migrate_db explains these for its "before"
+# plans, because the columns and tables of PLAN_QUERIES do not exist yet on a raw database.
+LEGACY_PLAN_QUERIES = {
+    "daily activity of one user": ("SELECT ActivityDate, TotalSteps, TotalDistance, Calories, VeryActiveMinutes, SedentaryMinutes "
+                                   "FROM daily_activity WHERE Id = ? ORDER BY ActivityDate", (1503960366,)),
+    "community average per date": ("SELECT ActivityDate, AVG(TotalSteps) FROM daily_activity GROUP BY ActivityDate", ()),
+    "heart rate of one user": ("SELECT Time, Value FROM heart_rate WHERE Id = ?", (1503960366,)),
+    "hourly intensity of one user": ("SELECT ActivityHour, TotalIntensity FROM hourly_intensity WHERE Id = ?", (1503960366,)),
+    "average intensity per user": ("SELECT Id, AVG(TotalIntensity) FROM hourly_intensity GROUP BY Id", ()),
+    "sleep of one user": ("SELECT date, value FROM minute_sleep WHERE Id = ?", (1503960366,)),
+    "daily sleep states of one user": ("SELECT date, value FROM minute_sleep WHERE Id = ?", (1503960366,)),
+    "sleep duration per log": ("SELECT Id, logId, COUNT(*) FROM minute_sleep GROUP BY Id, logId", ()),
+    "leaderboard of one window": ("SELECT Id, SUM(TotalSteps) AS Value FROM daily_activity WHERE ActivityDate IN (?, ?, ?, ?, ?, ?, ?) "
+                                  "GROUP BY Id ORDER BY Value DESC LIMIT ?",
+                                  (*[f"3/{day}/2016" for day in range(14, 21)], 10)),
+}
+
+def get_schema_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+@profiled
+def explain_query_plans(connection, queries=PLAN_QUERIES):
+    plans = {}
+    for name, (query, params) in queries.items():
+        try:
+            rows = connection.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            plans[name] = [row[-1] for row in rows]
+        except sql.Error as e:
+            plans[name] = [f"error: {e}"]
+    return plans
+
+def print_query_plans(before, after):
+    for name in after:
+        print(f"\n{name}:")
+        print("  before: " + " | ".join(before.get(name, [])))
+        print("  after:  " + " | ".join(after[name]))
+
+@profiled
+def migrate_db(db_name, show_plans=False):
+    connection = connect_db(db_name)
+    try:
+        # WAL is persistent in the file, so it is switched on once here rather than on every connection;
+        # afterwards the dashboard's readers never block on a writer
+        connection.execute("PRAGMA journal_mode=WAL")
+        current_version = get_schema_version(connection)
+        pending = [migration for migration in MIGRATIONS if migration[0] > current_version]
+        plans_before = explain_query_plans(connection, LEGACY_PLAN_QUERIES) if show_plans and pending else None
+
+        for version, description, steps in pending:
+            print(f"Applying migration {version}: {description}")
+            with connection:
+                for step in steps:
+                    if callable(step):
+                        step(connection)
+                    else:
+                        connection.execute(step)
+                connection.execute(f"PRAGMA user_version = {version}")
+
+        with connection:
+            for step in MAINTENANCE_STEPS:
+                step(connection)
+
+        if not pending:
+            print(f"Database schema is up to date (version {current_version}).")
+            return current_version
+
+        # refresh the planner statistics so the new indexes are actually picked
+        connection.execute("ANALYZE")
+
+        if show_plans:
+            print_query_plans(plans_before, explain_query_plans(connection))
+        return get_schema_version(connection)
+    finally:
+        connection.close()
+
 # lala's dashboard new helper funtion
+@profiled
 def get_unique_user_ids(connection):
     query = "SELECT DISTINCT Id FROM daily_activity"
     cursor = connection.cursor()
     cursor.execute(query)
     return sorted([str(row[0]) for row in cursor.fetchall()])
 
+@profiled
 def verify_total_steps(df, connection):
-    df_database = SQL_acquisition(connection, f"SELECT Id, sum(StepTotal) AS total_steps FROM hourly_steps GROUP BY Id")
+    df_database = SQL_acquisition(connection, "SELECT Id, sum(StepTotal) AS total_steps FROM hourly_steps GROUP BY Id")
     df_csv = df.groupby('Id')['TotalSteps'].sum().reset_index()
 
     identical = df_database['total_steps'].equals(df_csv['TotalSteps'])
     print("If the total steps in csv file is indentical as in database?:", identical)
     
 
+@profiled
 def compute_sleep_duration(connection):
     query = """
         SELECT Id, logId, COUNT(*) AS SleepDuration
@@ -34,37 +513,53 @@ def compute_sleep_duration(connection):
         print("No sleep data found in database.")
         return pd.DataFrame()
     
-    df_sleep["logId"] = df_sleep["logId"].astype(str)
-    df_sleep["Id"] = df_sleep["Id"].astype(str)
     print("Computed Sleep Duration per User and Session:")
 
     return df_sleep
 
 
+@profiled
 def sleep_vs_activity(connection):
     df_merged, model = analyze_sleep_vs_activity(connection)
     plot_sleep_vs_activity(df_merged)
 
 
+@profiled
 def sleep_vs_sedentary(connection):
     df_merged, model = analyze_sleep_vs_sedentary(connection)
     print(model.summary())
     plot_sleep_vs_sedentary(df_merged)
         
 
-def activity_by_time_blocks_from_db(connection):
-    hourly_steps_df, hourly_calories_df, minute_sleep_df = get_activity_by_time_blocks(connection)
-    avg_steps, avg_calories, avg_sleep, labels = calculate_time_block_averages(hourly_steps_df, hourly_calories_df, minute_sleep_df)
-    plot_activity_by_time_blocks(avg_steps, avg_calories, avg_sleep, labels)
+@profiled
+def activity_by_time_blocks_from_db(connection, block_hours=4):
+    hourly_steps_df, hourly_calories_df, minute_sleep_df = get_activity_by_time_blocks(connection, block_hours)
+    avg_steps, avg_calories, avg_sleep, labels = calculate_time_block_averages(hourly_steps_df, hourly_calories_df, minute_sleep_df, block_hours)
+    plot_activity_by_time_blocks(avg_steps, avg_calories, avg_sleep, labels, block_hours)
     
 
 
+@profiled
 def heart_rate_and_intensity_by_id(connection, user_id):
     heart_rate_df, hourly_intensity_df = get_heart_rate_and_intensity(connection, user_id)
     plot_heart_rate_and_intensity_by_id(heart_rate_df, hourly_intensity_df, user_id)
-   
 
+
+@profiled
 def discover_weather_impact(connection, CHICAGO_WEATHER):
     df_weather = pd.read_csv(CHICAGO_WEATHER)  
     df_final_activity, df_final_distance, df_final_steps = get_weather_and_daily_activity(connection, df_weather)
     plot_weather_and_daily_activity(df_final_activity, df_final_distance, df_final_steps)
+
+if __name__ == '__main__':
+    default_db = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "fitbit_database.db")
+
+    parser = argparse.ArgumentParser(description="Fitbit database maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="apply pending schema migrations (indexes, derived columns)")
+    migrate_parser.add_argument("--db", default=default_db, help="path to fitbit_database.db")
+    migrate_parser.add_argument("--no-plans", action="store_true", help="skip the before/after EXPLAIN QUERY PLAN report")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate_db(args.db, show_plans=not args.no_plans)
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import sys
+import pickle
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+import matplotlib.pyplot as plt
+
+# --------------------------
+# Headless figure export
+# Inside headless_export() every plt.show() call of the pipeline (visualization.py, analysis.py, ...)
+# stops blocking: the open figures are pickled and handed to a process pool, where each one is
+# rendered to PNG/SVG with the non-interactive Agg backend while the pipeline keeps going.
+# A manifest.json lists every output file with the time its worker spent rendering it.
+# --------------------------
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "figures")
+EXPORT_FORMATS = ("png", "svg")
+
+def render_figure(payload, path_stem, formats, dpi):
+    # runs in a worker process (or in the main process for figures that cannot be pickled)
+    matplotlib.use("Agg")
+    start = time.perf_counter()
+    fig = pickle.loads(payload) if isinstance(payload, bytes) else payload
+    files = []
+    for fmt in formats:
+        path = f"{path_stem}.{fmt}"
+        fig.savefig(path, format=fmt, dpi=dpi, bbox_inches="tight")
+        files.append(path)
+    plt.close(fig)
+    return files, time.perf_counter() - start
+
+def _figure_title(fig):
+    titles = [fig._suptitle.get_text()] if fig._suptitle is not None else []
+    titles += [ax.get_title() for ax in fig.axes]
+    return next((title for title in titles if title), "")
+
+def _export_open_figures(state):
+    # the function that called plt.show() names the files, e.g. 03_plot_workout.png
+    source = sys._getframe(2).f_code.co_name
+    for number in plt.get_fignums():
+        fig = plt.figure(number)
+        state["count"] += 1
+        name = f"{state['count']:02d}_{source}"
+        entry = {"name": name, "source": source, "title": _figure_title(fig)}
+        path_stem = os.path.join(state["output_dir"], name)
+
+        try:
+            payload = pickle.dumps(fig)
+        except Exception as e:
+            # a few artists (e.g. lambdas in formatters) do not pickle; render those right here
+            print(f"Rendering {name} in the main process ({e}).")
+            entry["files"], entry["render_seconds"] = render_figure(fig, path_stem, state["formats"], state["dpi"])
+            state["entries"].append(entry)
+            continue
+
+        entry["future"] = state["pool"].submit(render_figure, payload, path_stem, state["formats"], state["dpi"])
+        state["entries"].append(entry)
+        plt.close(fig)
+
+@contextmanager
+def headless_export(output_dir=EXPORT_DIR, formats=EXPORT_FORMATS, workers=None, dpi=100):
+    os.makedirs(output_dir, exist_ok=True)
+    # the whole process stays on Agg afterwards; there is no display to return to in a batch run
+    previous_show = plt.show
+    plt.switch_backend("Agg")
+
+    started = time.perf_counter()
+    state = {"output_dir": output_dir, "formats": tuple(formats), "dpi": dpi, "count": 0, "entries": []}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        state["pool"] = pool
+        plt.show = lambda *args, **kwargs: _export_open_figures(state)
+        try:
+            yield state
+        finally:
+            plt.show = previous_show
+            for entry in state["entries"]:
+                if "future" in entry:
+                    entry["files"], entry["render_seconds"] = entry.pop("future").result()
+
+    manifest = {
+        "formats": list(state["formats"]),
+        "total_seconds": time.perf_counter() - started,
+        "figures": state["entries"],
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Exported {len(state['entries'])} figures to {output_dir}")
@@ -0,0 +1,204 @@
+import os
+import time
+import pickle
+import hashlib
+import inspect
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from database import pooled_connection, db_fingerprint
+
+# --------------------------
+# Stage graph runner
+# A pipeline is a dict of named stages; each stage is an existing function plus its arguments,
+# where ref("name") stands for the output of another stage or a source (input file path).
+# Stages whose inputs are ready run concurrently on a thread pool, so independent branches
+# (the CSV branch and the database branch of Fitbit-main.py) overlap. Plotting stages run one
+# at a time on the main thread: pyplot state is global and GUI backends need the main thread.
+#
+# Every stage output is cached in data/pipeline_cache/<stage>.pkl under a key hashed from the
+# source of the function and of every src/ function, class and constant it references, followed
+# transitively (so edits to helpers such as SQL_acquisition, the schema registry or SQL constants
+# count too), its literal arguments and the content hashes of its inputs. A rerun loads every stage
+# whose key still matches, so editing a function only recomputes the stages that reach it and
+# those downstream. Plotting stages and stages that return nothing (reports that only print) are
+# side effects and run every time, on top of the cached inputs.
+# --------------------------
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(os.path.dirname(SOURCE_DIR), "data", "pipeline_cache")
+
+Ref = namedtuple("Ref", ["name", "item"])
+
+def ref(name, item=None):
+    # item selects one element of a stage that returns a tuple, e.g. ref("merged", 0)
+    return Ref(name, item)
+
+def stage(func, *args, connection=False, plots=False, **kwargs):
+    # connection=True passes a pooled read-only connection as connection=...;
+    # plots=True marks stages that draw with pyplot
+    return {"func": func, "args": args, "kwargs": kwargs, "connection": connection, "plots": plots}
+
+def _hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def source_hash(value):
+    # database files are keyed by their fingerprint (hashing them would read the whole file),
+    # other files by their content, everything else by its pickled form
+    if isinstance(value, str) and os.path.isfile(value):
+        if value.endswith(".db"):
+            return _hash_bytes(repr(db_fingerprint(value)).encode())
+        with open(value, "rb") as f:
+            return _hash_bytes(f.read())
+    return _hash_bytes(pickle.dumps(value))
+
+def _in_source_dir(value):
+    path = getattr(inspect.getmodule(value), "__file__", None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == SOURCE_DIR
+
+def _source(value):
+    try:
+        return inspect.getsource(value)
+    except (OSError, TypeError):
+        return ""
+
+def _code_names(code):
+    # global and attribute names of a function, including its lambdas, comprehensions and nested functions
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            names |= _code_names(constant)
+    return names
+
+def _references(func, found):
+    # source of func and of every src/ function, class and UPPER_CASE constant it references, transitively;
+    # decorated functions (@profiled) are followed to the function they wrap
+    func = inspect.unwrap(func)
+    key = f"{func.__module__}.{func.__qualname__}"
+    if key in found:
+        return found
+    found[key] = _source(func)
+    functions = [func] if inspect.isfunction(func) else \
+        [inspect.unwrap(member) for member in vars(func).values() if inspect.isfunction(inspect.unwrap(member))]
+
+    for function in functions:
+        names = _code_names(function.__code__)
+        namespaces = [function.__globals__]
+        # "schema.apply_schema" uses both names: the module's own names are searched as well
+        namespaces += [vars(value) for name, value in function.__globals__.items()
+                       if name in names and inspect.ismodule(value) and _in_source_dir(value)]
+        for namespace in namespaces:
+            for name in sorted(names & namespace.keys()):
+                value = namespace[name]
+                if (inspect.isfunction(value) or inspect.isclass(value)) and _in_source_dir(inspect.unwrap(value)):
+                    _references(value, found)
+                elif name.isupper() and not callable(value) and not inspect.ismodule(value):
+                    found[f"{namespace['__name__']}.{name}"] = repr(value)
+    return found
+
+def function_hash(func):
+    # an edit to a function only changes the key of the stages that reach it, not of every
+    # stage whose module happens to import the edited module
+    found = _references(func, {})
+    return _hash_bytes("\n".join(f"{key}:{source}" for key, source in sorted(found.items())).encode())
+
+def _dependencies(spec):
+    return [value.name for value in (*spec["args"], *spec["kwargs"].values()) if isinstance(value, Ref)]
+
+def _resolve(value, results, hashes):
+    # returns (argument value, hash of the argument); DataFrames are copied because several
+    # stages read them at the same time and some functions add columns in place
+    if not isinstance(value, Ref):
+        return value, repr(value)
+    resolved = results[value.name] if value.item is None else results[value.name][value.item]
+    if isinstance(resolved, pd.DataFrame):
+        resolved = resolved.copy()
+    return resolved, f"{hashes[value.name]}[{value.item}]"
+
+def _load_cached(name, key, cache_dir):
+    path = os.path.join(cache_dir, f"{name}.pkl")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            cached = pickle.load(f)
+    except Exception:
+        return None
+    return cached if cached["key"] == key else None
+
+def _run_stage(name, spec, args, kwargs, key, sources, cache_dir, use_cache):
+    if use_cache and not spec["plots"]:
+        cached = _load_cached(name, key, cache_dir)
+        if cached is not None:
+            print(f"[pipeline] {name}: cached")
+            return cached["output"], cached["output_hash"]
+
+    start = time.perf_counter()
+    if spec["connection"]:
+        with pooled_connection(sources["db"]) as connection:
+            output = spec["func"](*args, connection=connection, **kwargs)
+    else:
+        output = spec["func"](*args, **kwargs)
+    print(f"[pipeline] {name}: ran in {time.perf_counter() - start:.2f}s")
+
+    if output is None:
+        return output, key
+    try:
+        payload = pickle.dumps(output)
+    except Exception:
+        # outputs that cannot be pickled are passed on but not cached
+        return output, key
+    output_hash = _hash_bytes(payload)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = os.path.join(cache_dir, f"{name}.pkl.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"key": key, "output_hash": output_hash, "output": output}, f)
+    os.replace(tmp_path, os.path.join(cache_dir, f"{name}.pkl"))
+    return output, output_hash
+
+def run_pipeline(stages, sources, cache_dir=CACHE_DIR, workers=4, use_cache=True):
+    results = dict(sources)
+    hashes = {name: source_hash(value) for name, value in sources.items()}
+    pending = dict(stages)
+    running = {}
+
+    for name, spec in stages.items():
+        missing = [dep for dep in _dependencies(spec) if dep not in stages and dep not in sources]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages {missing}")
+
+    def prepare(name, spec):
+        args = [_resolve(value, results, hashes) for value in spec["args"]]
+        kwargs = {arg: _resolve(value, results, hashes) for arg, value in spec["kwargs"].items()}
+        key = _hash_bytes(repr([
+            function_hash(spec["func"]),
+            [value_hash for _, value_hash in args],
+            sorted((arg, value_hash) for arg, (_, value_hash) in kwargs.items()),
+            hashes["db"] if spec["connection"] else None,
+        ]).encode())
+        return (name, spec, [value for value, _ in args], {arg: value for arg, (value, _) in kwargs.items()},
+                key, sources, cache_dir, use_cache)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            ready = [name for name, spec in pending.items() if all(dep in hashes for dep in _dependencies(spec))]
+            for name in ready:
+                spec = pending.pop(name)
+                if not spec["plots"]:
+                    running[pool.submit(_run_stage, *prepare(name, spec))] = name
+
+            # plotting stages run here, on the main thread, while the pool keeps computing
+            for name in ready:
+                if stages[name]["plots"]:
+                    results[name], hashes[name] = _run_stage(*prepare(name, stages[name]))
+            if any(stages[name]["plots"] for name in ready):
+                continue
+
+            if not running:
+                raise ValueError(f"Stages {list(pending)} can never run (circular dependencies)")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], hashes[name] = future.result()
+
+    return results
@@ -0,0 +1,300 @@
+import os
+import time
+import inspect
+import functools
+import threading
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:  # RSS readings are skipped without psutil; tracemalloc still works
+    psutil = None
+
+# --------------------------
+# Stage profiling
+# @profiled wraps the pipeline stages of analysis.py, database.py and csv_data_wrangling.py.
+# While profiling is off (the default) the wrapper only checks one flag and calls the function.
+# When it is on (FITBIT_PROFILE=1 or enable_profiling()), every call records its wall time,
+# self time, CPU time of its thread, rows in (rows of the DataFrame arguments), rows out (rows of
+# the result) and, for functions with a `query` argument, the SQL text.
+# profile_report() lists the stages sorted by time plus the slowest SQL statements;
+# folded_stacks() writes "outer;inner;stage <microseconds>" lines for flamegraph.pl / speedscope.
+#
+# Memory mode (FITBIT_PROFILE_MEMORY=1 or enable_memory_profiling()) also takes a tracemalloc
+# snapshot and an RSS reading (psutil) before and after every stage call. memory_report() then
+# lists per stage the traced peak above the level at its start, the net growth, the RSS change,
+# the size of the DataFrames it returned (memory_usage(deep=True)) and its top allocating lines.
+# tracemalloc is process-wide, so stages running at the same time blur each other's numbers, and
+# the snapshots make every call much slower: the timings of a memory run are not representative.
+# --------------------------
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "profiles")
+
+_memory = os.environ.get("FITBIT_PROFILE_MEMORY") == "1"
+_enabled = os.environ.get("FITBIT_PROFILE") == "1" or _memory
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}   # stage -> {"calls", "wall", "self", "cpu", "rows_in", "rows_out"}
+_stacks = {}   # "outer;inner" -> self seconds
+_queries = {}  # SQL text -> {"calls", "wall", "rows_out"}
+_memory_stages = {}  # stage -> {"calls", "peak", "net", "rss_delta", "rss_max", "frame_bytes", "lines"}
+_snapshot_filters = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+_process = psutil.Process() if psutil is not None else None
+_source_dir = os.path.dirname(os.path.abspath(__file__))
+
+if _memory:
+    tracemalloc.start()
+
+def enable_profiling(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+def profiling_enabled():
+    return _enabled
+
+def enable_memory_profiling(enabled=True):
+    # memory mode implies the stage timings; it keeps tracemalloc running until switched off
+    global _memory, _enabled
+    _memory = enabled
+    if enabled:
+        _enabled = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    elif tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def memory_profiling_enabled():
+    return _memory
+
+def reset_profile():
+    with _lock:
+        _stages.clear()
+        _stacks.clear()
+        _queries.clear()
+        _memory_stages.clear()
+
+def count_rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(result)
+    if isinstance(result, (list, tuple)):
+        nested = [item for item in result if isinstance(item, (pd.DataFrame, pd.Series, np.ndarray, list, tuple))]
+        return sum(count_rows(item) for item in nested) if nested else len(result)
+    if isinstance(result, dict):
+        return len(result)
+    return 0 if result is None else 1
+
+def frame_bytes(result):
+    # pandas' own estimate (deep=True counts the string objects too) of the frames a stage returns
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, pd.Series):
+        return int(result.memory_usage(deep=True))
+    if isinstance(result, (list, tuple)):
+        return sum(frame_bytes(item) for item in result)
+    if isinstance(result, dict):
+        return sum(frame_bytes(item) for item in result.values())
+    return 0
+
+def _rss():
+    return _process.memory_info().rss if _process is not None else None
+
+def _frame_rows(args, kwargs):
+    return sum(len(value) for value in (*args, *kwargs.values()) if isinstance(value, pd.DataFrame))
+
+def _stack():
+    return _local.__dict__.setdefault("stack", [])
+
+def _start(name, rows_in=0, query=None):
+    stack = _stack()
+    path = f"{stack[-1]['path']};{name}" if stack else name
+    frame = {"name": name, "path": path, "rows_in": rows_in, "rows_out": 0, "query": query,
+             "wall": 0.0, "cpu": 0.0, "child": 0.0}
+    if _memory and tracemalloc.is_tracing():
+        _start_memory(frame, stack[-1] if stack else None)
+    return frame
+
+def _start_memory(frame, parent):
+    frame["snapshot"] = tracemalloc.take_snapshot().filter_traces(_snapshot_filters)
+    frame["rss_start"] = _rss()
+    frame["result_bytes"] = 0
+    frame["child_peak"] = 0
+    current, peak = tracemalloc.get_traced_memory()
+    # reset_peak() below also clears the peak the enclosing stage has reached so far; keep it there
+    if parent is not None and "child_peak" in parent:
+        parent["child_peak"] = max(parent["child_peak"], peak)
+    frame["traced_start"] = current
+    tracemalloc.reset_peak()
+
+def _finish_memory(frame):
+    current, peak = tracemalloc.get_traced_memory()
+    peak = max(peak, frame["child_peak"])
+    stack = _stack()
+    if stack and "child_peak" in stack[-1]:
+        stack[-1]["child_peak"] = max(stack[-1]["child_peak"], peak)
+
+    # tracemalloc keeps one frame per allocation (more frames make every snapshot far slower), so a
+    # line is the one that allocated: often inside pandas, under the merge or query that asked for it
+    differences = tracemalloc.take_snapshot().filter_traces(_snapshot_filters).compare_to(frame["snapshot"], "lineno")
+    lines = {}
+    for difference in differences[:20]:
+        if difference.size_diff > 0:
+            origin = difference.traceback[0]
+            filename = os.path.relpath(origin.filename, _source_dir) if origin.filename.startswith(_source_dir) else origin.filename
+            lines[f"{filename}:{origin.lineno}"] = difference.size_diff
+    rss_end = _rss()
+
+    with _lock:
+        stats = _memory_stages.setdefault(frame["name"], {"calls": 0, "peak": 0, "net": 0, "rss_delta": 0,
+                                                          "rss_max": 0, "frame_bytes": 0, "lines": {}})
+        stats["calls"] += 1
+        stats["peak"] = max(stats["peak"], peak - frame["traced_start"])
+        stats["net"] += current - frame["traced_start"]
+        stats["frame_bytes"] = max(stats["frame_bytes"], frame["result_bytes"])
+        if rss_end is not None:
+            stats["rss_delta"] += rss_end - frame["rss_start"]
+            stats["rss_max"] = max(stats["rss_max"], rss_end)
+        for line, size in lines.items():
+            stats["lines"][line] = stats["lines"].get(line, 0) + size
+
+def _resume(frame):
+    _stack().append(frame)
+    frame["wall_start"] = time.perf_counter()
+    frame["cpu_start"] = time.thread_time()
+
+def _pause(frame):
+    wall = time.perf_counter() - frame["wall_start"]
+    frame["wall"] += wall
+    frame["cpu"] += time.thread_time() - frame["cpu_start"]
+    stack = _stack()
+    stack.pop()
+    if stack:
+        stack[-1]["child"] += wall
+
+def _finish(frame):
+    if "snapshot" in frame:
+        _finish_memory(frame)
+    self_time = frame["wall"] - frame["child"]
+    with _lock:
+        stats = _stages.setdefault(frame["name"], {"calls": 0, "wall": 0.0, "self": 0.0, "cpu": 0.0, "rows_in": 0, "rows_out": 0})
+        stats["calls"] += 1
+        stats["wall"] += frame["wall"]
+        stats["self"] += self_time
+        stats["cpu"] += frame["cpu"]
+        stats["rows_in"] += frame["rows_in"]
+        stats["rows_out"] += frame["rows_out"]
+        _stacks[frame["path"]] = _stacks.get(frame["path"], 0.0) + self_time
+        if frame["query"] is not None:
+            query = _queries.setdefault(" ".join(str(frame["query"]).split()), {"calls": 0, "wall": 0.0, "rows_out": 0})
+            query["calls"] += 1
+            query["wall"] += frame["wall"]
+            query["rows_out"] += frame["rows_out"]
+
+def profiled(func):
+    name = func.__name__
+    parameters = list(inspect.signature(func).parameters)
+    query_position = parameters.index("query") if "query" in parameters else None
+
+    def query_text(args, kwargs):
+        if query_position is None:
+            return None
+        return args[query_position] if len(args) > query_position else kwargs.get("query")
+
+    if inspect.isgeneratorfunction(func):
+        # generators (SQL_acquisition_chunks) are timed while they run, not while the caller
+        # works on a chunk, and count as one call once they are exhausted
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            if not _enabled:
+                return (yield from func(*args, **kwargs))
+            frame = _start(name, _frame_rows(args, kwargs), query_text(args, kwargs))
+            generator = func(*args, **kwargs)
+            try:
+                while True:
+                    _resume(frame)
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        _pause(frame)
+                    frame["rows_out"] += count_rows(item)
+                    if "snapshot" in frame:
+                        frame["result_bytes"] += frame_bytes(item)
+                    yield item
+            finally:
+                _finish(frame)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        frame = _start(name, _frame_rows(args, kwargs), query_text(args, kwargs))
+        _resume(frame)
+        try:
+            result = func(*args, **kwargs)
+            frame["rows_out"] = count_rows(result)
+            if "snapshot" in frame:
+                frame["result_bytes"] = frame_bytes(result)
+            return result
+        finally:
+            _pause(frame)
+            _finish(frame)
+    return wrapper
+
+def profile_report(sort_by="wall", top_queries=10):
+    # sort_by: "wall" (including nested stages), "self" or "cpu"
+    with _lock:
+        stages = sorted(_stages.items(), key=lambda item: item[1][sort_by], reverse=True)
+        queries = sorted(_queries.items(), key=lambda item: item[1]["wall"], reverse=True)[:top_queries]
+
+    lines = [f"{'stage':40s} {'calls':>6s} {'wall s':>9s} {'self s':>9s} {'cpu s':>9s} {'rows in':>11s} {'rows out':>11s}"]
+    for name, stats in stages:
+        lines.append(f"{name:40s} {stats['calls']:>6d} {stats['wall']:>9.3f} {stats['self']:>9.3f} {stats['cpu']:>9.3f} "
+                     f"{stats['rows_in']:>11d} {stats['rows_out']:>11d}")
+    if queries:
+        lines += ["", f"Slowest SQL statements (top {len(queries)}):"]
+        for query, stats in queries:
+            text = query if len(query) <= 150 else query[:147] + "..."
+            lines.append(f"{stats['wall']:>9.3f}s {stats['calls']:>5d} calls {stats['rows_out']:>10d} rows  {text}")
+    return "\n".join(lines)
+
+def memory_report(top_lines=5, top_stages=10):
+    mib = 2 ** 20
+    with _lock:
+        stages = sorted(((name, {**stats, "lines": dict(stats["lines"])}) for name, stats in _memory_stages.items()),
+                        key=lambda item: item[1]["peak"], reverse=True)
+    if not stages:
+        return "No memory profile recorded (enable it with FITBIT_PROFILE_MEMORY=1 or --profile-memory)."
+
+    rss = "n/a (install psutil)" if _process is None else ""
+    lines = [f"{'stage':40s} {'calls':>6s} {'peak MiB':>9s} {'net MiB':>9s} {'RSS +MiB':>9s} {'RSS MiB':>9s} {'frames MiB':>11s} {rss}".rstrip()]
+    for name, stats in stages:
+        lines.append(f"{name:40s} {stats['calls']:>6d} {stats['peak'] / mib:>9.1f} {stats['net'] / mib:>9.1f} "
+                     f"{stats['rss_delta'] / mib:>9.1f} {stats['rss_max'] / mib:>9.1f} {stats['frame_bytes'] / mib:>11.2f}")
+
+    lines += ["", f"Top allocating lines (net growth per stage, top {top_stages} stages by peak):"]
+    for name, stats in stages[:top_stages]:
+        top = sorted(stats["lines"].items(), key=lambda item: item[1], reverse=True)[:top_lines]
+        if top:
+            lines.append(f"{name}:")
+            lines += [f"  {size / mib:>9.2f} MiB  {line}" for line, size in top]
+    return "\n".join(lines)
+
+def folded_stacks():
+    with _lock:
+        return "\n".join(f"{path} {round(seconds * 1e6)}" for path, seconds in sorted(_stacks.items()) if seconds > 0)
+
+def write_profile(output_dir=PROFILE_DIR, sort_by="wall"):
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = os.path.join(output_dir, "profile_report.txt")
+    stacks_path = os.path.join(output_dir, "profile.folded")
+    with open(report_path, "w") as f:
+        f.write(profile_report(sort_by) + "\n")
+    with open(stacks_path, "w") as f:
+        f.write(folded_stacks() + "\n")
+    if _memory:
+        with open(os.path.join(output_dir, "memory_report.txt"), "w") as f:
+            f.write(memory_report() + "\n")
+    return report_path, stacks_path
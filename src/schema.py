@@ -0,0 +1,122 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# --------------------------
+# Typed schema registry for the frames returned by SQL_acquisition.
+# sqlite3 hands back every INTEGER as a Python int and every REAL as a float, so pandas
+# builds int64/float64/object columns by default. The registry lists the compact dtype
+# each known column fits in; apply_schema() converts a result frame to it once, right
+# after the query, so the analysis code never has to cast the same columns again.
+# --------------------------
+
+ID = "Id"  # marker for the shared categorical Id dtype, see id_dtype()
+
+TABLE_SCHEMAS = {
+    "daily_activity": {
+        "Id": ID, "DayNumber": "int32", "TotalSteps": "int32", "TotalDistance": "float64",
+        "TrackerDistance": "float64", "LoggedActivitiesDistance": "float64",
+        "VeryActiveDistance": "float64", "ModeratelyActiveDistance": "float64",
+        "LightActiveDistance": "float64", "SedentaryActiveDistance": "float64",
+        "VeryActiveMinutes": "int16", "FairlyActiveMinutes": "int16",
+        "LightlyActiveMinutes": "int16", "SedentaryMinutes": "int16", "Calories": "int32",
+    },
+    "heart_rate": {"Id": ID, "EpochSeconds": "int64", "DayNumber": "int32", "Value": "int16"},
+    "hourly_calories": {"Id": ID, "EpochSeconds": "int64", "DayNumber": "int32", "Calories": "int16"},
+    "hourly_intensity": {"Id": ID, "EpochSeconds": "int64", "DayNumber": "int32",
+                         "TotalIntensity": "int16", "AverageIntensity": "float64"},
+    "hourly_steps": {"Id": ID, "EpochSeconds": "int64", "DayNumber": "int32", "StepTotal": "int32"},
+    "minute_sleep": {"Id": ID, "EpochSeconds": "int64", "DayNumber": "int32", "value": "int8", "logId": "int64"},
+    "weight_log": {"Id": ID, "EpochSeconds": "int64", "DayNumber": "int32", "WeightKg": "float64",
+                   "WeightPounds": "float64", "Fat": "float64", "BMI": "float64", "LogId": "int64"},
+    # rollup tables maintained by database.refresh_rollups()
+    "daily_heart_rate": {"Id": ID, "DayNumber": "int32", "AvgHeartRate": "float64",
+                         "MinHeartRate": "int16", "MaxHeartRate": "int16", "HeartRateSamples": "int32"},
+    "daily_intensity": {"Id": ID, "DayNumber": "int32", "TotalIntensity": "int32",
+                        "AverageIntensity": "float64", "IntensityHours": "int8"},
+    "daily_sleep_states": {"Id": ID, "DayNumber": "int32", "AsleepMinutes": "int16",
+                           "RestlessMinutes": "int16", "AwakeMinutes": "int16"},
+    "daily_hourly_steps": {"Id": ID, "DayNumber": "int32", "StepTotal": "int32", "StepHours": "int8"},
+    # columns computed by the analysis queries under an alias
+    "derived": {"hour": "int8", "SleepMinutes": "int16", "SleepDuration": "int32",
+                "HeartRate": "float64", "HourlyCalories": "float64", "ActivityDays": "int16"},
+    # ranking table maintained by database.refresh_leaderboards()
+    "leaderboard_ranks": {"Id": ID, "WindowStart": "int32", "WindowEnd": "int32", "Rank": "int32"},
+}
+
+def _merge_schemas(schemas):
+    # one column -> dtype lookup; a column that appears in several tables with different
+    # dtypes (e.g. Calories per day and per hour) gets the wider of the two
+    merged = {}
+    for schema in schemas.values():
+        for column, dtype in schema.items():
+            if column in merged and merged[column] != dtype and ID not in (merged[column], dtype):
+                dtype = np.promote_types(merged[column], dtype).name
+            merged[column] = dtype
+    return merged
+
+COLUMN_DTYPES = _merge_schemas(TABLE_SCHEMAS)
+
+# --------------------------
+# Shared categorical Id
+# Every frame gets the same CategoricalDtype for Id, so merges and groupbys between
+# frames compare the small integer codes instead of falling back to int64/object keys.
+# The categories only grow: an Id not seen before is appended, codes never change.
+# --------------------------
+_id_lock = threading.Lock()
+_id_dtype = pd.CategoricalDtype(pd.Index([], dtype="int64"))
+
+def id_dtype():
+    return _id_dtype
+
+def register_ids(user_ids):
+    global _id_dtype
+    user_ids = pd.Index(pd.unique(np.asarray(user_ids, dtype="int64")))
+    with _id_lock:
+        new_ids = user_ids.difference(_id_dtype.categories)
+        if len(new_ids):
+            _id_dtype = pd.CategoricalDtype(_id_dtype.categories.append(new_ids.sort_values()))
+    return _id_dtype
+
+def register_ids_from_db(connection):
+    # preloads every known Id in one go, so all frames of a run share one dtype from the start;
+    # the per-day rollups hold the same Ids as the raw tables at a fraction of the rows
+    query = "SELECT Id FROM daily_activity UNION SELECT Id FROM daily_heart_rate UNION SELECT Id FROM daily_sleep_states " \
+            "UNION SELECT Id FROM daily_hourly_steps UNION SELECT Id FROM weight_log"
+    register_ids([row[0] for row in connection.execute(query)])
+
+# --------------------------
+# Opt-in float32 mode
+# Halves the memory of every float column; off by default because means and regressions
+# then lose precision in the 7th digit. Enable with FITBIT_FLOAT32=1 or use_float32(True).
+# --------------------------
+_float32 = os.environ.get("FITBIT_FLOAT32", "0") == "1"
+
+def use_float32(enabled=True):
+    global _float32
+    _float32 = enabled
+
+def float32_enabled():
+    return _float32
+
+def _fits(series, dtype):
+    info = np.iinfo(dtype)
+    return series.empty or (series.min() >= info.min and series.max() <= info.max)
+
+def apply_schema(df):
+    for column in df.columns:
+        series = df[column]
+        dtype = COLUMN_DTYPES.get(column)
+
+        if dtype == ID:
+            if pd.api.types.is_integer_dtype(series):
+                df[column] = series.astype(register_ids(series.unique()))
+        elif dtype and dtype.startswith("int"):
+            # columns with NULLs come back as float and are left alone; a value outside the
+            # registered range (e.g. a SUM over many days) keeps the column at int64
+            if pd.api.types.is_integer_dtype(series) and _fits(series, dtype):
+                df[column] = series.astype(dtype)
+        elif _float32 and series.dtype == "float64":
+            df[column] = series.astype("float32")
+    return df
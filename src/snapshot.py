@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+from database import db_fingerprint
+from analysis import merge_and_analyze_data
+from pipeline import function_hash
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # snapshots only speed up the start; without pyarrow the frames are rebuilt from SQLite
+    pa = None
+
+# --------------------------
+# On-disk snapshots of merged_df and user_summaries as uncompressed Arrow (Feather v2) files.
+# Each file stores the fingerprint of the source database, a hash of the code that built it and
+# a hash of its schema, and is only used while all three still match; otherwise the frames are
+# rebuilt from SQLite and written again. The files are left uncompressed so read_table() can
+# memory-map the column buffers instead of decompressing them into fresh memory.
+# --------------------------
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "snapshots")
+# source of merge_and_analyze_data and the src/ functions and constants it uses (merges, SQL, schema registry)
+SNAPSHOT_VERSION = function_hash(merge_and_analyze_data)
+METADATA_KEY = b"fitbit_snapshot"
+
+def schema_hash(df):
+    schema = [(str(col), str(dtype)) for col, dtype in df.dtypes.items()]
+    return hashlib.sha1(json.dumps(schema).encode()).hexdigest()
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.arrow")
+
+def save_snapshot(name, df, fingerprint):
+    if pa is None:
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": list(fingerprint),
+        "schema_hash": schema_hash(df),
+    }).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    # write next to the target and rename, so a reader never sees a half-written file
+    tmp_path = snapshot_path(name) + ".tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, snapshot_path(name))
+
+def read_snapshot_info(name):
+    path = snapshot_path(name)
+    if pa is None or not os.path.exists(path):
+        return None
+    try:
+        # only the schema is read here, the column data stays on disk
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        return json.loads(metadata[METADATA_KEY])
+    except (pa.ArrowInvalid, KeyError, ValueError):
+        return None
+
+def load_snapshot(name, fingerprint):
+    info = read_snapshot_info(name)
+    if info is None or info["version"] != SNAPSHOT_VERSION or info["fingerprint"] != json.loads(json.dumps(list(fingerprint))):
+        return None
+
+    df = feather.read_table(snapshot_path(name), memory_map=True).to_pandas()
+    if schema_hash(df) != info["schema_hash"]:
+        print(f"Snapshot {name} has an unexpected schema, rebuilding it.")
+        return None
+    return df
+
+def load_or_build_merged_data(db_name, connection):
+    fingerprint = db_fingerprint(db_name)
+
+    merged_df = load_snapshot("merged_df", fingerprint)
+    user_summaries = load_snapshot("user_summaries", fingerprint)
+    if merged_df is not None and user_summaries is not None:
+        print(f"Loaded merged data from snapshot ({len(merged_df)} rows).")
+        return merged_df, user_summaries
+
+    merged_df, user_summaries = merge_and_analyze_data(connection)
+    if merged_df is not None:
+        save_snapshot("merged_df", merged_df, fingerprint)
+        save_snapshot("user_summaries", user_summaries, fingerprint)
+    return merged_df, user_summaries
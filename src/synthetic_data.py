@@ -0,0 +1,267 @@
+import os
+import argparse
+import datetime
+import sqlite3 as sql
+import numpy as np
+import pandas as pd
+from database import migrate_db
+
+# --------------------------
+# Synthetic Fitbit data
+# Writes a fitbit_database.db and daily_activity.csv with the same tables, columns and text formats
+# as the shipped 33-user month ("3/12/2016 12:00:00 AM" timestamps, integer Ids, the raw table
+# layout that migrate_db upgrades), for any number of users and days.
+# Every user draws from its own random stream seeded with (seed, user number), so a seed always
+# produces the same files byte for byte. Daily steps add up from the hourly steps, as in
+# verify_total_steps; sleep, heart rate and weight are only recorded for part of the users,
+# like in the real survey.
+# --------------------------
+SYNTHETIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "synthetic")
+
+RAW_TABLES = {
+    "daily_activity": "CREATE TABLE daily_activity (Id INTEGER, ActivityDate TEXT, TotalSteps INTEGER, TotalDistance REAL, TrackerDistance REAL, LoggedActivitiesDistance REAL, VeryActiveDistance REAL, ModeratelyActiveDistance REAL, LightActiveDistance REAL, SedentaryActiveDistance REAL, VeryActiveMinutes INTEGER, FairlyActiveMinutes INTEGER, LightlyActiveMinutes INTEGER, SedentaryMinutes INTEGER, Calories INTEGER)",
+    "heart_rate": "CREATE TABLE heart_rate (Id INTEGER, Time TEXT, Value INTEGER)",
+    "hourly_calories": "CREATE TABLE hourly_calories (Id INTEGER, ActivityHour TEXT, Calories INTEGER)",
+    "hourly_intensity": "CREATE TABLE hourly_intensity (Id INTEGER, ActivityHour TEXT, TotalIntensity INTEGER, AverageIntensity REAL)",
+    "hourly_steps": "CREATE TABLE hourly_steps (Id INTEGER, ActivityHour TEXT, StepTotal INTEGER)",
+    "minute_sleep": "CREATE TABLE minute_sleep (Id INTEGER, date TEXT, value INTEGER, logId INTEGER)",
+    "weight_log": "CREATE TABLE weight_log (Id INTEGER, Date TEXT, WeightKg REAL, WeightPounds REAL, Fat INTEGER, BMI REAL, IsManualReport TEXT, LogId INTEGER)",
+}
+DAILY_COLUMNS = ["Id", "ActivityDate", "TotalSteps", "TotalDistance", "TrackerDistance", "LoggedActivitiesDistance",
+                 "VeryActiveDistance", "ModeratelyActiveDistance", "LightActiveDistance", "SedentaryActiveDistance",
+                 "VeryActiveMinutes", "FairlyActiveMinutes", "LightlyActiveMinutes", "SedentaryMinutes", "Calories"]
+
+# share of the day's steps per hour of the day, before each user's chronotype shift
+STEP_PROFILE = np.array([0.2, 0.1, 0.1, 0.1, 0.2, 0.8, 2.5, 5.0, 6.5, 6.0, 6.0, 6.5,
+                         7.5, 7.0, 6.5, 6.5, 7.0, 8.0, 8.5, 7.0, 5.0, 3.5, 2.0, 0.8])
+STEP_PROFILE = STEP_PROFILE / STEP_PROFILE.sum()
+SLEEP_STATES = np.array([1, 2, 3])  # asleep, restless, awake
+
+def fitbit_date(day):
+    return f"{day.month}/{day.day}/{day.year}"
+
+def fitbit_clock(minute_of_day):
+    hour, minute = divmod(minute_of_day, 60)
+    return f"{hour % 12 or 12}:{minute:02d}", "AM" if hour < 12 else "PM"
+
+def _time_grid(dates, step_seconds):
+    # every timestamp of a regular grid, as an object array indexed by day * steps_per_day + step
+    clocks = [fitbit_clock(second // 60) for second in range(0, 86400, step_seconds)]
+    seconds = [second % 60 for second in range(0, 86400, step_seconds)]
+    return np.array([f"{date} {clock}:{second:02d} {half}"
+                     for date in dates for (clock, half), second in zip(clocks, seconds)], dtype=object)
+
+def _format_times(dates, days, seconds):
+    clocks = [fitbit_clock(minute) for minute in range(1440)]
+    return [f"{dates[day]} {clocks[second // 60][0]}:{second % 60:02d} {clocks[second // 60][1]}"
+            for day, second in zip(days.tolist(), seconds.tolist())]
+
+def synthetic_user_ids(users, seed):
+    # distinct 10-digit Ids like the real ones, sorted the way the shipped tables are
+    rng = np.random.default_rng([seed, users])
+    ids = np.unique(rng.integers(1_000_000_000, 9_999_999_999, size=users * 2))
+    while len(ids) < users:
+        ids = np.unique(np.concatenate([ids, rng.integers(1_000_000_000, 9_999_999_999, size=users)]))
+    return np.sort(rng.permutation(ids)[:users])
+
+def _user_profile(rng):
+    return {
+        "mean_steps": rng.lognormal(np.log(7000), 0.45),
+        "non_wear": rng.beta(1, 12),
+        "stride_km": rng.normal(0.00068, 0.00006),
+        "very_share": rng.beta(2, 8),
+        "fair_share": rng.beta(2, 14),
+        "chronotype": int(rng.integers(-1, 2)),
+        "bmr": rng.normal(1650, 220),
+        "kcal_per_step": rng.normal(0.045, 0.008),
+        "logs_activities": rng.random() < 0.15,
+        "tracks_sleep": rng.random() < 0.7,
+        "sleep_nights": rng.uniform(0.4, 0.95),
+        "bedtime": 22.5 * 60 + rng.normal(0, 45),
+        "sleep_minutes": rng.normal(420, 40),
+        "tracks_heart_rate": rng.random() < 0.45,
+        "resting_hr": rng.normal(66, 7),
+        "logs_weight": rng.random() < 0.25,
+        "weight_days": rng.uniform(0.05, 0.9),
+        "weight_kg": rng.normal(78, 15),
+        "height_m": np.clip(rng.normal(1.72, 0.09), 1.5, 2.0),
+        "manual_weight": rng.random() < 0.5,
+    }
+
+def _sleep_rows(rng, user_id, user_number, profile, dates, worn):
+    # one session per logged night, starting on the evening of its day; returns the rows and the
+    # asleep minutes per day so the daily sedentary minutes leave room for the night
+    days = len(worn)
+    asleep_per_day = np.zeros(days, dtype=np.int64)
+    if not profile["tracks_sleep"]:
+        return [], asleep_per_day
+
+    nights = np.flatnonzero(worn & (rng.random(days) < profile["sleep_nights"]))
+    starts = np.clip(profile["bedtime"] + rng.normal(0, 50, len(nights)), 20 * 60, 26 * 60).astype(np.int64)
+    lengths = np.clip(rng.normal(profile["sleep_minutes"], 50, len(nights)), 120, 720).astype(np.int64)
+    offsets = rng.integers(0, 60, len(nights))
+
+    session = np.repeat(np.arange(len(nights)), lengths)
+    minute = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    absolute = np.repeat(starts, lengths) + minute
+    states = rng.choice(SLEEP_STATES, size=len(session), p=[0.92, 0.065, 0.015])
+    day = nights[session] + absolute // 1440
+    second = (absolute % 1440) * 60 + offsets[session]
+    log_ids = 11_000_000_000 + user_number * 100_000 + nights
+
+    np.add.at(asleep_per_day, nights[session], states == 1)
+    times = _format_times(dates, day, second)
+    return list(zip([user_id] * len(times), times, states.tolist(), log_ids[session].tolist())), asleep_per_day
+
+def _weight_rows(rng, user_id, profile, days, start_day):
+    if not profile["logs_weight"]:
+        return []
+    logged = np.flatnonzero(rng.random(days) < profile["weight_days"])
+    weights = profile["weight_kg"] + np.cumsum(rng.normal(0, 0.15, days))[logged]
+    fat = np.where(rng.random(len(logged)) < 0.05, np.round(rng.normal(22, 5, len(logged))), np.nan)
+    # manual entries are stamped at the end of the day, synced ones in the morning
+    seconds = (np.full(len(logged), 86399) if profile["manual_weight"]
+               else rng.integers(6 * 3600, 9 * 3600, len(logged)))
+
+    rows = []
+    for day, weight, fat_value, second in zip(logged.tolist(), weights.tolist(), fat.tolist(), seconds.tolist()):
+        moment = datetime.datetime.combine(start_day + datetime.timedelta(days=day), datetime.time()) + datetime.timedelta(seconds=second)
+        clock, half = fitbit_clock(second // 60)
+        rows.append((user_id, f"{fitbit_date(moment)} {clock}:{second % 60:02d} {half}", weight, weight * 2.20462262185,
+                     None if np.isnan(fat_value) else int(fat_value), weight / profile["height_m"] ** 2,
+                     str(profile["manual_weight"]), int(moment.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)))
+    return rows
+
+def synthesize_user(user_id, user_number, seed, dates, start_day, hour_stamps, heart_rate_stamps, heart_rate_interval):
+    rng = np.random.default_rng([seed, user_number])
+    profile = _user_profile(rng)
+    days = len(dates) - 1  # dates has one extra day for nights that end after the last day
+
+    # steps: a gamma spread around the user's level, zero on days the tracker was not worn,
+    # spread over the hours of the day so the hourly table adds up to the daily total
+    worn = rng.random(days) >= profile["non_wear"]
+    steps = np.where(worn, np.minimum(rng.gamma(3.0, profile["mean_steps"] / 3.0, days), 40000), 0).astype(np.int64)
+    hourly_steps = rng.multinomial(steps, np.roll(STEP_PROFILE, profile["chronotype"]))
+
+    very_share = np.clip(profile["very_share"] * rng.lognormal(0, 0.5, days), 0, 0.8)
+    fair_share = np.clip(profile["fair_share"] * rng.lognormal(0, 0.5, days), 0, 0.9 - very_share)
+    tracker_distance = np.round(steps * max(profile["stride_km"], 0.0004), 2)
+    logged_distance = np.where(profile["logs_activities"] & (rng.random(days) < 0.3) & worn,
+                               np.round(rng.uniform(1, 7, days), 6), 0.0)
+    very_minutes = np.round(steps * very_share / 130).astype(np.int64)
+    fair_minutes = np.round(steps * fair_share / 100).astype(np.int64)
+    light_minutes = np.minimum(np.round(steps * (1 - very_share - fair_share) / 25), 600).astype(np.int64)
+
+    sleep_rows, asleep_per_day = _sleep_rows(rng, user_id, user_number, profile, dates, worn)
+    sedentary_minutes = np.where(worn, np.maximum(1440 - very_minutes - fair_minutes - light_minutes - asleep_per_day, 0), 1440)
+    active_calories = steps * profile["kcal_per_step"] + very_minutes * 4
+    calories = np.round(profile["bmr"] + active_calories + rng.normal(0, 80, days)).astype(np.int64)
+
+    daily = pd.DataFrame({
+        "Id": user_id,
+        "ActivityDate": dates[:days],
+        "TotalSteps": steps,
+        "TotalDistance": np.round(tracker_distance + logged_distance, 2),
+        "TrackerDistance": tracker_distance,
+        "LoggedActivitiesDistance": logged_distance,
+        "VeryActiveDistance": np.round(tracker_distance * very_share, 2),
+        "ModeratelyActiveDistance": np.round(tracker_distance * fair_share, 2),
+        "LightActiveDistance": np.round(tracker_distance * (1 - very_share - fair_share), 2),
+        "SedentaryActiveDistance": np.where(worn & (rng.random(days) < 0.1), 0.01, 0.0),
+        "VeryActiveMinutes": very_minutes,
+        "FairlyActiveMinutes": fair_minutes,
+        "LightlyActiveMinutes": light_minutes,
+        "SedentaryMinutes": sedentary_minutes,
+        "Calories": calories,
+    }, columns=DAILY_COLUMNS)
+
+    # hourly tables share one timestamp grid; intensity follows the hour's steps (0-180 per hour)
+    step_share = hourly_steps / np.maximum(steps, 1)[:, None]
+    hourly_calories = np.round(profile["bmr"] / 24 + active_calories[:, None] * step_share + rng.normal(0, 3, (days, 24))).astype(np.int64)
+    hourly_intensity = np.minimum(np.round(hourly_steps / 22 + rng.poisson(1.5, (days, 24)) * (hourly_steps > 0)), 180).astype(np.int64)
+    stamps = hour_stamps[:days * 24].tolist()
+    ids = [user_id] * len(stamps)
+    tables = {
+        "hourly_steps": list(zip(ids, stamps, hourly_steps.ravel().tolist())),
+        "hourly_calories": list(zip(ids, stamps, np.maximum(hourly_calories, 0).ravel().tolist())),
+        "hourly_intensity": list(zip(ids, stamps, hourly_intensity.ravel().tolist(),
+                                     np.round(hourly_intensity.ravel() / 60, 6).tolist())),
+        "minute_sleep": sleep_rows,
+        "weight_log": _weight_rows(rng, user_id, profile, days, start_day),
+        "heart_rate": [],
+    }
+
+    if profile["tracks_heart_rate"]:
+        # one reading per heart_rate_interval seconds on worn days, with hours the tracker was off
+        per_hour = 3600 // heart_rate_interval
+        worn_hours = (worn[:, None] & (rng.random((days, 24)) >= 0.08)).ravel()
+        hour_index = np.repeat(np.flatnonzero(worn_hours), per_hour)
+        sample_index = hour_index * per_hour + np.tile(np.arange(per_hour), worn_hours.sum())
+        values = (profile["resting_hr"] + hourly_intensity.ravel()[hour_index] * 0.45
+                  + rng.normal(0, 4, len(sample_index)))
+        values = np.clip(np.round(values), 38, 200).astype(np.int64)
+        tables["heart_rate"] = list(zip([user_id] * len(values), heart_rate_stamps[sample_index].tolist(), values.tolist()))
+
+    return daily, tables
+
+def generate_fitbit_data(output_dir=SYNTHETIC_DIR, users=33, days=31, heart_rate_interval=60, seed=0,
+                         start_date="2016-03-12", migrate=False):
+    if 3600 % heart_rate_interval:
+        raise ValueError("heart_rate_interval must divide an hour (e.g. 5, 10, 15, 30, 60, 300 seconds)")
+
+    os.makedirs(output_dir, exist_ok=True)
+    db_path = os.path.join(output_dir, "fitbit_database.db")
+    csv_path = os.path.join(output_dir, "daily_activity.csv")
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm", csv_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    start_day = datetime.date.fromisoformat(start_date)
+    dates = [fitbit_date(start_day + datetime.timedelta(days=day)) for day in range(days + 1)]
+    hour_stamps = _time_grid(dates[:days], 3600)
+    heart_rate_stamps = _time_grid(dates[:days], heart_rate_interval)
+    row_counts = dict.fromkeys(RAW_TABLES, 0)
+
+    connection = sql.connect(db_path)
+    # a fresh file that is rebuilt on failure needs no journal
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    try:
+        for statement in RAW_TABLES.values():
+            connection.execute(statement)
+
+        for user_number, user_id in enumerate(synthetic_user_ids(users, seed).tolist()):
+            daily, tables = synthesize_user(user_id, user_number, seed, dates, start_day,
+                                            hour_stamps, heart_rate_stamps, heart_rate_interval)
+            tables["daily_activity"] = list(daily.itertuples(index=False, name=None))
+            daily.to_csv(csv_path, mode="a", header=user_number == 0, index=False)
+
+            with connection:
+                for table, rows in tables.items():
+                    if rows:
+                        placeholders = ", ".join("?" * len(rows[0]))
+                        connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+                    row_counts[table] += len(rows)
+    finally:
+        connection.close()
+
+    if migrate:
+        migrate_db(db_path)
+    return {"db": db_path, "csv": csv_path, "rows": row_counts}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic Fitbit database and daily_activity.csv")
+    parser.add_argument("--users", type=int, default=33, help="number of users")
+    parser.add_argument("--days", type=int, default=31, help="number of days per user")
+    parser.add_argument("--heart-rate-interval", type=int, default=60, help="seconds between heart rate readings (the real trackers record about every 5)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed; the same seed writes the same files")
+    parser.add_argument("--start-date", default="2016-03-12", help="first day (YYYY-MM-DD)")
+    parser.add_argument("--output-dir", default=SYNTHETIC_DIR, help="directory for fitbit_database.db and daily_activity.csv")
+    parser.add_argument("--migrate", action="store_true", help="apply the schema migrations right away")
+    args = parser.parse_args()
+
+    result = generate_fitbit_data(args.output_dir, args.users, args.days, args.heart_rate_interval,
+                                  args.seed, args.start_date, args.migrate)
+    print(f"Wrote {result['db']} and {result['csv']}")
+    for table, count in result["rows"].items():
+        print(f"  {table}: {count} rows")
@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 import statsmodels.api as sm
 import seaborn as sns
 import numpy as np
+import pandas as pd
 import traceback 
 
 def ensure_columns(df, required_columns):
@@ -11,6 +12,13 @@ def ensure_columns(df, required_columns):
         print(f"Missing columns: {missing_columns}")
     return df
 
+def drop_unused_categories(df, column):
+    # the shared categorical Id lists every user of the database; seaborn draws a slot for every
+    # category, so a frame that only holds some users is reduced to the ones it contains
+    if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype):
+        df = df.assign(**{column: df[column].cat.remove_unused_categories()})
+    return df
+
 def plot_distance_distribution(df):
     if df.empty: 
         print('No data available.')
@@ -67,7 +75,7 @@ def plot_workout(df):
     plt.show()
 
 def plot_LRM(df, user_id):
-    user = df[df['Id'] == str(user_id)]
+    user = df[df['Id'].astype(str) == str(user_id)]
     
     if user.empty:
         print(f'No data available for User {user_id}.')
@@ -130,7 +138,7 @@ def plot_residuals(model):
     plt.show()
         
 #task 5
-def plot_activity_by_time_blocks(avg_steps, avg_calories, avg_sleep, labels):
+def plot_activity_by_time_blocks(avg_steps, avg_calories, avg_sleep, labels, block_hours=4):
     if not (avg_steps and avg_calories and avg_sleep):
         print("No data available for time block plots.")
         return
@@ -144,7 +152,7 @@ def plot_activity_by_time_blocks(avg_steps, avg_calories, avg_sleep, labels):
     axs[0].bar(x, avg_steps, bar_width, color='r', label='Steps')
     axs[0].set_xlabel('Time Block')
     axs[0].set_ylabel('Steps')
-    axs[0].set_title('Average Steps per 4-Hour Block')
+    axs[0].set_title(f'Average Steps per {block_hours}-Hour Block')
     axs[0].set_xticks(x)
     axs[0].set_xticklabels(labels)
     axs[0].legend()
@@ -153,7 +161,7 @@ def plot_activity_by_time_blocks(avg_steps, avg_calories, avg_sleep, labels):
     axs[1].bar(x, avg_calories, bar_width, color='b', label='Calories')
     axs[1].set_xlabel('Time Block')
     axs[1].set_ylabel('Calories')
-    axs[1].set_title('Average Calories per 4-Hour Block')
+    axs[1].set_title(f'Average Calories per {block_hours}-Hour Block')
     axs[1].set_xticks(x)
     axs[1].set_xticklabels(labels)
     axs[1].legend()
@@ -162,7 +170,7 @@ def plot_activity_by_time_blocks(avg_steps, avg_calories, avg_sleep, labels):
     axs[2].bar(x, avg_sleep, bar_width, color='g', label='Sleep (mins)')
     axs[2].set_xlabel('Time Block')
     axs[2].set_ylabel('Minutes')
-    axs[2].set_title('Average Sleep per 4-Hour Block')
+    axs[2].set_title(f'Average Sleep per {block_hours}-Hour Block')
     axs[2].set_xticks(x)
     axs[2].set_xticklabels(labels)
     axs[2].legend()
@@ -220,6 +228,7 @@ def plot_weather_and_daily_activity(df_final_activity, df_final_distance, df_fin
     plt.show()
     
 def plot_grouped_data(df_grouped, metric='TotalSteps', group_by='Id'):
+    df_grouped = drop_unused_categories(df_grouped, group_by)
     plt.figure(figsize=(12, 6))
     sns.barplot(x=group_by, y=metric, hue=group_by, data=df_grouped, palette='viridis', legend=False)
     plt.xticks(rotation=45)
@@ -238,6 +247,7 @@ def plot_statistical_summary(df_summary, group_by='Id'):
         print("No valid metrics to plot. Skipping visualization.")
         return
 
+    df_summary = drop_unused_categories(df_summary, group_by)
     plt.figure(figsize=(10, 5))
     for metric in valid_metrics:
         sns.lineplot(x=df_summary[group_by], y=df_summary[metric], label=metric)
@@ -0,0 +1,25 @@
+import os
+import sys
+import shutil
+import pytest
+
+# the modules in src/ import each other as top-level modules, like when they are run from src/
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SOURCE_DIR)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from synthetic_data import generate_fitbit_data
+
+USERS = 4
+DAYS = 10
+
+@pytest.fixture(scope="session")
+def raw_dataset(tmp_path_factory):
+    # a small synthetic database that was never migrated; tests copy it before writing to it
+    return generate_fitbit_data(tmp_path_factory.mktemp("raw"), users=USERS, days=DAYS, heart_rate_interval=900, seed=1)
+
+@pytest.fixture
+def raw_db(raw_dataset, tmp_path):
+    path = os.path.join(tmp_path, "fitbit_database.db")
+    shutil.copyfile(raw_dataset["db"], path)
+    return path
@@ -0,0 +1,71 @@
+import sqlite3
+import tracemalloc
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from analysis import SQL_acquisition, SQL_acquisition_chunks, get_heart_rate_and_intensity_batch, heart_rate_and_intensity_from_batch, analyze_weight_log
+from database import migrate_db
+
+ROWS = 200_000
+CHUNK_SIZE = 5_000
+
+def large_table():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE heart_rate (Id INTEGER, EpochSeconds INTEGER, Value INTEGER)")
+    connection.executemany("INSERT INTO heart_rate VALUES (?, ?, ?)",
+                           ((1503960366 + i % 7, 1457740800 + i, 60 + i % 50) for i in range(ROWS)))
+    return connection
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def test_chunks_hold_one_chunk_at_a_time():
+    connection = large_table()
+    query = "SELECT Id, EpochSeconds, Value FROM heart_rate"
+    rows = []
+
+    def stream():
+        for chunk in SQL_acquisition_chunks(connection, query, chunk_size=CHUNK_SIZE):
+            assert len(chunk) <= CHUNK_SIZE
+            rows.append(len(chunk))
+
+    streamed = peak_memory(stream)
+    loaded = peak_memory(lambda: SQL_acquisition(connection, query))
+    assert sum(rows) == ROWS
+    # the peak follows the chunk size, not the table size
+    assert streamed < loaded / 10
+
+def test_batch_matches_the_table(raw_db):
+    migrate_db(raw_db)
+    connection = sqlite3.connect(raw_db)
+    try:
+        batch = get_heart_rate_and_intensity_batch(connection, chunk_size=50)
+        user_id = connection.execute("SELECT MIN(Id) FROM heart_rate").fetchone()[0]
+        expected = pd.read_sql("SELECT EpochSeconds, Value FROM heart_rate WHERE Id = ? ORDER BY EpochSeconds",
+                               connection, params=(user_id,))
+    finally:
+        connection.close()
+
+    heart_rate, _ = heart_rate_and_intensity_from_batch(batch, user_id)
+    assert np.array_equal(heart_rate['Value'].to_numpy(), expected['Value'].to_numpy())
+    assert np.array_equal(heart_rate['Time'].to_numpy(), pd.to_datetime(expected['EpochSeconds'], unit='s').to_numpy())
+
+def test_weight_boxplot_has_one_slot_per_weighed_user(raw_db):
+    migrate_db(raw_db)
+    connection = sqlite3.connect(raw_db)
+    try:
+        users = connection.execute("SELECT COUNT(DISTINCT Id) FROM daily_activity").fetchone()[0]
+        weight_df = analyze_weight_log(connection)
+    finally:
+        connection.close()
+
+    # the shared Id categories hold every user, the plot only the ones with weight logs
+    weighed = weight_df['Id'].nunique()
+    assert 0 < weighed < users
+    assert len(plt.gca().get_xticks()) == weighed
+    plt.close('all')
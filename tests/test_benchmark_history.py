@@ -0,0 +1,56 @@
+import pytest
+import benchmark_history
+from benchmark_history import record_report, compare_revisions, _match_revision, _short
+
+MACHINE = "bench-host"
+
+def report(wall_seconds, peak_memory_bytes=2**20):
+    return {
+        "created": "2016-03-12T00:00:00",
+        "machine": {"host": MACHINE},
+        "settings": {"repeat": 1},
+        "results": [{"function": "analysis.aggregate_data", "users": 33, "days": 31, "wall_seconds": wall_seconds,
+                     "min_seconds": wall_seconds, "peak_memory_bytes": peak_memory_bytes,
+                     "rows_in": 100, "rows_out": 10, "runs": [wall_seconds]}],
+    }
+
+def record(history_db, monkeypatch, revision, wall_seconds):
+    monkeypatch.setattr(benchmark_history, "git_revision", lambda: (revision, revision.endswith("+dirty")))
+    record_report(report(wall_seconds), history_db)
+
+@pytest.fixture
+def history_db(tmp_path):
+    return str(tmp_path / "history.db")
+
+def test_dirty_run_is_compared_against_its_clean_revision(history_db, monkeypatch):
+    record(history_db, monkeypatch, "abc123", 1.0)
+    record(history_db, monkeypatch, "abc123+dirty", 3.0)
+
+    regressions = compare_revisions(history_db, machine=MACHINE)
+    assert [(regression["function"], regression["regressed"]) for regression in regressions] == [
+        ("analysis.aggregate_data", ["time"])]
+    assert regressions[0]["time_change"] == pytest.approx(2.0)
+
+def test_runs_of_one_revision_are_not_mixed_with_its_dirty_runs(history_db, monkeypatch):
+    record(history_db, monkeypatch, "abc123", 1.0)
+    record(history_db, monkeypatch, "abc123+dirty", 3.0)
+    record(history_db, monkeypatch, "def456", 1.05)
+
+    assert compare_revisions(history_db, baseline="abc", candidate="def", machine=MACHINE) == []
+    assert len(compare_revisions(history_db, baseline="abc+dirty", candidate="abc", machine=MACHINE)) == 0
+    assert len(compare_revisions(history_db, baseline="abc", candidate="abc+dirty", machine=MACHINE)) == 1
+
+def test_compare_needs_two_revisions(history_db, monkeypatch):
+    record(history_db, monkeypatch, "abc123", 1.0)
+    assert compare_revisions(history_db, machine=MACHINE) == []
+
+def test_match_revision():
+    revisions = ["abc123", "abc123+dirty", "abd999"]
+    assert _match_revision(revisions, "abc") == "abc123"
+    assert _match_revision(revisions, "abc+dirty") == "abc123+dirty"
+    assert _match_revision(revisions, "ab") is None
+    assert _match_revision(revisions, "fff") is None
+
+def test_short_keeps_one_dirty_suffix():
+    assert _short("0123456789abcdef+dirty") == "0123456789ab+dirty"
+    assert _short("0123456789abcdef") == "0123456789ab"
@@ -0,0 +1,24 @@
+import pytest
+from database import migrate_db
+
+pytest.importorskip("streamlit")
+from dashboard_data import load_merged_data
+from dashboard_visualization import show_sleep_plot
+
+@pytest.fixture
+def migrated_db(raw_db):
+    migrate_db(raw_db)
+    return raw_db
+
+def test_merged_data_is_shared_between_reruns(migrated_db):
+    # every rerun gets the cached frames themselves, not an unpickled copy
+    merged_df, user_summaries = load_merged_data(migrated_db)
+    assert load_merged_data(migrated_db)[0] is merged_df
+    assert load_merged_data(migrated_db)[1] is user_summaries
+
+def test_charts_leave_the_shared_frame_unchanged(migrated_db):
+    merged_df, _ = load_merged_data(migrated_db)
+    before = merged_df.copy(deep=True)
+    show_sleep_plot(merged_df)
+    assert merged_df.dtypes.equals(before.dtypes)
+    assert merged_df.equals(before)
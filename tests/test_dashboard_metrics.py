@@ -0,0 +1,23 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dashboard_metrics import record_timing, write_prometheus_metrics
+
+def test_concurrent_writes_leave_one_complete_file(tmp_path):
+    path = str(tmp_path / "dashboard.prom")
+    record_timing("page", "Home", 0.01)
+
+    # Streamlit sessions are threads of one process and write the file after every rerun
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for future in [pool.submit(write_prometheus_metrics, path) for _ in range(400)]:
+            future.result()
+
+    assert os.listdir(tmp_path) == ["dashboard.prom"]
+    with open(path) as f:
+        assert f.read().endswith("\n")
+
+def test_failed_write_is_reported(tmp_path, capsys):
+    # the parent "directory" is a file, so the metrics cannot be written
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    write_prometheus_metrics(str(blocker / "dashboard.prom"))
+    assert "Could not write the dashboard metrics" in capsys.readouterr().out
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import shutil
+import pandas as pd
+import pytest
+from conftest import DAYS
+from database import migrate_db, pooled_connection, get_schema_version, windows_containing, SCHEMA_VERSION, LEADERBOARD_METRICS, TIMESTAMP_COLUMNS, PLAN_QUERIES, LEGACY_PLAN_QUERIES
+
+FIRST_DAY = 16872  # 2016-03-12, the default start date of synthetic_data.py
+LAST_DAY = FIRST_DAY + DAYS - 1
+
+def query(db, sql, params=()):
+    connection = sqlite3.connect(db)
+    try:
+        return connection.execute(sql, params).fetchall()
+    finally:
+        connection.close()
+
+def execute(db, *statements):
+    connection = sqlite3.connect(db)
+    try:
+        with connection:
+            for sql, params in statements:
+                connection.execute(sql, params)
+    finally:
+        connection.close()
+
+# --------------------------
+# Migrations
+# --------------------------
+def test_migrate_db_applies_every_migration_once(raw_db):
+    assert migrate_db(raw_db) == SCHEMA_VERSION
+    assert query(raw_db, "PRAGMA user_version")[0][0] == SCHEMA_VERSION
+    assert query(raw_db, "PRAGMA journal_mode")[0][0] == "wal"
+    for table in TIMESTAMP_COLUMNS:
+        assert query(raw_db, f"SELECT COUNT(*) FROM {table} WHERE EpochSeconds IS NULL")[0][0] == 0
+
+    # a second run finds nothing to do
+    indexes = query(raw_db, "SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name")
+    assert migrate_db(raw_db) == SCHEMA_VERSION
+    assert query(raw_db, "SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name") == indexes
+
+def test_migration_explains_the_plans_before_and_after(raw_db, capsys):
+    migrate_db(raw_db, show_plans=True)
+    report = capsys.readouterr().out
+    assert "error:" not in report
+    assert "before: SCAN heart_rate" in report
+    assert "after:  SEARCH heart_rate USING COVERING INDEX" in report
+    assert set(LEGACY_PLAN_QUERIES) == set(PLAN_QUERIES)
+
+def test_migration_resumes_after_columns_were_added(raw_db):
+    # ALTER TABLE commits on its own: a failed migration 2 can leave some epoch columns behind
+    execute(raw_db, ("ALTER TABLE heart_rate ADD COLUMN EpochSeconds INTEGER", ()), ("PRAGMA user_version = 1", ()))
+    assert migrate_db(raw_db) == SCHEMA_VERSION
+    assert query(raw_db, "SELECT COUNT(*) FROM heart_rate WHERE DayNumber IS NULL")[0][0] == 0
+
+# --------------------------
+# Daily rollups
+# --------------------------
+def heart_rate_rollup_from_source(db):
+    return query(db, """
+        SELECT Id, DayNumber, AVG(Value), MIN(Value), MAX(Value), COUNT(*)
+        FROM heart_rate GROUP BY Id, DayNumber ORDER BY Id, DayNumber
+    """)
+
+def test_rollups_match_the_source_tables(raw_db):
+    migrate_db(raw_db)
+    assert query(raw_db, "SELECT * FROM daily_heart_rate ORDER BY Id, DayNumber") == heart_rate_rollup_from_source(raw_db)
+
+def test_rollups_refresh_only_new_days(raw_db):
+    migrate_db(raw_db)
+    user_id = query(raw_db, "SELECT MIN(Id) FROM heart_rate")[0][0]
+    before = query(raw_db, "SELECT * FROM daily_heart_rate WHERE DayNumber <= ? ORDER BY Id, DayNumber", (LAST_DAY,))
+
+    # new raw rows for the day after the data, as a later import would append them
+    execute(raw_db, *[("INSERT INTO heart_rate (Id, Time, Value) VALUES (?, ?, ?)", (user_id, f"3/22/2016 {clock}", value))
+                      for clock, value in (("1:00:00 AM", 60), ("1:15:00 AM", 70), ("11:45:00 PM", 80))])
+    migrate_db(raw_db)
+
+    assert query(raw_db, "SELECT * FROM daily_heart_rate WHERE DayNumber = ?", (LAST_DAY + 1,)) == [
+        (user_id, LAST_DAY + 1, 70.0, 60, 80, 3)]
+    assert query(raw_db, "SELECT * FROM daily_heart_rate WHERE DayNumber <= ? ORDER BY Id, DayNumber", (LAST_DAY,)) == before
+    assert query(raw_db, "SELECT COUNT(*) FROM changed_days")[0][0] == 0
+
+# --------------------------
+# Leaderboards
+# --------------------------
+def test_windows_containing():
+    assert windows_containing("rolling7", 100) == [(start, start + 6) for start in range(94, 101)]
+    assert windows_containing("week", FIRST_DAY) == [(16867, 16873)]  # Monday 2016-03-07 to Sunday 2016-03-13
+    assert windows_containing("month", FIRST_DAY) == [(16861, 16891)]  # March 2016
+
+def test_rolling_windows_lie_within_the_data(raw_db):
+    migrate_db(raw_db)
+    windows = query(raw_db, """
+        SELECT DISTINCT WindowStart, WindowEnd FROM leaderboard_ranks
+        WHERE WindowType = 'rolling7' ORDER BY WindowStart
+    """)
+    assert windows == [(start, start + 6) for start in range(FIRST_DAY, LAST_DAY - 5)]
+    # ten days of data hold no complete 30-day window
+    assert query(raw_db, "SELECT COUNT(*) FROM leaderboard_ranks WHERE WindowType = 'rolling30'")[0][0] == 0
+
+@pytest.mark.parametrize("window", ["week", "rolling7"])
+def test_leaderboard_ranks_match_the_daily_totals(raw_db, window):
+    migrate_db(raw_db)
+    connection = sqlite3.connect(raw_db)
+    try:
+        ranks = pd.read_sql("SELECT * FROM leaderboard_ranks WHERE WindowType = ? AND Metric = 'TotalSteps'",
+                            connection, params=(window,))
+        daily = pd.read_sql("SELECT Id, DayNumber, TotalSteps FROM daily_activity", connection)
+    finally:
+        connection.close()
+
+    assert not ranks.empty
+    for (start, end), ranking in ranks.groupby(["WindowStart", "WindowEnd"]):
+        totals = daily[daily["DayNumber"].between(start, end)].groupby("Id")["TotalSteps"].sum()
+        expected = totals.rank(method="min", ascending=False).astype(int)
+        assert dict(zip(ranking["Id"], ranking["Value"])) == totals.astype(float).to_dict()
+        assert dict(zip(ranking["Id"], ranking["Rank"])) == expected.to_dict()
+
+def test_new_day_adds_a_rolling_window(raw_db):
+    migrate_db(raw_db)
+    columns = [row[1] for row in query(raw_db, "PRAGMA table_info(daily_activity)")
+               if row[1] not in ("EpochSeconds", "DayNumber")]
+    # every user gets one more day, a copy of the last one
+    execute(raw_db, (f"""
+        INSERT INTO daily_activity ({", ".join(columns)})
+        SELECT {", ".join("'3/22/2016'" if column == "ActivityDate" else column for column in columns)}
+        FROM daily_activity WHERE DayNumber = ?
+    """, (LAST_DAY,)))
+    migrate_db(raw_db)
+
+    newest = query(raw_db, "SELECT MAX(WindowStart), MAX(WindowEnd) FROM leaderboard_ranks WHERE WindowType = 'rolling7'")
+    assert newest == [(LAST_DAY - 5, LAST_DAY + 1)]
+    metrics = query(raw_db, """
+        SELECT COUNT(DISTINCT Metric) FROM leaderboard_ranks WHERE WindowType = 'rolling7' AND WindowStart = ?
+    """, (LAST_DAY - 5,))
+    assert metrics == [(len(LEADERBOARD_METRICS),)]
+
+def test_schema_version_of_a_raw_database(raw_db):
+    connection = sqlite3.connect(raw_db)
+    try:
+        assert get_schema_version(connection) == 0
+    finally:
+        connection.close()
+
+# --------------------------
+# Connection pool
+# --------------------------
+def test_pool_drops_connections_to_a_replaced_file(raw_db, tmp_path):
+    with pooled_connection(raw_db) as connection:
+        rows = connection.execute("SELECT COUNT(*) FROM daily_activity").fetchone()[0]
+    old_connection = connection
+
+    # a new database is copied over the old one, as synthetic_data.py or a manual copy would do
+    replacement = str(tmp_path / "replacement.db")
+    shutil.copyfile(raw_db, replacement)
+    execute(replacement, ("DELETE FROM daily_activity WHERE rowid % 2 = 0", ()))
+    os.replace(replacement, raw_db)
+
+    with pooled_connection(raw_db) as connection:
+        assert connection is not old_connection
+        assert connection.execute("SELECT COUNT(*) FROM daily_activity").fetchone()[0] == rows - rows // 2
+    with pytest.raises(sqlite3.ProgrammingError):
+        old_connection.execute("SELECT 1")
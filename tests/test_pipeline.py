@@ -0,0 +1,90 @@
+import sys
+import textwrap
+import importlib
+import linecache
+import pandas as pd
+import pytest
+import analysis
+import pipeline
+from pipeline import stage, ref, run_pipeline, function_hash
+
+calls = []
+
+def double(values):
+    calls.append("double")
+    return values * 2
+
+def total(values):
+    calls.append("total")
+    return int(values.sum())
+
+STAGES = {
+    "doubled": stage(double, ref("values")),
+    "total": stage(total, ref("doubled")),
+}
+
+def test_second_run_loads_every_stage_from_the_cache(tmp_path, capsys):
+    calls.clear()
+    sources = {"values": pd.Series([1, 2, 3])}
+    first = run_pipeline(STAGES, sources, cache_dir=str(tmp_path), workers=2)
+    second = run_pipeline(STAGES, sources, cache_dir=str(tmp_path), workers=2)
+
+    assert first["total"] == second["total"] == 12
+    assert calls == ["double", "total"]
+    assert "[pipeline] total: cached" in capsys.readouterr().out
+
+def test_changed_input_reruns_the_stages(tmp_path):
+    calls.clear()
+    run_pipeline(STAGES, {"values": pd.Series([1, 2, 3])}, cache_dir=str(tmp_path))
+    results = run_pipeline(STAGES, {"values": pd.Series([1, 2, 4])}, cache_dir=str(tmp_path))
+    assert results["total"] == 14
+    assert calls == ["double", "total", "double", "total"]
+
+def test_unknown_dependency_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        run_pipeline({"total": stage(total, ref("missing"))}, {}, cache_dir=str(tmp_path))
+
+def write_module(folder, name, source):
+    (folder / f"{name}.py").write_text(textwrap.dedent(source))
+    linecache.checkcache()
+    if name in sys.modules:
+        return importlib.reload(sys.modules[name])
+    return importlib.import_module(name)
+
+HELPERS = textwrap.dedent("""
+    LIMIT = 10
+
+    def helper(values):
+        return values[:LIMIT]
+
+    def unrelated():
+        return 1
+""")
+
+def test_function_hash_follows_the_referenced_functions(tmp_path, monkeypatch):
+    # stand-in src/ folder with a helper module and a stage module that uses one of its functions
+    monkeypatch.setattr(pipeline, "SOURCE_DIR", str(tmp_path))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    write_module(tmp_path, "pipeline_helpers", HELPERS)
+    stages = write_module(tmp_path, "pipeline_stages", """
+        import pipeline_helpers
+
+        def first(values):
+            return pipeline_helpers.helper(values)
+    """)
+    before = function_hash(stages.first)
+
+    # an edit to a function that is not used, or a comment at the end of the file, keeps the key
+    write_module(tmp_path, "pipeline_helpers", HELPERS.replace("return 1", "return 2") + "# a comment\n")
+    assert function_hash(stages.first) == before
+
+    # an edit to the helper or the constant it reads changes it
+    write_module(tmp_path, "pipeline_helpers", HELPERS.replace("LIMIT = 10", "LIMIT = 20"))
+    assert function_hash(stages.first) != before
+    write_module(tmp_path, "pipeline_helpers", HELPERS.replace("values[:LIMIT]", "values[-LIMIT:]"))
+    assert function_hash(stages.first) != before
+
+def test_function_hash_follows_decorated_helpers_across_modules():
+    references = pipeline._references(analysis.merge_and_analyze_data, {})
+    assert {"analysis.SQL_acquisition", "schema.apply_schema", "schema.COLUMN_DTYPES"} <= references.keys()
+    assert not any(key.startswith("visualization.") for key in references)
@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+import snapshot
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path))
+
+def test_snapshot_round_trip():
+    df = pd.DataFrame({"Id": [1, 2], "TotalSteps": [1000.0, 2500.0], "ActivityDate": pd.to_datetime(["2016-03-12", "2016-03-13"])})
+    snapshot.save_snapshot("merged_df", df, (1, 2.0))
+    pd.testing.assert_frame_equal(snapshot.load_snapshot("merged_df", (1, 2.0)), df)
+
+def test_snapshot_of_another_database_is_not_loaded():
+    snapshot.save_snapshot("merged_df", pd.DataFrame({"Id": [1]}), (1, 2.0))
+    assert snapshot.load_snapshot("merged_df", (1, 3.0)) is None
+    assert snapshot.load_snapshot("user_summaries", (1, 2.0)) is None
+
+def test_snapshot_of_older_merge_code_is_not_loaded(monkeypatch):
+    snapshot.save_snapshot("merged_df", pd.DataFrame({"Id": [1]}), (1, 2.0))
+    monkeypatch.setattr(snapshot, "SNAPSHOT_VERSION", "other")
+    assert snapshot.load_snapshot("merged_df", (1, 2.0)) is None